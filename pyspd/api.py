@@ -13,6 +13,17 @@ from iso import ISO
 from participants import Station, Node, ReserveZone, Branch
 from participants import InterruptibleLoad, Company
 from model import LPSolver
+from backends import CoinBackend, HighsBackend, ScipyBackend
+from batch import BatchDispatch
+from islands import IslandDispatch
+from cache import SolveCache
+from snapshot import Snapshot, save_snapshot
+from archive import OfferArchive, write_archive
+from bidding import BiddingGame
+from multiperiod import MultiPeriodSolver
+from loader import MarketLoader
+from scenario import ScenarioSweep
+from instrument import Tracer, LogSink, MemorySink, JsonLinesSink
 
 if __name__ == '__main__':
     pass
@@ -0,0 +1,348 @@
+"""
+Archive
+-------
+
+An on disk archive of the offers and demand of many trading periods, read
+back a period at a time without parsing.
+
+The offers of every period are held in column files (one raw binary file
+per column) of rows grouped by period and, within a period, by unit in
+band order. Units, bands and nodes are stored as integer codes into the
+name lists of the archive. A pointer array per kind of row holds the first
+row of each period, so that a period is found by bisection of the trading
+period labels and read as a slice of each memory mapped column: building
+the offers of a period costs time in proportion to its bands, however long
+the history.
+
+Directory Layout
+----------------
+meta.pickle : names of the units, bands and nodes, the dtypes of the
+              columns and which reserve units are interruptible load
+periods.npy : the trading period labels, strictly increasing
+<kind>_ptr.npy : first row of each period, with a final entry equal to the
+                 number of rows
+<kind>.<column> : raw column files
+
+energy : unit, band, price, offer
+reserve : unit, band, price, offer, prop (0 for interruptible load)
+demand : node, demand
+cleared : unit, offers (0 for energy, 1 for reserve)
+
+A unit given an empty list of offers in a period has no rows of offers, so
+it is held as a cleared row instead. It is read back with empty offers, so
+apply_period clears its offers rather than restoring those of the base ISO.
+
+Labels may be anything numpy sorts, integers or datetime64 for example,
+so that periods may be selected by date range with between.
+
+Usage
+-----
+>>> loader = MarketLoader(SO, energy="energy.csv", reserve="reserve.csv",
+...                       demand="demand.csv")
+>>> write_archive('offers', loader.periods())
+
+>>> archive = OfferArchive('offers')
+>>> archive.apply(SO, label)
+>>> results = BatchDispatch(SO, backend='highs').run(
+...     archive.between(start, end))
+
+The periods produced take the form used by batch.BatchDispatch, with the
+offers of each unit held as arrays.
+"""
+import os
+import pickle
+
+import numpy as np
+
+from batch import apply_period
+
+
+META = 'meta.pickle'
+
+COLUMNS = {'energy': (('unit', np.int32), ('band', np.int32),
+                      ('price', np.float64), ('offer', np.float64)),
+           'reserve': (('unit', np.int32), ('band', np.int32),
+                       ('price', np.float64), ('offer', np.float64),
+                       ('prop', np.float64)),
+           'demand': (('node', np.int32), ('demand', np.float64)),
+           'cleared': (('unit', np.int32), ('offers', np.int8))}
+
+# Period keys of the offers of each kind of unit and the archive rows they
+# are held in
+OFFER_KEYS = (('energy_offers', 'energy'),
+              ('reserve_offers', 'reserve'),
+              ('il_offers', 'reserve'))
+
+OFFER_FIELDS = (('bands', 'band'), ('prices', 'price'), ('offers', 'offer'),
+                ('props', 'prop'))
+
+# Kinds of offer rows by the code of a cleared row
+CLEARED = ('energy', 'reserve')
+
+
+class ArchiveWriter:
+    """
+    ArchiveWriter
+    -------------
+    Appends periods, in the format of batch.BatchDispatch, to a new archive
+    in directory. Periods must be added in strictly increasing order of
+    their labels (the period key), close writes the index.
+    """
+
+    def __init__(self, directory):
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        self.directory = directory
+        self.labels = []
+        self.rows = dict((kind, [0]) for kind in COLUMNS)
+        self.names = {'unit': [], 'band': [], 'node': []}
+        self.codes = {'unit': {}, 'band': {}, 'node': {}}
+        self.intload = set()
+        self.files = dict(((kind, column), open(self._path(kind, column),
+                                                'wb'))
+                          for kind, columns in COLUMNS.items()
+                          for column, dtype in columns)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def add(self, period):
+        """ Append the offers and demand of a period """
+        label = period.get('period', len(self.labels))
+        if self.labels and not label > self.labels[-1]:
+            raise ValueError("Periods must be added in order, %s follows %s"
+                             % (label, self.labels[-1]))
+        self.labels.append(label)
+
+        columns = {'energy': [], 'reserve': []}
+        cleared = []
+        for key, kind in OFFER_KEYS:
+            for name, offers in period.get(key, {}).items():
+                if key == 'il_offers':
+                    self.intload.add(name)
+                unit = self._unit(name, offers)
+                if len(unit[0]):
+                    columns[kind].append(unit)
+                else:
+                    cleared.append((name, CLEARED.index(kind)))
+        for kind, units in columns.items():
+            self._write(kind, [np.concatenate(c) for c in zip(*units)]
+                        if units else None)
+        self._write('cleared', [self._code('unit', [n for n, c in cleared]),
+                                [c for n, c in cleared]])
+
+        demand = period.get('demand', {})
+        self._write('demand', [self._code('node', demand.keys()),
+                               list(demand.values())])
+
+    def close(self):
+        """ Write the index and names of the archive """
+        if self.files is None:
+            return
+        for f in self.files.values():
+            f.close()
+        self.files = None
+        np.save(os.path.join(self.directory, 'periods.npy'),
+                np.asarray(self.labels))
+        for kind, rows in self.rows.items():
+            np.save(os.path.join(self.directory, kind + '_ptr.npy'),
+                    np.asarray(rows, dtype=np.int64))
+        meta = {'names': self.names,
+                'intload': sorted(self.intload),
+                'columns': COLUMNS}
+        with open(os.path.join(self.directory, META), 'wb') as f:
+            pickle.dump(meta, f, pickle.HIGHEST_PROTOCOL)
+
+    def _unit(self, name, offers):
+        """ Columns of the rows of a unit's offers """
+        if not isinstance(offers, dict):
+            offers = dict((plural, [o.get(single, 0.) for o in offers])
+                          for plural, single in OFFER_FIELDS)
+        count = len(offers['bands'])
+        return (np.repeat(self._code('unit', [name]), count),
+                self._code('band', offers['bands']),
+                np.asarray(offers['prices'], dtype=float),
+                np.asarray(offers['offers'], dtype=float),
+                np.asarray(offers.get('props', np.zeros(count)),
+                           dtype=float))
+
+    def _code(self, kind, names):
+        """ Codes of names, adding those not seen before """
+        codes = self.codes[kind]
+        listed = self.names[kind]
+        result = []
+        for name in names:
+            if name not in codes:
+                codes[name] = len(listed)
+                listed.append(name)
+            result.append(codes[name])
+        return np.asarray(result, dtype=np.int32)
+
+    def _write(self, kind, values):
+        """ Append the columns of a period's rows """
+        count = 0
+        if values is not None:
+            for (column, dtype), value in zip(COLUMNS[kind], values):
+                np.asarray(value, dtype=dtype).tofile(
+                    self.files[kind, column])
+            count = len(values[0])
+        self.rows[kind].append(self.rows[kind][-1] + count)
+
+    def _path(self, kind, column):
+        return os.path.join(self.directory, '%s.%s' % (kind, column))
+
+
+def write_archive(directory, periods):
+    """ Write a sequence of periods to a new archive, returning the number
+        of periods written
+    """
+    with ArchiveWriter(directory) as writer:
+        for period in periods:
+            writer.add(period)
+    return len(writer.labels)
+
+
+class OfferArchive:
+    """
+    OfferArchive
+    ------------
+    Reads the periods of an archive written by ArchiveWriter, with the
+    column files memory mapped.
+
+    labels : the trading period labels, in order
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        with open(os.path.join(directory, META), 'rb') as f:
+            meta = pickle.load(f)
+        self.names = meta['names']
+        self.intload = set(meta['intload'])
+        self.labels = np.load(os.path.join(directory, 'periods.npy'))
+        self.ptr = dict((kind, np.load(os.path.join(directory,
+                                                    kind + '_ptr.npy')))
+                        for kind in meta['columns'])
+        self.columns = dict(
+            ((kind, column), _map(os.path.join(directory, '%s.%s' %
+                                               (kind, column)), dtype))
+            for kind, columns in meta['columns'].items()
+            for column, dtype in columns)
+        self._bands = np.asarray(self.names['band'], dtype=object)
+
+    def __len__(self):
+        return len(self.labels)
+
+    def __iter__(self):
+        return self.periods()
+
+    def __getitem__(self, label):
+        """ The period of a trading period label """
+        return self.period(self.index(label))
+
+    def index(self, label):
+        """ Position of a trading period label """
+        k = np.searchsorted(self.labels, label)
+        if k == len(self.labels) or self.labels[k] != label:
+            raise KeyError(label)
+        return int(k)
+
+    def period(self, k):
+        """ The offers and demand of the k-th period """
+        label = self.labels[k]
+        # Numbers are given back as python numbers, dates as datetime64
+        if label.dtype.kind in 'biuf':
+            label = label.item()
+        period = {'period': label}
+        energy = self._rows('energy', k)
+        period['energy_offers'] = self._offers(energy, OFFER_FIELDS[:3])
+
+        reserve = self._offers(self._rows('reserve', k), OFFER_FIELDS)
+        period['reserve_offers'] = {}
+        period['il_offers'] = {}
+        for name, offers in reserve.items():
+            if name in self.intload:
+                del offers['props']
+                period['il_offers'][name] = offers
+            else:
+                period['reserve_offers'][name] = offers
+
+        # Archives written before cleared rows have none
+        if 'cleared' in self.ptr:
+            cleared = self._rows('cleared', k)
+            for unit, code in zip(cleared['unit'], cleared['offers']):
+                name = self.names['unit'][unit]
+                if CLEARED[code] == 'energy':
+                    period['energy_offers'][name] = _empty(OFFER_FIELDS[:3])
+                elif name in self.intload:
+                    period['il_offers'][name] = _empty(OFFER_FIELDS[:3])
+                else:
+                    period['reserve_offers'][name] = _empty(OFFER_FIELDS)
+
+        demand = self._rows('demand', k)
+        nodes = [self.names['node'][n] for n in demand['node']]
+        period['demand'] = dict(zip(nodes, demand['demand'].tolist()))
+        return period
+
+    def periods(self, begin=0, end=None):
+        """ Generate the periods from position begin up to end """
+        for k in range(begin, len(self) if end is None else end):
+            yield self.period(k)
+
+    def between(self, start, end):
+        """ Generate the periods with labels from start up to but not
+            including end, e.g. a range of dates
+        """
+        begin, end = np.searchsorted(self.labels, [start, end])
+        return self.periods(begin, end)
+
+    def apply(self, ISO, label):
+        """ Replace the offers and demand of the ISO with those of the
+            trading period label and recompile them
+        """
+        apply_period(ISO, self[label])
+
+    def _rows(self, kind, k):
+        """ Columns of the rows of a kind in the k-th period """
+        ptr = self.ptr[kind]
+        begin, end = ptr[k], ptr[k + 1]
+        return dict((column, self.columns[kind, column][begin:end])
+                    for column, dtype in COLUMNS[kind])
+
+    def _offers(self, rows, fields):
+        """ Offer arrays of each unit, rows of a unit being contiguous """
+        units = rows['unit']
+        starts = np.flatnonzero(np.diff(units)) + 1
+        bounds = zip(np.concatenate([[0], starts]),
+                     np.concatenate([starts, [len(units)]]))
+        offers = {}
+        for begin, end in bounds:
+            if begin == end:
+                continue
+            unit = {}
+            for plural, single in fields:
+                values = rows[single][begin:end]
+                if single == 'band':
+                    values = self._bands[values].tolist()
+                unit[plural] = values
+            offers[self.names['unit'][units[begin]]] = unit
+        return offers
+
+
+def _empty(fields):
+    """ Offer arrays of a unit without offers """
+    return dict((plural, [] if single == 'band' else np.zeros(0))
+                for plural, single in fields)
+
+
+def _map(path, dtype):
+    """ Memory map a raw column file, an empty file can not be mapped """
+    if os.path.getsize(path) == 0:
+        return np.zeros(0, dtype=dtype)
+    return np.memmap(path, dtype=dtype, mode='r')
+
+
+if __name__ == '__main__':
+    pass
@@ -0,0 +1,350 @@
+"""
+Backends
+--------
+
+Solver backends used by LPSolver to solve the dispatch linear program.
+
+The default CoinBackend solves the pulp problem with the COIN_CMD solver,
+which writes the model to file, runs the CBC binary in a subprocess and
+parses the solution file back. The in-process backends instead take a
+MatrixModel directly in memory and return the primal and dual vectors,
+avoiding the process spawn and file round trips entirely.
+
+Dual values follow the CBC convention for a minimisation, the sensitivity
+of the objective function to the right hand side of the constraint, so
+prices are identical whichever backend is used.
+
+Each backend times its phases as spans of its tracer attribute (set by
+LPSolver to the tracer of the ISO): loading the model into the solver, the
+solve itself and reading the solution back. COIN_CMD performs all three in
+one call, its span instead counts the time spent within CBC itself.
+
+settings gives the configuration of a backend which may change its
+solution (its options or method), part of the key of a cached solve.
+clear_basis makes the next solve of an in process backend start cold,
+without reloading the model.
+"""
+import os
+import re
+import tempfile
+import time
+
+import numpy as np
+import scipy.sparse as sp
+import pulp as lp
+
+from instrument import Tracer
+
+try:
+    import highspy
+except ImportError:
+    highspy = None
+
+try:
+    from scipy.optimize import linprog
+except ImportError:
+    linprog = None
+
+
+class SolverResult:
+    """
+    SolverResult
+    ------------
+    The solution of a MatrixModel.
+
+    status : pulp status code, 1 is optimal (see pulp.LpStatus)
+    x : primal values, one per column of the model
+    duals : dual values, one per row of the model
+    objective : objective function value
+    iterations : simplex iterations, where reported by the solver
+    warm : whether the solve was warm started from a previous basis
+
+    x and duals always have the shape of the model, NaN where a solver
+    reports no solution for a non optimal status.
+    """
+
+    def __init__(self, status, x, duals, objective, iterations=None,
+                 warm=False):
+        self.status = status
+        self.x = x
+        self.duals = duals
+        self.objective = objective
+        self.iterations = iterations
+        self.warm = warm
+
+
+class CoinBackend:
+    """
+    CoinBackend
+    -----------
+    Solves a pulp LpProblem with the COIN_CMD solver in a subprocess.
+
+    When traced the CBC log is captured and the time CBC reports for the
+    solve is separated from the time spent writing the model, starting the
+    process and reading the solution (io_time).
+    """
+
+    in_process = False
+    tracer = Tracer()
+
+    def settings(self):
+        """ Configuration changing the solution, none for COIN_CMD """
+        return ()
+
+    def solve(self, prob):
+        """ Solve the pulp problem in place and return its status """
+        if not self.tracer.enabled:
+            prob.solve(lp.COIN_CMD())
+            return prob.status
+
+        handle, log = tempfile.mkstemp(suffix='.log')
+        os.close(handle)
+        try:
+            with self.tracer.span('cbc') as span:
+                begin = time.time()
+                prob.solve(lp.COIN_CMD(msg=False, logPath=log))
+                elapsed = time.time() - begin
+                with open(log) as f:
+                    counters = _cbc_counters(f.read())
+                if 'solver_time' in counters:
+                    counters['io_time'] = elapsed - counters['solver_time']
+                span.set(rows=len(prob.constraints),
+                         columns=prob.numVariables(), **counters)
+        finally:
+            os.remove(log)
+        return prob.status
+
+
+def _cbc_counters(log):
+    """ Iterations and solve time reported in a CBC log """
+    counters = {}
+    match = re.search(r"(\d+) iterations time ([\d.]+)", log)
+    if match:
+        counters['iterations'] = int(match.group(1))
+        counters['solver_time'] = float(match.group(2))
+    else:
+        match = re.search(r"Wallclock seconds\):\s*([\d.]+)", log)
+        if match:
+            counters['solver_time'] = float(match.group(1))
+    return counters
+
+
+class HighsBackend:
+    """
+    HighsBackend
+    ------------
+    Solves a MatrixModel in process using the HiGHS solver through the
+    highspy bindings. The constraint matrix is passed to HiGHS row wise
+    without copying it into another modelling layer.
+
+    The HiGHS instance persists between solves. When the same MatrixModel
+    is solved again only the costs, bounds, coefficients and rows recorded
+    as changed or added are passed to HiGHS, which then warm starts from the
+    basis of the previous solve.
+
+    options : dictionary of HiGHS options, e.g. {'time_limit': 10}
+    """
+
+    in_process = True
+    tracer = Tracer()
+
+    status_map = {}
+    if highspy is not None:
+        status_map = {highspy.HighsModelStatus.kOptimal: 1,
+                      highspy.HighsModelStatus.kInfeasible: -1,
+                      highspy.HighsModelStatus.kUnbounded: -2,
+                      highspy.HighsModelStatus.kUnboundedOrInfeasible: -3}
+
+    def __init__(self, options=None):
+        if highspy is None:
+            raise ImportError("HighsBackend requires the highspy package")
+        self.options = options or {}
+
+        self.highs = highspy.Highs()
+        self.highs.setOptionValue('output_flag', False)
+        for option, value in self.options.items():
+            self.highs.setOptionValue(option, value)
+        self.model = None
+
+    def settings(self):
+        """ The HiGHS options, in order """
+        return tuple(sorted(self.options.items()))
+
+    def clear_basis(self):
+        """ Start the next solve cold, keeping the loaded model """
+        self.highs.clearSolver()
+
+    def solve(self, model):
+        """ Solve the MatrixModel and return a SolverResult """
+        span = self.tracer.span
+        warm = model is self.model
+        with span('load', warm=warm) as s:
+            if warm:
+                self._apply_changes(model, model.pop_changes())
+            else:
+                model.clear_changes()
+                self.highs.passModel(self._highs_lp(model))
+                self.model = model
+            s.set(rows=model.shape[0], columns=model.shape[1],
+                  nonzeros=model.nnz)
+
+        with span('run'):
+            self.highs.run()
+
+        with span('read') as s:
+            result = self._result(self.highs, warm)
+            s.set(iterations=result.iterations)
+        return result
+
+    def _apply_changes(self, model, changes):
+        """ Pass the changed data of a previously loaded model to HiGHS """
+        highs = self.highs
+
+        added = changes['added']
+        if len(added):
+            A = model.A[added]
+            highs.addRows(len(added), model.row_lower[added],
+                          model.row_upper[added], A.nnz, A.indptr[:-1],
+                          A.indices, A.data)
+
+        cols = changes['cost']
+        if len(cols):
+            highs.changeColsCost(len(cols), cols, model.cost[cols])
+
+        rows = changes['rows']
+        if len(rows):
+            highs.changeRowsBounds(len(rows), rows, model.row_lower[rows],
+                                   model.row_upper[rows])
+
+        cols = changes['bounds']
+        if len(cols):
+            highs.changeColsBounds(len(cols), cols, model.col_lower[cols],
+                                   model.col_upper[cols])
+
+        entries = changes['entries']
+        for row, entry in zip(model.entry_rows(entries), entries):
+            highs.changeCoeff(int(row), int(model.A.indices[entry]),
+                              float(model.A.data[entry]))
+
+    def _highs_lp(self, model):
+        """ Create the HighsLp from a MatrixModel """
+        nrows, ncols = model.shape
+
+        hlp = highspy.HighsLp()
+        hlp.num_col_ = ncols
+        hlp.num_row_ = nrows
+        hlp.col_cost_ = model.cost
+        hlp.col_lower_ = model.col_lower
+        hlp.col_upper_ = model.col_upper
+        hlp.row_lower_ = model.row_lower
+        hlp.row_upper_ = model.row_upper
+
+        hlp.a_matrix_.format_ = highspy.MatrixFormat.kRowwise
+        hlp.a_matrix_.num_col_ = ncols
+        hlp.a_matrix_.num_row_ = nrows
+        hlp.a_matrix_.start_ = model.A.indptr
+        hlp.a_matrix_.index_ = model.A.indices
+        hlp.a_matrix_.value_ = model.A.data
+        return hlp
+
+    def _result(self, highs, warm):
+        """ Convert the HiGHS solution into a SolverResult """
+        status = self.status_map.get(highs.getModelStatus(), 0)
+        solution = highs.getSolution()
+        info = highs.getInfo()
+        return SolverResult(status, np.array(solution.col_value),
+                            np.array(solution.row_dual),
+                            info.objective_function_value,
+                            iterations=info.simplex_iteration_count,
+                            warm=warm)
+
+
+class ScipyBackend:
+    """
+    ScipyBackend
+    ------------
+    Solves a MatrixModel in process using scipy.optimize.linprog with the
+    HiGHS methods bundled with scipy. Rows are split into equality, upper
+    and lower bounded blocks as required by linprog and the duals
+    reassembled into a single vector in row order.
+
+    method : one of 'highs', 'highs-ds' or 'highs-ipm'
+    """
+
+    in_process = True
+    tracer = Tracer()
+
+    status_map = {0: 1, 2: -1, 3: -2}
+
+    def __init__(self, method='highs'):
+        if linprog is None:
+            raise ImportError("ScipyBackend requires scipy")
+        self.method = method
+
+    def settings(self):
+        """ The linprog method """
+        return (self.method,)
+
+    def clear_basis(self):
+        """ Every linprog solve is cold """
+
+    def solve(self, model):
+        """ Solve the MatrixModel and return a SolverResult """
+        span = self.tracer.span
+        A = model.A
+        lower = model.row_lower
+        upper = model.row_upper
+
+        with span('load') as s:
+            eq = lower == upper
+            ub = ~eq & np.isfinite(upper)
+            lb = ~eq & np.isfinite(lower)
+            nub = ub.sum()
+
+            A_ub = None
+            b_ub = None
+            if ub.any() or lb.any():
+                A_ub = sp.vstack([A[ub], -A[lb]]).tocsr()
+                b_ub = np.concatenate([upper[ub], -lower[lb]])
+            s.set(rows=model.shape[0], columns=model.shape[1],
+                  nonzeros=model.nnz)
+
+        with span('run') as s:
+            res = linprog(model.cost, A_ub=A_ub, b_ub=b_ub,
+                          A_eq=A[eq] if eq.any() else None,
+                          b_eq=lower[eq] if eq.any() else None,
+                          bounds=np.column_stack([model.col_lower,
+                                                  model.col_upper]),
+                          method=self.method)
+            s.set(iterations=getattr(res, 'nit', None))
+
+        with span('read'):
+            status = self.status_map.get(res.status, 0)
+            if status != 1:
+                # linprog gives no solution vectors for a failed solve
+                return SolverResult(status, np.full(model.shape[1], np.nan),
+                                    np.full(model.shape[0], np.nan), res.fun)
+            duals = np.zeros(model.shape[0])
+            if eq.any():
+                duals[eq] = res.eqlin.marginals
+            if A_ub is not None:
+                duals[ub] += res.ineqlin.marginals[:nub]
+                duals[lb] -= res.ineqlin.marginals[nub:]
+
+        return SolverResult(status, res.x, duals, res.fun)
+
+
+backends = {'coin': CoinBackend,
+            'highs': HighsBackend,
+            'scipy': ScipyBackend}
+
+
+def get_backend(backend):
+    """ Return a backend instance from either an instance or its name """
+    if isinstance(backend, str):
+        return backends[backend]()
+    return backend
+
+
+if __name__ == '__main__':
+    pass
@@ -0,0 +1,262 @@
+"""
+Batch
+-----
+
+Dispatch many trading periods on the same network, fanning the solves out
+across a pool of worker processes.
+
+Each worker receives its own copy of the base ISO once, when the pool is
+started. For every period it replaces the offers and demand named by the
+period, recompiles only those units and nodes and solves it with a
+persistent LPSolver, so that consecutive periods within a worker reuse the
+compiled model structure.
+The dispatch is taken straight from the solver's result arrays, without
+being passed to the participant objects of the worker ISO, and only plain
+dictionaries of prices, dispatch and timings are sent back.
+
+Period Format
+-------------
+Each period is a dictionary with any of the following keys:
+
+    period : label for the period, defaults to its position in the sequence
+    demand : {node name: demand}
+    energy_offers : {station name: tuple of energy offer dicts}
+    reserve_offers : {station name: tuple of reserve offer dicts}
+    il_offers : {interruptible load name: tuple of offer dicts}
+
+The offers of a unit are either a tuple of offer dictionaries, taking the
+same form as for Station.add_multiple_energy_offers etc., or a dictionary of
+the arrays accepted by those methods (bands, prices, offers and, for
+station reserve, props). A unit named in an offer mapping has those offers
+replaced for the period, all other units and nodes keep the offers and
+demand of the base ISO.
+
+Periods are applied with apply_period, which first restores the units and
+nodes named by the previous period applied to the ISO, but not by this
+one, to their base offers and demand. A period therefore dispatches the
+same whichever periods a worker solved before it.
+"""
+import copy
+import multiprocessing
+import os
+import time
+
+import numpy as np
+
+from model import LPSolver
+
+
+class PeriodResult:
+    """
+    PeriodResult
+    ------------
+    The dispatch of a single trading period, keyed by element name.
+
+    prices : nodal energy prices
+    reserve_prices : reserve zone prices
+    risk : reserve zone risk (reserve dispatched)
+    energy_dispatch : station energy dispatch
+    reserve_dispatch : station and interruptible load reserve dispatch
+    flows : branch flows
+    objective : total cost of the dispatch
+
+    setup_time, solution_time and dispatch_time are those of the LPSolver,
+    worker is the process id of the worker which solved the period.
+    """
+
+    def __init__(self, period, ISO, Solver):
+        result = Solver.result
+        self.period = period
+        self.status = Solver.status
+        self.objective = Solver.objective
+        self.prices = _by_name(result.node_names, result.prices)
+        self.reserve_prices = _by_name(result.zone_names,
+                                       result.reserve_prices)
+        self.risk = _by_name(result.zone_names, result.risk)
+        self.energy_dispatch = _by_name(result.station_names,
+                                        result.energy_dispatch)
+        self.reserve_dispatch = _by_name(result.provider_names,
+                                         result.reserve_dispatch)
+        self.flows = _by_name(result.branch_names, result.flows)
+
+        self.setup_time = Solver.setup_time
+        self.solution_time = Solver.solution_time
+        self.dispatch_time = Solver.dispatch_time
+        self.worker = os.getpid()
+
+
+class BatchDispatch:
+    """
+    BatchDispatch
+    -------------
+    Dispatches a sequence of periods on a base ISO topology.
+
+    ISO : the base ISO, fully defined with nodes, branches, reserve zones,
+          stations and interruptible loads (and optionally base offers)
+    processes : number of worker processes, defaults to the number of CPUs.
+                With a single process the periods are solved in process on
+                a copy of the ISO.
+    chunksize : number of consecutive periods sent to a worker at once
+    build, backend : passed to each worker's LPSolver. The backend must be
+                     given by name so that it can be created in the worker.
+
+    Usage
+    -----
+    >>> batch = BatchDispatch(SO, processes=8, backend='highs')
+    >>> results = batch.run(periods)
+
+    Results are returned in the same order as the periods.
+    """
+
+    def __init__(self, ISO, processes=None, chunksize=1, build='matrix',
+                 backend='coin'):
+        self.ISO = ISO
+        self.processes = processes or multiprocessing.cpu_count()
+        self.chunksize = chunksize
+        self.build = build
+        self.backend = backend
+
+    def run(self, periods):
+        """ Dispatch every period, returning a list of PeriodResults """
+        begin = time.time()
+        if self.processes == 1:
+            _initialise_worker(copy.deepcopy(self.ISO), self.build,
+                               self.backend)
+            self.results = [_solve_period(p) for p in enumerate(periods)]
+        else:
+            pool = multiprocessing.Pool(self.processes,
+                                        initializer=_initialise_worker,
+                                        initargs=(self.ISO, self.build,
+                                                  self.backend))
+            try:
+                self.results = list(pool.imap(_solve_period,
+                                              enumerate(periods),
+                                              self.chunksize))
+            finally:
+                pool.close()
+                pool.join()
+        self.run_time = time.time() - begin
+        return self.results
+
+    def worker_timings(self):
+        """ Total periods and model timings for each worker process """
+        timings = {}
+        for result in self.results:
+            worker = timings.setdefault(result.worker,
+                                        {'periods': 0, 'setup_time': 0.,
+                                         'solution_time': 0.,
+                                         'dispatch_time': 0.})
+            worker['periods'] += 1
+            worker['setup_time'] += result.setup_time
+            worker['solution_time'] += result.solution_time
+            worker['dispatch_time'] += result.dispatch_time
+        return timings
+
+
+# State of each worker process, set up once by _initialise_worker
+_worker = {}
+
+
+def _initialise_worker(ISO, build, backend):
+    """ Keep the worker's copy of the ISO and a persistent solver """
+    _worker['ISO'] = ISO
+    _worker['Solver'] = LPSolver(ISO, build=build, backend=backend,
+                                 push=False)
+
+
+def _solve_period(item):
+    """ Apply a period's offers and demand to the worker ISO and solve """
+    index, period = item
+    ISO = _worker['ISO']
+    Solver = _worker['Solver']
+
+    apply_period(ISO, period)
+    Solver.full_setup_and_solve()
+
+    return PeriodResult(period.get('period', index), ISO, Solver)
+
+
+def _by_name(names, values):
+    """ Dictionary of the values of a result array by element name """
+    return dict(zip(names, values.tolist()))
+
+
+def apply_period(ISO, period):
+    """ Replace the offers and demand of an ISO with those of a period and
+        recompile the offers of the units and nodes which changed.
+
+        Units and nodes named by the previous period applied to the ISO but
+        not by this one are restored to their offers and demand from before
+        any period replaced them (kept in ISO.period_base).
+    """
+    base = ISO.period_base
+    changes = {}
+    for key, units in PERIOD_KEYS:
+        values = period.get(key, {})
+        kept = base.setdefault(key, {})
+        changes[key] = dict((name, kept[name]) for name in
+                            ISO.period_names.get(key, ()) if name not in values)
+        for name in values:
+            if name not in kept:
+                kept[name] = _base_values(key,
+                                          getattr(ISO, units)[name])
+        changes[key].update(values)
+    ISO.period_names = dict((key, set(period.get(key, {}))) for key, units in
+                            PERIOD_KEYS)
+
+    for name, demand in changes['demand'].items():
+        ISO.node_name_map[name].set_demand(demand)
+
+    for name, offers in changes['energy_offers'].items():
+        station = ISO.station_name_map[name]
+        station.clear_energy_offers()
+        _add_offers(station.add_multiple_energy_offers, offers)
+
+    for name, offers in changes['reserve_offers'].items():
+        station = ISO.station_name_map[name]
+        station.clear_reserve_offers()
+        _add_offers(station.add_multiple_reserve_offers, offers)
+
+    for name, offers in changes['il_offers'].items():
+        intload = ISO.reserve_name_map[name]
+        intload.clear_all_offers()
+        _add_offers(intload.add_multiple_offers, offers)
+
+    ISO.create_offers()
+
+
+# Keys of a period and the ISO map of the nodes or units each names
+PERIOD_KEYS = (('demand', 'node_name_map'),
+               ('energy_offers', 'station_name_map'),
+               ('reserve_offers', 'station_name_map'),
+               ('il_offers', 'reserve_name_map'))
+
+
+def _base_values(key, unit):
+    """ The demand of a node or the offers of a unit, in period form """
+    if key == 'demand':
+        return unit.demand
+    bands = unit.energy if key == 'energy_offers' else unit.reserve
+    if bands is None:
+        # Stations without reserve
+        return {'bands': [], 'prices': [], 'offers': []}
+    offers = {'bands': list(bands.labels),
+              'prices': np.array(bands.prices, dtype=float),
+              'offers': np.array(bands.offers, dtype=float)}
+    if key == 'reserve_offers':
+        offers['props'] = np.array(bands.proportions, dtype=float)
+    return offers
+
+
+def _add_offers(add, offers):
+    """ Add offer dictionaries or bulk offer arrays with an add_multiple_*
+        method
+    """
+    if isinstance(offers, dict):
+        add(**offers)
+    else:
+        add(offers)
+
+
+if __name__ == '__main__':
+    pass
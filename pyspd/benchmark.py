@@ -0,0 +1,176 @@
+"""
+Benchmark
+---------
+
+Time the compile, setup, solution and dispatch of synthetic grids (see
+synthetic.create_grid) across a range of sizes and save the results as JSON
+so that scaling regressions may be caught by comparing runs.
+
+Each case runs in a fresh worker process so that the peak memory recorded
+is that of the case alone.
+
+Usage
+-----
+python benchmark.py --nodes 10 100 1000 --backend highs --output bench.json
+
+>>> results = run_benchmarks([{'nodes': 10}, {'nodes': 100}],
+...                          backend='highs', output='bench.json')
+
+Recorded for each case, along with its parameters:
+
+    compile_time : ISO.create_offers
+    setup_time, solution_time, dispatch_time : those of the LPSolver
+    variables, constraints, nonzeros : size of the linear program
+    objective, status : of the solution
+    peak_memory : peak resident memory of the worker process in kB
+    peak_traced : peak memory allocated by Python while running the case in
+                  kB (Python 3 only)
+"""
+from __future__ import print_function
+import argparse
+import json
+import multiprocessing
+import platform
+import time
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+from model import LPSolver
+from synthetic import create_grid
+
+
+# Parameters of synthetic.create_grid and LPSolver with their defaults
+DEFAULTS = {'nodes': 10, 'branch_density': 0.1, 'stations': 20, 'bands': 3,
+            'reserve_zones': 2, 'seed': 0, 'build': 'matrix',
+            'backend': 'coin'}
+
+
+def run_case(case):
+    """ Generate, compile, set up, solve and dispatch a single grid,
+        returning its timings and sizes
+    """
+    params = dict(DEFAULTS)
+    params.update(case)
+    if tracemalloc is not None:
+        tracemalloc.start()
+
+    SO = create_grid(**dict((k, params[k]) for k in
+                            ('nodes', 'branch_density', 'stations', 'bands',
+                             'reserve_zones', 'seed')))
+    begin = time.time()
+    SO.create_offers()
+    compile_time = time.time() - begin
+
+    Solver = LPSolver(SO, build=params['build'], backend=params['backend'])
+    Solver.full_setup_and_solve()
+
+    result = dict(params)
+    result.update(compile_time=compile_time,
+                  setup_time=Solver.setup_time,
+                  solution_time=Solver.solution_time,
+                  dispatch_time=Solver.dispatch_time,
+                  objective=Solver.objective,
+                  status=Solver.status)
+
+    if Solver.build == 'matrix':
+        result['constraints'], result['variables'] = Solver.model.shape
+        result['nonzeros'] = Solver.model.nnz
+    else:
+        result['constraints'] = len(Solver.lp.constraints)
+        result['variables'] = len(Solver.lp.variables())
+        result['nonzeros'] = sum(len(c) for c in
+                                 Solver.lp.constraints.values())
+
+    if tracemalloc is not None:
+        result['peak_traced'] = tracemalloc.get_traced_memory()[1] / 1024.
+        tracemalloc.stop()
+    if resource is not None:
+        result['peak_memory'] = resource.getrusage(
+            resource.RUSAGE_SELF).ru_maxrss
+    return result
+
+
+def run_benchmarks(cases, output=None, repeats=1, **params):
+    """ Run each case (a dictionary of parameters, see DEFAULTS) repeats
+        times, each in a fresh process, keeping the fastest run of each.
+
+        Parameters given as keywords apply to every case. The results are
+        returned and, if an output path is given, written to it as JSON.
+    """
+    runs = []
+    for case in cases:
+        case = dict(params, **case)
+        best = None
+        for _ in range(repeats):
+            pool = multiprocessing.Pool(1)
+            try:
+                result = pool.apply(run_case, (case,))
+            finally:
+                pool.close()
+                pool.join()
+            if best is None or (_total_time(result) < _total_time(best)):
+                best = result
+        runs.append(best)
+
+    results = {'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+               'python': platform.python_version(),
+               'platform': platform.platform(),
+               'repeats': repeats,
+               'cases': runs}
+    if output is not None:
+        with open(output, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+    return results
+
+
+def _total_time(result):
+    """ Total time of a benchmark run """
+    return (result['compile_time'] + result['setup_time'] +
+            result['solution_time'] + result['dispatch_time'])
+
+
+def main(argv=None):
+    """ Run the benchmarks from the command line """
+    parser = argparse.ArgumentParser(description="Benchmark pyspd on "
+                                     "synthetic grids")
+    parser.add_argument('--nodes', type=int, nargs='+', default=[10, 100])
+    parser.add_argument('--stations-per-node', type=float, default=2.)
+    parser.add_argument('--branch-density', type=float, default=0.01)
+    parser.add_argument('--bands', type=int, default=DEFAULTS['bands'])
+    parser.add_argument('--reserve-zones', type=int,
+                        default=DEFAULTS['reserve_zones'])
+    parser.add_argument('--seed', type=int, default=DEFAULTS['seed'])
+    parser.add_argument('--build', default=DEFAULTS['build'])
+    parser.add_argument('--backend', default=DEFAULTS['backend'])
+    parser.add_argument('--repeats', type=int, default=1)
+    parser.add_argument('--output', default='benchmark.json')
+    args = parser.parse_args(argv)
+
+    cases = [{'nodes': n, 'stations': max(1, int(n * args.stations_per_node))}
+             for n in args.nodes]
+    results = run_benchmarks(cases, output=args.output, repeats=args.repeats,
+                             branch_density=args.branch_density,
+                             bands=args.bands,
+                             reserve_zones=args.reserve_zones,
+                             seed=args.seed, build=args.build,
+                             backend=args.backend)
+
+    for case in results['cases']:
+        print("%6d nodes %7d x %7d  setup %8.3f s  solve %8.3f s  "
+              "dispatch %8.3f s" % (case['nodes'], case['constraints'],
+                                    case['variables'], case['setup_time'],
+                                    case['solution_time'],
+                                    case['dispatch_time']))
+    print("Results written to %s" % args.output)
+
+
+if __name__ == '__main__':
+    main()
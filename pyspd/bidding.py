@@ -0,0 +1,200 @@
+"""
+Bidding
+-------
+
+Best response and iterated equilibrium search over the energy offer prices
+of companies.
+
+A bid of a company is a markup, a multiplier of the prices of every energy
+band offered by its stations, chosen from a grid of candidate markups.
+The payoff of a company is its revenue as given by
+Company.calculate_company_revenue: the energy revenue of its stations less
+their costs (Station.cost_func), the reserve revenue of its spinning
+stations and interruptible load and its contract position (as
+Company.calculate_contract_costs), all at the prices of the dispatch.
+
+The ISO is compiled into a MatrixModel once. Every candidate profile of
+markups only scales the band costs of the model, which is re-solved by a
+scenario.ScenarioSweep across its worker processes. The workers are
+started by the first evaluation and kept, each with its loaded model,
+until the game is closed, so a best response sends only the price
+multipliers of its candidates. The dispatch of each profile is kept in a
+cache.SolveCache, so that profiles repeated as the search moves between
+companies are not solved again.
+
+A best response of a company holds the markups of the others fixed and
+takes the candidate with the greatest payoff (the lowest markup among
+equal payoffs), ignoring candidates not solved to optimality. equilibrium plays best responses company by company until
+a round over all of them leaves every markup unchanged, a pure equilibrium
+of the markup grid, or max_iterations rounds have been played.
+
+Usage
+-----
+>>> game = BiddingGame(SO, [CO1, CO2], markups=np.linspace(1, 3, 9))
+>>> profile = game.equilibrium()
+>>> game.converged, game.history[-1]
+>>> game.close()
+"""
+import time
+
+import numpy as np
+
+from scenario import ScenarioSweep
+from cache import SolveCache
+
+
+class BiddingGame:
+    """
+    BiddingGame
+    -----------
+    ISO : a fully defined ISO, compiled on creation
+    companies : the Company objects which bid
+    markups : candidate markups of each company, held in ascending order
+    processes : number of worker processes solving the candidates
+    backend : name of an in process backend, 'highs' or 'scipy'
+    cache_size : number of profiles whose dispatch is cached
+
+    close stops the worker processes of the game.
+
+    profile holds the markup of each company, in the order of companies,
+    history a record of each round of equilibrium: the profile and payoffs
+    after the round, the companies whose markup changed, the candidates
+    solved, the cache hits and the time taken.
+    """
+
+    def __init__(self, ISO, companies, markups=(1., 1.25, 1.5, 2.),
+                 processes=None, backend='highs', cache_size=4096):
+        self.ISO = ISO
+        self.companies = list(companies)
+        self.markups = np.sort(np.asarray(markups, dtype=float))
+        self.sweep = ScenarioSweep(ISO, processes=processes, backend=backend)
+        self.book = book = self.sweep.book
+        self.cache = SolveCache(size=cache_size)
+        self.tracer = ISO.tracer
+        self.profile = np.ones(len(self.companies))
+        self.history = []
+        self.converged = False
+        self.solves = 0
+
+        # The company bidding each energy band, -1 for none
+        owner = np.repeat(-1, len(book.station_names))
+        self._units = []
+        for c, company in enumerate(self.companies):
+            stations = np.array([book.station_index[s.name] for s in
+                                 company.stations], dtype=int)
+            owner[stations] = c
+            providers = np.array([book.provider_index[u.name] for u in
+                                  company.stations + company.intload
+                                  if u.name in book.provider_index],
+                                 dtype=int)
+            nodes = np.array([book.node_index[n.name] for n in
+                              company.contract_nodes], dtype=int)
+            self._units.append((company, stations, providers, nodes))
+        self.band_owner = owner[book.energy_band_station]
+
+    def payoffs(self, profile):
+        """ Payoff of every company under a profile of markups """
+        return self._evaluate([profile])[0]
+
+    def best_response(self, c, profile=None):
+        """ The markup maximising the payoff of company c (an index into
+            companies) against the profile, and the payoff of each
+            candidate markup
+        """
+        profile = self.profile if profile is None else profile
+        candidates = np.repeat(np.asarray(profile, dtype=float)[None, :],
+                               len(self.markups), axis=0)
+        candidates[:, c] = self.markups
+        with self.tracer.span('best_response') as span:
+            payoffs = self._evaluate(candidates)[:, c]
+            span.set(company=self.companies[c].name,
+                     candidates=len(candidates))
+        if np.isnan(payoffs).all():
+            raise ValueError("No candidate markup of %s was solved to "
+                             "optimality" % self.companies[c].name)
+        best = np.nanargmax(payoffs)
+        return self.markups[best], payoffs
+
+    def equilibrium(self, max_iterations=20, tolerance=1e-9):
+        """ Play best responses until no company changes its markup,
+            returning the profile reached
+        """
+        self.history = []
+        self.converged = False
+        span = self.tracer.span
+        with span('equilibrium') as s:
+            for iteration in range(max_iterations):
+                begin = time.time()
+                solves, hits = self.solves, self.cache.hits
+                changed = []
+                for c, company in enumerate(self.companies):
+                    markup, payoffs = self.best_response(c)
+                    if abs(markup - self.profile[c]) > tolerance:
+                        self.profile[c] = markup
+                        changed.append(company.name)
+                self.history.append({
+                    'iteration': iteration,
+                    'profile': self.profile.copy(),
+                    'payoffs': self.payoffs(self.profile),
+                    'changed': changed,
+                    'solves': self.solves - solves,
+                    'cache_hits': self.cache.hits - hits,
+                    'time': time.time() - begin})
+                if not changed:
+                    self.converged = True
+                    break
+            s.set(iterations=len(self.history), converged=self.converged,
+                  solves=self.solves)
+        return self.profile.copy()
+
+    def _evaluate(self, profiles):
+        """ Payoffs of every company under each profile, (profiles,
+            companies), solving the profiles not in the cache
+        """
+        profiles = np.atleast_2d(np.asarray(profiles, dtype=float))
+        keys = [repr(tuple(np.round(p, 12).tolist())) for p in profiles]
+        outcomes = [self.cache.get(k) for k in keys]
+
+        missing = [k for k, o in enumerate(outcomes) if o is None]
+        if missing:
+            multipliers = np.ones((len(missing), len(self.band_owner)))
+            bid = self.band_owner >= 0
+            for row, k in enumerate(missing):
+                multipliers[row, bid] = profiles[k][self.band_owner[bid]]
+            self.sweep.start()
+            result = self.sweep.run(price_multipliers=multipliers)
+            self.solves += len(missing)
+            for row, k in enumerate(missing):
+                outcomes[k] = dict((f, getattr(result, f)[row]) for f in
+                                   ('prices', 'reserve_prices',
+                                    'energy_dispatch', 'reserve_dispatch',
+                                    'status'))
+                self.cache.put(keys[k], outcomes[k])
+
+        return np.array([[self._payoff(u, o) for u in self._units]
+                         for o in outcomes])
+
+    def close(self):
+        """ Stop the worker processes solving the candidates """
+        self.sweep.close()
+
+    def _payoff(self, units, outcome):
+        """ Revenue of a company from the dispatch of a profile """
+        company, stations, providers, nodes = units
+        book = self.book
+        prices = outcome['prices']
+        energy = outcome['energy_dispatch'][stations]
+        revenue = np.dot(energy, prices[book.station_node[stations]])
+        revenue -= sum(s.cost_func(d) for s, d in zip(company.stations,
+                                                      energy))
+        revenue += np.dot(outcome['reserve_dispatch'][providers],
+                          outcome['reserve_prices'][
+                              book.provider_zone[providers]])
+        revenue += sum((company.contract_prices[n.name] - prices[k]) *
+                       company.contract_amount[n.name]
+                       for n, k in zip(company.contract_nodes, nodes))
+        return revenue
+
+
+if __name__ == '__main__':
+    pass
@@ -0,0 +1,132 @@
+"""
+Cache
+-----
+
+Memoise dispatch results by the inputs they were solved from.
+
+Replays of historical periods and bidding studies solve many trading
+periods whose compiled offers, demand and network are exactly the same.
+LPSolver(cache=SolveCache(...)) fingerprints the offer book of the ISO
+(OfferBook.fingerprint) along with the options of the solver which shape
+the result, and returns the cached DispatchResult of an identical earlier
+solve rather than setting up and solving the linear program again.
+
+The cache keeps the size most recently used results in memory. Given a
+directory it also writes each result there as it is stored and reads it
+back on a miss in memory, so that results survive between runs and may be
+shared by the worker processes of a batch.
+
+Counters
+--------
+hits : results returned from memory or disk
+misses : lookups finding no result
+evictions : results dropped from memory to keep it within size
+disk_hits : the hits read back from the directory
+
+Usage
+-----
+>>> cache = SolveCache(size=256, directory='dispatch_cache')
+>>> Solver = LPSolver(SO, backend='highs', cache=cache)
+>>> Solver.full_setup_and_solve()
+>>> cache.stats()
+"""
+from collections import OrderedDict
+import hashlib
+import os
+import pickle
+
+
+class SolveCache:
+    """
+    SolveCache
+    ----------
+    size : the number of results kept in memory
+    directory : optional directory in which results are persisted
+    """
+
+    def __init__(self, size=128, directory=None):
+        self.size = size
+        self.directory = directory
+        if directory is not None and not os.path.isdir(directory):
+            os.makedirs(directory)
+        self._results = OrderedDict()
+        self.clear_stats()
+
+    def __len__(self):
+        return len(self._results)
+
+    def __contains__(self, key):
+        path = self._path(key)
+        return key in self._results or (path is not None and
+                                        os.path.exists(path))
+
+    def get(self, key):
+        """ The result stored under key, or None """
+        if key in self._results:
+            self._results[key] = self._results.pop(key)
+            self.hits += 1
+            return self._results[key]
+
+        path = self._path(key)
+        if path is not None and os.path.exists(path):
+            with open(path, 'rb') as f:
+                result = pickle.load(f)
+            self._keep(key, result)
+            self.hits += 1
+            self.disk_hits += 1
+            return result
+
+        self.misses += 1
+        return None
+
+    def put(self, key, result):
+        """ Store the result under key """
+        self._keep(key, result)
+        path = self._path(key)
+        if path is not None:
+            # Written aside and renamed so that no reader sees part of it
+            partial = '%s.%d' % (path, os.getpid())
+            with open(partial, 'wb') as f:
+                pickle.dump(result, f, pickle.HIGHEST_PROTOCOL)
+            os.rename(partial, path)
+
+    def clear(self):
+        """ Drop the results held in memory, those on disk are kept """
+        self._results.clear()
+
+    def clear_stats(self):
+        """ Reset the counters """
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.disk_hits = 0
+
+    def stats(self):
+        """ The counters along with the number of results in memory """
+        return {'hits': self.hits, 'misses': self.misses,
+                'evictions': self.evictions, 'disk_hits': self.disk_hits,
+                'size': len(self._results)}
+
+    def _keep(self, key, result):
+        """ Hold the result in memory as the most recently used """
+        self._results.pop(key, None)
+        self._results[key] = result
+        while len(self._results) > self.size:
+            self._results.popitem(last=False)
+            self.evictions += 1
+
+    def _path(self, key):
+        if self.directory is None:
+            return None
+        return os.path.join(self.directory, key + '.pickle')
+
+
+def solve_key(book, *options):
+    """ Key of a solve of the offer book with the given solver options """
+    digest = hashlib.sha1(book.fingerprint().encode('utf-8'))
+    digest.update(repr(options).encode('utf-8'))
+    return digest.hexdigest()
+
+
+if __name__ == '__main__':
+    pass
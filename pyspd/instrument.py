@@ -0,0 +1,271 @@
+"""
+Instrument
+----------
+
+Timed spans and counters for each phase of a dispatch, passed to pluggable
+sinks.
+
+A Tracer is held by every ISO (ISO.tracer) and is shared by default with the
+LPSolver, MatrixBuilder and backend acting on it. Each phase is wrapped in a
+span, spans nest, and each carries counters such as the rows, columns and
+non zeros it produced:
+
+    create_offers
+        get_nodal_demand, get_energy_offers, get_reserve_offers,
+        get_network, offer_book  (or recompile_changes)
+    setup_lp
+        one span per constraint family, assemble / update_data, to_pulp
+    solve_lp
+        load, run, read  (in process backends)
+        cbc  (COIN_CMD, with the time spent within CBC itself as counters)
+    return_dispatch
+        gather, log_duals, push_dispatch (one span per step)
+
+When a span closes it is passed to the record method of each sink. A tracer
+without sinks does nothing, so that tracing costs nothing unless asked for.
+
+Sinks
+-----
+LogSink : write each span to a logging.Logger
+MemorySink : keep the spans in memory for later analysis
+JsonLinesSink : append each span as a line of JSON to a file
+
+Usage
+-----
+>>> sink = MemorySink()
+>>> SO.tracer.add_sink(sink)
+>>> SO.create_offers()
+>>> LPSolver(SO, build='matrix').full_setup_and_solve()
+>>> sink.totals()['setup_lp/nodal_dispatch']
+
+With memory=True the net bytes allocated by Python within each span are
+recorded as the 'bytes' counter (Python 3 only, via tracemalloc).
+"""
+from __future__ import print_function
+import json
+import logging
+import time
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+
+class Span(object):
+    """
+    Span
+    ----
+    A single timed phase.
+
+    name : name of the phase
+    path : names of the enclosing spans and this one joined by '/'
+    start : wall clock time the span was entered
+    duration : wall clock seconds spent within the span
+    counters : dictionary of counters, added to with set
+    """
+
+    __slots__ = ('name', 'path', 'start', 'duration', 'counters', 'tracer',
+                 '_memory')
+
+    def __init__(self, tracer, name, counters):
+        self.tracer = tracer
+        self.name = name
+        self.path = name
+        self.start = None
+        self.duration = None
+        self.counters = counters
+        self._memory = None
+
+    def set(self, **counters):
+        """ Set counters on the span """
+        self.counters.update(counters)
+
+    def as_dict(self):
+        """ The span as a dictionary of plain values """
+        return {'name': self.name, 'path': self.path, 'start': self.start,
+                'duration': self.duration, 'counters': dict(self.counters)}
+
+    def __enter__(self):
+        self.tracer._enter(self)
+        return self
+
+    def __exit__(self, *exc):
+        self.tracer._exit(self)
+        return False
+
+
+class _NullSpan(object):
+    """ Span given out by a tracer without sinks, it records nothing """
+
+    __slots__ = ()
+
+    def set(self, **counters):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class Tracer(object):
+    """
+    Tracer
+    ------
+    sinks : sinks receiving each closed span, see add_sink
+    memory : record the bytes allocated within each span (Python 3 only),
+             starting tracemalloc if it is not already tracing
+
+    A sink is any object with a record(span) method.
+    """
+
+    def __init__(self, sinks=(), memory=False):
+        self.sinks = list(sinks)
+        self.memory = memory and tracemalloc is not None
+        if self.memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+        self._stack = []
+
+    @property
+    def enabled(self):
+        """ Whether any sink is listening, counters which are costly to
+            compute need only be computed when it is
+        """
+        return bool(self.sinks)
+
+    def add_sink(self, sink):
+        """ Pass every subsequent span to the sink """
+        self.sinks.append(sink)
+        return sink
+
+    def remove_sink(self, sink):
+        """ Stop passing spans to the sink """
+        self.sinks.remove(sink)
+
+    def span(self, name, **counters):
+        """ A context manager timing the phase within it """
+        if not self.sinks:
+            return _NULL_SPAN
+        return Span(self, name, counters)
+
+    def _enter(self, span):
+        if self._stack:
+            span.path = '/'.join([self._stack[-1].path, span.name])
+        self._stack.append(span)
+        if self.memory and tracemalloc.is_tracing():
+            span._memory = tracemalloc.get_traced_memory()[0]
+        span.start = time.time()
+
+    def _exit(self, span):
+        span.duration = time.time() - span.start
+        if span._memory is not None and tracemalloc.is_tracing():
+            span.counters['bytes'] = (tracemalloc.get_traced_memory()[0] -
+                                      span._memory)
+        if self._stack and self._stack[-1] is span:
+            self._stack.pop()
+        for sink in self.sinks:
+            sink.record(span)
+
+    def __getstate__(self):
+        # Sinks may hold files and loggers, copies of the tracer (e.g. in
+        # worker processes) trace nothing
+        return {'sinks': [], 'memory': False, '_stack': []}
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+
+
+class LogSink(object):
+    """
+    LogSink
+    -------
+    Writes each span to a logger as its path, duration in ms and counters.
+
+    logger : a logging.Logger, defaults to the 'pyspd' logger
+    level : logging level of the messages
+    """
+
+    def __init__(self, logger=None, level=logging.INFO):
+        self.logger = logger or logging.getLogger('pyspd')
+        self.level = level
+
+    def record(self, span):
+        counters = ' '.join('%s=%s' % (k, span.counters[k])
+                            for k in sorted(span.counters))
+        self.logger.log(self.level, "%s %0.3f ms %s", span.path,
+                        span.duration * 1000, counters)
+
+
+class MemorySink(object):
+    """
+    MemorySink
+    ----------
+    Keeps every span, in the order they closed (so inner spans precede the
+    spans enclosing them).
+    """
+
+    def __init__(self):
+        self.spans = []
+
+    def record(self, span):
+        self.spans.append(span)
+
+    def clear(self):
+        """ Forget all recorded spans """
+        del self.spans[:]
+
+    def find(self, path):
+        """ Spans with the given path, or name if it has no '/' """
+        key = 'path' if '/' in path else 'name'
+        return [s for s in self.spans if getattr(s, key) == path]
+
+    def totals(self):
+        """ Total duration of the spans with each path """
+        totals = {}
+        for span in self.spans:
+            totals[span.path] = totals.get(span.path, 0.) + span.duration
+        return totals
+
+
+class JsonLinesSink(object):
+    """
+    JsonLinesSink
+    -------------
+    Appends each span to a file as a line of JSON, see Span.as_dict.
+
+    output : a file path or an open file object
+    """
+
+    def __init__(self, output):
+        if hasattr(output, 'write'):
+            self.file = output
+            self.owned = False
+        else:
+            self.file = open(output, 'a')
+            self.owned = True
+
+    def record(self, span):
+        self.file.write(json.dumps(span.as_dict(), sort_keys=True,
+                                   default=_plain) + '\n')
+        self.file.flush()
+
+    def close(self):
+        """ Close the file if it was opened by the sink """
+        if self.owned:
+            self.file.close()
+
+
+def _plain(value):
+    """ Convert numpy scalars for JSON """
+    if hasattr(value, 'item'):
+        return value.item()
+    raise TypeError("%r is not JSON serialisable" % (value,))
+
+
+if __name__ == '__main__':
+    pass
@@ -0,0 +1,212 @@
+"""
+Islands
+-------
+
+Split a dispatch into the independent islands of its network and solve each
+as a smaller linear program, in parallel.
+
+Two nodes are in the same island when a path of branches joins them or
+when they share a reserve zone (a zone spanning two parts of the network
+couples their dispatch through its risk and reserve price). Nothing else
+links the islands, so the solution of the whole is exactly the union of
+the solutions of each.
+
+Each island's offer book is cut from the compiled ISO (OfferBook.take),
+compiled into its own MatrixModel and solved by a pool of worker
+processes. The results are merged back into a single DispatchResult in the
+order of the ISO, whose rows are the rows of each island in turn with
+their elements indexed within the whole ISO.
+
+Usage
+-----
+>>> SO.create_offers()
+>>> dispatch = IslandDispatch(SO, processes=4, backend='highs')
+>>> result = dispatch.run()
+>>> dispatch.islands
+"""
+import multiprocessing
+import time
+
+import numpy as np
+import scipy.sparse as sp
+from scipy.sparse.csgraph import connected_components
+
+from matrix import MatrixBuilder, ROW_FAMILIES, ELEMENT_NAMES
+from backends import get_backend
+from result import DispatchResult
+from instrument import Tracer
+from model import push_result
+
+
+def find_islands(book):
+    """ Number of islands and the island of each node, numbered in order of
+        their first node
+    """
+    nn = len(book.node_names)
+    nz = len(book.zone_names)
+    # Nodes are joined by their branches and to a vertex for their zone
+    rows = np.concatenate([book.branch_from, np.arange(nn)])
+    cols = np.concatenate([book.branch_to, nn + book.node_zone])
+    graph = sp.coo_matrix((np.ones(len(rows)), (rows, cols)),
+                          shape=(nn + nz, nn + nz))
+    count, label = connected_components(graph, directed=False)
+    first, label = np.unique(label[:nn], return_inverse=True)
+    return len(first), label.ravel()
+
+
+class IslandDispatch:
+    """
+    IslandDispatch
+    --------------
+    Dispatches a compiled ISO island by island.
+
+    ISO : a compiled ISO (after ISO.create_offers)
+    processes : number of worker processes, defaults to the number of CPUs.
+                With a single process, or a single island, the islands are
+                solved in process.
+    backend : name of the in process backend solving each island
+
+    After run, islands holds the number of islands, books their offer
+    books and result the merged DispatchResult. Each island is timed as a
+    span of the ISO's tracer.
+    """
+
+    def __init__(self, ISO, processes=None, backend='highs'):
+        self.ISO = ISO
+        self.processes = processes or multiprocessing.cpu_count()
+        self.backend = backend
+        self.tracer = ISO.tracer
+
+    def run(self, push=True):
+        """ Solve every island and merge the results, passing them to the
+            participant objects if push is True. Returns the result.
+        """
+        begin = time.time()
+        span = self.tracer.span
+        with span('island_dispatch') as s:
+            with span('split'):
+                book = self.ISO.offer_book
+                self.islands, label = find_islands(book)
+                self.books = [book.take(np.flatnonzero(label == k))
+                              for k in range(self.islands)]
+            s.set(islands=self.islands)
+
+            with span('solve_islands'):
+                tasks = [(b, self.backend) for b in self.books]
+                if self.processes == 1 or self.islands < 2:
+                    solved = [_solve_island(t) for t in tasks]
+                else:
+                    pool = multiprocessing.Pool(min(self.processes,
+                                                    self.islands))
+                    try:
+                        solved = pool.map(_solve_island, tasks)
+                    finally:
+                        pool.close()
+                        pool.join()
+
+            with span('merge'):
+                self.result = self._merge(book, solved)
+            if push:
+                self.push_dispatch()
+        self.run_time = time.time() - begin
+        return self.result
+
+    def _merge(self, book, solved):
+        """ Merge the island results into one in the order of the ISO """
+        arrays = {'prices': np.zeros(len(book.node_names)),
+                  'reserve_prices': np.zeros(len(book.zone_names)),
+                  'risk': np.zeros(len(book.zone_names)),
+                  'energy_dispatch': np.zeros(len(book.station_names)),
+                  'reserve_dispatch': np.zeros(len(book.provider_names)),
+                  'flows': np.zeros(len(book.branch_names))}
+        kinds = ('nodes', 'zones', 'zones', 'stations', 'providers',
+                 'branches')
+        fields = ('prices', 'reserve_prices', 'risk', 'energy_dispatch',
+                  'reserve_dispatch', 'flows')
+
+        duals, rows, families, elements = [], [], [], []
+        unnamed = 0
+        objective = 0.
+        status = 1
+        for island, values in zip(self.books, solved):
+            index = island.parent_index
+            for field, kind in zip(fields, kinds):
+                arrays[field][index[kind]] = values[field]
+            # Elements of each row within the whole ISO
+            family = values['row_family']
+            element = values['row_element'].copy()
+            for code, (name, kind) in enumerate(ROW_FAMILIES):
+                rows_of = family == code
+                element[rows_of] = index[kind][element[rows_of]]
+            # Unnamed rows are numbered on through the islands
+            for name in values['row_names']:
+                if name.startswith('_C'):
+                    unnamed += 1
+                    name = '_C%d' % unnamed
+                rows.append(name)
+            duals.append(values['duals'])
+            families.append(family)
+            elements.append(element)
+            objective += values['objective']
+            if values['status'] != 1 and status == 1:
+                status = values['status']
+
+        arrays['duals'] = np.concatenate(duals) if duals else np.zeros(0)
+        arrays['row_family'] = (np.concatenate(families) if families else
+                                np.zeros(0, dtype=np.int8))
+        arrays['row_element'] = (np.concatenate(elements) if elements else
+                                 np.zeros(0, dtype=int))
+        ISO = self.ISO
+        names = {'nodes': ISO.all_nodes,
+                 'zones': ISO.reserve_zone_names,
+                 'stations': ISO.energy_totals,
+                 'providers': ISO.reserve_totals,
+                 'branches': ISO.transmission_totals,
+                 'rows': rows,
+                 'elements': dict((kind, getattr(book, a)) for kind, a in
+                                  ELEMENT_NAMES.items())}
+        return DispatchResult(names, arrays, objective, status, 'islands')
+
+    def push_dispatch(self):
+        """ Pass the merged result to the participant objects """
+        push_result(self.ISO, self.result, tracer=self.tracer)
+
+
+class _Island:
+    """ The offer book of an island, standing in for the ISO of a
+        MatrixBuilder
+    """
+
+    def __init__(self, book):
+        self.offer_book = book
+        self.tracer = Tracer()
+
+
+def _solve_island(task):
+    """ Build and solve the model of an island, returning its values in
+        the order of the island's offer book
+    """
+    book, backend = task
+    model = MatrixBuilder(_Island(book)).build()
+    solution = get_backend(backend).solve(model)
+
+    x = solution.x
+    duals = solution.duals
+    cols = model.col_slices
+    rows = model.price_rows
+    return {'prices': -1 * duals[rows['energy']],
+            'reserve_prices': duals[rows['reserve']],
+            'risk': x[cols['Risk']],
+            'energy_dispatch': x[cols['Energy_Total']],
+            'reserve_dispatch': x[cols['Reserve_Total']],
+            'flows': x[cols['Transmission_Total']],
+            'duals': duals,
+            'row_names': model.row_names,
+            'row_family': model.row_family,
+            'row_element': model.row_element,
+            'objective': solution.objective,
+            'status': solution.status}
+
+
+if __name__ == '__main__':
+    pass
@@ -1,6 +1,10 @@
+from __future__ import print_function
 import numpy as np
 from collections import defaultdict
 
+from offerbook import OfferBook
+from instrument import Tracer
+
 class ISO:
     """ 
     Independent System Operator
@@ -14,6 +18,20 @@ class ISO:
     
     Is initialised primarily empty with space for a number of different
     instances.
+    
+    Recompilation
+    -------------
+    Stations, interruptible loads, nodes and branches notify the ISO when
+    their offers, demand or capacity change. After the first full compile
+    create_offers only recompiles the slices belonging to those elements, so
+    that it may be called every trading period. Adding a new element forces
+    a full compile, as does calling initialise_empty.
+    
+    Tracing
+    -------
+    tracer holds an instrument.Tracer timing each step of create_offers,
+    it is shared with the LPSolver acting on the ISO. Add sinks to it to
+    record the spans.
     """
     
     def __init__(self, name):
@@ -26,6 +44,9 @@ class ISO:
         self.nodes = []
         self.branches = []
         
+        self.reserve_zones = []
+        self.reserve_zone_names = []
+        
         self.node_name_map = {}
         self.reserve_zone_name_map = {}
         self.station_name_map = {}
@@ -35,6 +56,14 @@ class ISO:
         self.intload = []
         self.intload_names = []
         
+        # Offers and demand of the units and nodes replaced by
+        # batch.apply_period as they were before it first replaced them,
+        # and the names set by the last period it applied
+        self.period_base = {}
+        self.period_names = {}
+        
+        self.tracer = Tracer()
+        
     def initialise_empty(self):
         """ Initialise an empty dispatch including all of the structures
             necessary in order to pass the dispatch to the solver
@@ -65,7 +94,6 @@ class ISO:
         self.reserve_band_proportion = {} # Done
         self.transmission_band_loss_factor = {} # Done
         
-        self.spinning_stations = [] # Done
         self.spinning_station_names = [] # Done
         self.spin_map = defaultdict(list) # Done
         
@@ -75,22 +103,149 @@ class ISO:
         self.node_t_map = defaultdict(list) # Done
         self.node_transmission_direction = defaultdict(dict) # Done
         
-        self.reserve_zones = [] # Done
-        self.reserve_zone_names = [] # Done
         self.reserve_zone_generators = defaultdict(list) # Done
         self.reserve_zone_transmission = defaultdict(list) # Done
         self.reserve_zone_trans_direct = defaultdict(dict) # Done
         
         self.reserve_zone_reserve = defaultdict(list) # Done
         
+        self.offer_book = None
+        self.compiled = False
+        self.changed_nodes = set()
+        self.changed_stations = set()
+        self.changed_intload = set()
+        self.changed_branches = set()
+        
         
     def create_offers(self):
-        """ Create the full offer dispatch from the base classes """
-        #self.initialise_empty()
-        self.get_nodal_demand()
-        self.get_energy_offers()
-        self.get_reserve_offers()
-        self.get_network()
+        """ Create the full offer dispatch from the base classes, along with
+            the array backed OfferBook used by the matrix build.
+            
+            Only the elements which have changed since the last call are
+            recompiled, calling it again with no changes does nothing.
+        """
+        span = self.tracer.span
+        with span('create_offers'):
+            if self.compiled:
+                self.recompile_changes()
+                return
+                
+            self.initialise_empty()
+            with span('get_nodal_demand') as s:
+                self.get_nodal_demand()
+                s.set(nodes=len(self.all_nodes))
+            with span('get_energy_offers') as s:
+                self.get_energy_offers()
+                s.set(stations=len(self.energy_totals),
+                      bands=len(self.energy_bands))
+            with span('get_reserve_offers') as s:
+                self.get_reserve_offers()
+                s.set(providers=len(self.reserve_totals),
+                      bands=len(self.reserve_bands))
+            with span('get_network') as s:
+                self.get_network()
+                s.set(branches=len(self.transmission_totals),
+                      bands=len(self.transmission_bands))
+            with span('offer_book') as s:
+                self.offer_book = OfferBook(self)
+                s.set(bytes=self.offer_book.nbytes)
+            self.compiled = True
+        
+        
+    def recompile_changes(self):
+        """ Recompile the demand, offers and capacities of the nodes,
+            stations, interruptible loads and branches which have changed
+            since the last compile
+        """
+        with self.tracer.span('recompile_changes') as s:
+            s.set(nodes=len(self.changed_nodes),
+                  stations=len(self.changed_stations),
+                  intload=len(self.changed_intload),
+                  branches=len(self.changed_branches))
+            for node in self.changed_nodes:
+                self.node_demand[node.name] = node.demand
+                self.offer_book.update_node(node)
+            
+            for station in self.changed_stations:
+                self._recompile_station(station)
+            
+            for il in self.changed_intload:
+                self._recompile_reserve(il)
+                self.offer_book.update_provider(il)
+            
+            for branch in self.changed_branches:
+                self._recompile_branch(branch)
+            
+            self.changed_nodes.clear()
+            self.changed_stations.clear()
+            self.changed_intload.clear()
+            self.changed_branches.clear()
+        
+        
+    def _recompile_station(self, station):
+        """ Replace the energy (and reserve) bands of a station """
+        book = self.offer_book
+        k = book.station_index[station.name]
+        begin, end = book.station_band_ptr[k], book.station_band_ptr[k + 1]
+        
+        for band in self.energy_bands[begin:end]:
+            del self.energy_band_prices[band]
+            del self.energy_band_maximum[band]
+            
+        names = station.energy.names
+        self.energy_bands[begin:end] = names
+        self.energy_band_map[station.name] = list(names)
+        self.energy_total_maximum[station.name] = station.capacity
+        self.energy_band_prices.update(zip(names, station.energy.prices))
+        self.energy_band_maximum.update(zip(names, station.energy.offers))
+            
+        if station.spinning:
+            self._recompile_reserve(station)
+        book.update_station(station)
+        
+        
+    def _recompile_reserve(self, unit):
+        """ Replace the reserve bands of a spinning station or interruptible
+            load
+        """
+        book = self.offer_book
+        k = book.provider_index[unit.name]
+        begin, end = book.provider_band_ptr[k], book.provider_band_ptr[k + 1]
+        
+        for band in self.reserve_bands[begin:end]:
+            del self.reserve_band_prices[band]
+            del self.reserve_band_maximum[band]
+            self.reserve_band_proportion.pop(band, None)
+            
+        bands = unit.reserve
+        names = bands.names
+        if bands.proportions is not None:
+            self.spin_map[unit.name] = list(names)
+            self.reserve_band_proportion.update(zip(names, bands.proportions))
+            
+        self.reserve_bands[begin:end] = names
+        self.reserve_band_map[unit.name] = list(names)
+        self.reserve_band_prices.update(zip(names, bands.prices))
+        self.reserve_band_maximum.update(zip(names, bands.offers))
+            
+            
+    def _recompile_branch(self, branch):
+        """ Replace the capacity and transmission bands of a branch """
+        book = self.offer_book
+        k = book.branch_index[branch.name]
+        begin, end = book.branch_band_ptr[k], book.branch_band_ptr[k + 1]
+        
+        for band in self.transmission_bands[begin:end]:
+            del self.transmission_band_maximum[band]
+            del self.transmission_band_loss_factor[band]
+            
+        self.transmission_bands[begin:end] = branch.bands
+        self.transmission_band_map[branch.name] = list(branch.bands)
+        self.transmission_total_maximum[branch.name] = branch.capacity
+        for band in branch.bands:
+            self.transmission_band_maximum[band] = branch.bc[band]
+            self.transmission_band_loss_factor[band] = branch.blf[band]
+        book.update_branch(branch)
         
         
     def get_nodal_demand(self):
@@ -118,11 +273,11 @@ class ISO:
             self.energy_totals.append(station.name)
             self.energy_total_maximum[station.name] = station.capacity
             
-            for band in station.band_names:
-                self.energy_bands.append(band)
-                self.energy_band_prices[band] = station.band_prices[band]
-                self.energy_band_maximum[band] = station.band_offers[band]
-                self.energy_band_map[station.name].append(band)
+            names = station.energy.names
+            self.energy_bands.extend(names)
+            self.energy_band_prices.update(zip(names, station.energy.prices))
+            self.energy_band_maximum.update(zip(names, station.energy.offers))
+            self.energy_band_map[station.name].extend(names)
                 
             if station.spinning == True:
                 self.spinning_station_names.append(station.name)
@@ -144,24 +299,25 @@ class ISO:
         for station in self.spinning_stations:
             self.reserve_totals.append(station.name)
             
-            for band in station.rband_names:
-                self.reserve_bands.append(band)
-                self.reserve_band_prices[band] = station.rband_prices[band]
-                self.reserve_band_maximum[band] = station.rband_offers[band]
-                self.reserve_band_proportion[band] = station.rband_proportions[band]
+            bands = station.reserve
+            names = bands.names
+            self.reserve_bands.extend(names)
+            self.reserve_band_prices.update(zip(names, bands.prices))
+            self.reserve_band_maximum.update(zip(names, bands.offers))
+            self.reserve_band_proportion.update(zip(names, bands.proportions))
             
-                self.reserve_band_map[station.name].append(band)
-                self.spin_map[station.name].append(band)
+            self.reserve_band_map[station.name].extend(names)
+            self.spin_map[station.name].extend(names)
                 
         # Get the interuptible load offers
         for il in self.intload:
             self.reserve_totals.append(il.name)
             
-            for band in il.band_names:
-                self.reserve_bands.append(band)
-                self.reserve_band_prices[band] = il.band_prices[band]
-                self.reserve_band_maximum[band] = il.band_offers[band]
-                self.reserve_band_map[il.name].append(band)
+            names = il.reserve.names
+            self.reserve_bands.extend(names)
+            self.reserve_band_prices.update(zip(names, il.reserve.prices))
+            self.reserve_band_maximum.update(zip(names, il.reserve.offers))
+            self.reserve_band_map[il.name].extend(names)
                 
         # Map to particular reserve zones        
         for RZ in self.reserve_zones:
@@ -218,56 +374,57 @@ class ISO:
                 
     def pretty_print(self):
         """ Pretty Printing of the solved dispatch including for analysis """
-        print "-" * 60
-        print "\t"*2, "Beginning Dispatch Results"
-        print "-" * 60
-        print "\t" * 2, "Energy Prices"
-        print "\tNode\t\tPrice\t\tDemand"
-        print "\t----\t\t-----\t\t------"
+        print("-" * 60)
+        print("\t"*2, "Beginning Dispatch Results")
+        print("-" * 60)
+        print("\t" * 2, "Energy Prices")
+        print("\tNode\t\tPrice\t\tDemand")
+        print("\t----\t\t-----\t\t------")
         for node in self.nodes:
-            print "\t%s\t\t$%0.2f/MWh\t\t%0.2f MW" % (node.name[:4],
+            print("\t%s\t\t$%0.2f/MWh\t\t%0.2f MW" % (node.name[:4],
                                                       node.price,
-                                                      node.demand)
-        print '-' * 60
-        print "\t\tReserve Prices"
-        print "\tRZone\t\tPrice\t\tDispatch"
-        print "\t-----\t\t-----\t\t--------"
+                                                      node.demand))
+        print('-' * 60)
+        print("\t\tReserve Prices")
+        print("\tRZone\t\tPrice\t\tDispatch")
+        print("\t-----\t\t-----\t\t--------")
         for rzone in self.reserve_zones:
-            print "\t%s\t\t$%0.2f/MWh\t\t%0.2f MW " % (rzone.name[:5],
+            print("\t%s\t\t$%0.2f/MWh\t\t%0.2f MW " % (rzone.name[:5],
                                                              rzone.price,
-                                                             rzone.dispatch)
-        print '-' * 60
-        print "\t\tEnergy Dispatch"
-        print "\tStation\t\tDispatch\t\tRevenue"
-        print "\t-------\t\t--------\t\t-------"
+                                                             rzone.dispatch))
+        print('-' * 60)
+        print("\t\tEnergy Dispatch")
+        print("\tStation\t\tDispatch\t\tRevenue")
+        print("\t-------\t\t--------\t\t-------")
         for station in self.stations:
-            print "\t%s\t\t%0.2f MW\t\t$%0.2f" % (station.name[:5], 
+            print("\t%s\t\t%0.2f MW\t\t$%0.2f" % (station.name[:5], 
                                                   abs(station.energy_dispatch),
-                                                  abs(station.energy_revenue))
-        print '-' * 60
-        print "\t\tReserve Dispatch"
-        print "\tStation\t\tDispatch\t\tRevenue"
-        print "\t-------\t\t--------\t\t-------"
+                                                  abs(station.energy_revenue)))
+        print('-' * 60)
+        print("\t\tReserve Dispatch")
+        print("\tStation\t\tDispatch\t\tRevenue")
+        print("\t-------\t\t--------\t\t-------")
         for station in self.spinning_stations:
-            print "\t%s\t\t%0.2f MW\t\t$%0.2f" % (station.name,
+            print("\t%s\t\t%0.2f MW\t\t$%0.2f" % (station.name,
                                                 abs(station.reserve_dispatch),
-                                                abs(station.reserve_revenue))
+                                                abs(station.reserve_revenue)))
         for intload in self.intload:
-            print "\t%s\t\t%0.2f MW\t\t$%0.2f" % (intload.name[-5:],
+            print("\t%s\t\t%0.2f MW\t\t$%0.2f" % (intload.name[-5:],
                                             abs(intload.reserve_dispatch),
-                                            abs(intload.reserve_revenue))
-        print "-" * 60
-        print "\t\tTransmission Dispatch"
-        print "\tBranch\t\t\tDispatch"
-        print "\t------\t\t\t--------"
+                                            abs(intload.reserve_revenue)))
+        print("-" * 60)
+        print("\t\tTransmission Dispatch")
+        print("\tBranch\t\t\tDispatch")
+        print("\t------\t\t\t--------")
         for branch in self.branches:
-            print "\t%s\t\t%0.2f MW" % (branch.name, branch.flow)
+            print("\t%s\t\t%0.2f MW" % (branch.name, branch.flow))
                 
         
         
     
     def _add_station(self, station):
         """ Add a generation station to the ISO """
+        self.compiled = False
         self.stations.append(station)
         self.station_name_map[station.name] = station
         if station.spinning:
@@ -277,18 +434,21 @@ class ISO:
         
     def _add_node(self, node):
         """ Adds a node to the ISO """
+        self.compiled = False
         self.nodes.append(node)
         self.node_name_map[node.name] = node
         
     
     def _add_branch(self, branch):
         """ Adds a branch to the ISO """
+        self.compiled = False
         self.branches.append(branch)
         self.branch_name_map[branch.name] = branch
         
         
     def _add_reserve_zone(self, RZ):
         """ Adds a reserve zone to the ISO """
+        self.compiled = False
         self.reserve_zones.append(RZ)
         self.reserve_zone_names.append(RZ.name)
         self.reserve_zone_name_map[RZ.name] = RZ
@@ -296,10 +456,31 @@ class ISO:
     
     def _add_intload(self, Load):
         """ Adds an interruptible load provider to the ISO """
+        self.compiled = False
         self.intload.append(Load)
         self.intload_names.append(Load.name)
         self.reserve_name_map[Load.name] = Load
         
         
+    def _node_changed(self, node):
+        """ Note that the demand of a node has changed """
+        self.changed_nodes.add(node)
+        
+        
+    def _station_changed(self, station):
+        """ Note that the offers of a station have changed """
+        self.changed_stations.add(station)
+        
+        
+    def _intload_changed(self, Load):
+        """ Note that the offers of an interruptible load have changed """
+        self.changed_intload.add(Load)
+        
+        
+    def _branch_changed(self, branch):
+        """ Note that the capacity of a branch has changed """
+        self.changed_branches.add(branch)
+        
+        
 if __name__ == '__main__':
     pass
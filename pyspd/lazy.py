@@ -0,0 +1,71 @@
+"""
+Lazy
+----
+
+Lazy generation of the reserve zone risk constraints.
+
+The full model has a risk row for every risk setting station and two for
+every risk setting branch (one in the zone at either end), although only
+the largest few in each zone ever bind. With LPSolver(lazy_risk=k) the model
+is built with the rows of the k stations and k branches of each zone with
+the most offered capacity (risk_candidates). After each solve the stations
+and branches whose dispatch exceeds the risk of their zone are found
+(risk_violations), their rows added to the model and the model re-solved,
+warm with an in process backend, until there are none. The solution is
+then that of the full model.
+"""
+import numpy as np
+
+
+def risk_candidates(book, k):
+    """ Indices of the k risk setting stations with the most offered
+        capacity in each zone, and the k risk setting branches with the
+        most capacity in the zone at either end
+    """
+    offered = np.minimum(np.bincount(book.energy_band_station,
+                                     weights=book.energy_band_quantity,
+                                     minlength=len(book.station_names)),
+                         book.station_capacity)
+    gens = np.flatnonzero(book.station_risk)
+    stations = gens[_top(book.station_zone[gens], offered[gens], k)]
+
+    lines = np.flatnonzero(book.branch_risk)
+    capacity = book.branch_capacity[lines]
+    top = (_top(book.node_zone[book.branch_from[lines]], capacity, k) |
+           _top(book.node_zone[book.branch_to[lines]], capacity, k))
+    return stations, lines[top]
+
+
+def risk_violations(book, energy, flows, risk, stations, branches,
+                    tolerance=1e-6):
+    """ Indices of the risk setting stations and branches, other than the
+        given ones whose rows are in the model, whose dispatch exceeds the
+        risk of their zone.
+
+        A branch sets the risk of the zone of its sending node when flowing
+        into it (a negative flow) and that of its receiving node when
+        flowing out of it.
+    """
+    gens = np.setdiff1d(np.flatnonzero(book.station_risk), stations)
+    over = energy[gens] > risk[book.station_zone[gens]] + tolerance
+
+    lines = np.setdiff1d(np.flatnonzero(book.branch_risk), branches)
+    sending = book.node_zone[book.branch_from[lines]]
+    receiving = book.node_zone[book.branch_to[lines]]
+    flow = flows[lines]
+    exceeded = ((-flow > risk[sending] + tolerance) |
+                (flow > risk[receiving] + tolerance))
+    return gens[over], lines[exceeded]
+
+
+def _top(group, value, k):
+    """ Mask of the k largest values within each group """
+    order = np.lexsort((-value, group))
+    starts = np.searchsorted(group[order], group[order], side='left')
+    mask = np.zeros(len(group), dtype=bool)
+    mask[order] = np.arange(len(order)) - starts < k
+    return mask
+
+
+if __name__ == '__main__':
+    pass
@@ -0,0 +1,221 @@
+"""
+Loader
+------
+
+Stream market offer and demand files into an ISO, one trading period at a
+time.
+
+Files may be CSV or Parquet (by the .parquet or .pq extension) and are read
+in chunks, each chunk parsed into columns by pandas (and pyarrow for Parquet)
+and split by trading period and unit with array operations. Every file must
+be sorted by trading period, the rows of a unit within a period being in
+band order.
+
+File Formats
+------------
+energy : trading_period, station, band, price, offer
+reserve : trading_period, unit, band, price, offer, prop
+          (unit may be a spinning station or an interruptible load, prop is
+          ignored for interruptible load and may be omitted if there is none)
+demand : trading_period, node, demand
+
+The periods produced take the form used by batch.BatchDispatch, with the
+offers of each unit held as arrays, so that the loader may feed either a
+batch or a sequential simulation:
+
+>>> loader = MarketLoader(SO, energy="energy.csv", demand="demand.csv")
+>>> results = BatchDispatch(SO, backend='highs').run(loader.periods())
+
+>>> Solver = LPSolver(SO, backend='highs')
+>>> for period in loader:
+...     Solver.full_setup_and_solve()
+
+A unit or node missing from a period has the offers or demand of the base
+ISO, see batch.apply_period.
+"""
+import numpy as np
+
+try:
+    import pandas as pd
+except ImportError:
+    pd = None
+
+try:
+    import pyarrow.parquet as pq
+except ImportError:
+    pq = None
+
+from batch import apply_period
+
+
+PERIOD = 'trading_period'
+
+# Column types, the type of the trading period is left to be inferred
+ENERGY_COLUMNS = {PERIOD: None, 'station': str, 'band': str, 'price': float,
+                  'offer': float}
+RESERVE_COLUMNS = {PERIOD: None, 'unit': str, 'band': str, 'price': float,
+                   'offer': float, 'prop': float}
+DEMAND_COLUMNS = {PERIOD: None, 'node': str, 'demand': float}
+
+
+class MarketLoader:
+    """
+    MarketLoader
+    ------------
+    ISO : the ISO the offers and demand are applied to, used to separate
+          interruptible load from spinning station reserve offers
+    energy, reserve, demand : file paths, DataFrames or iterables of
+                              DataFrames (chunks) in the formats above
+    chunksize : number of rows read from a file at once
+
+    Iterating over the loader applies each period to the ISO in turn and
+    yields its trading period, periods() yields the periods without
+    applying them.
+    """
+
+    def __init__(self, ISO, energy=None, reserve=None, demand=None,
+                 chunksize=100000):
+        if pd is None:
+            raise ImportError("MarketLoader requires pandas")
+        self.ISO = ISO
+        self.sources = {'energy': energy, 'reserve': reserve,
+                        'demand': demand}
+        self.chunksize = chunksize
+
+    def __iter__(self):
+        for period in self.periods():
+            apply_period(self.ISO, period)
+            yield period['period']
+
+    def periods(self):
+        """ Generate the offers and demand of each trading period, in
+            order, merged across the files
+        """
+        columns = {'energy': ENERGY_COLUMNS, 'reserve': RESERVE_COLUMNS,
+                   'demand': DEMAND_COLUMNS}
+        streams = {}
+        for kind, source in self.sources.items():
+            if source is not None:
+                chunks = read_chunks(source, columns[kind], self.chunksize)
+                streams[kind] = period_frames(chunks)
+
+        heads = dict((kind, next(stream, None)) for kind, stream in
+                     streams.items())
+        while any(head is not None for head in heads.values()):
+            label = min(head[0] for head in heads.values() if head is not None)
+            period = {'period': label}
+            for kind, head in heads.items():
+                if head is not None and head[0] == label:
+                    period.update(getattr(self, '_' + kind)(head[1]))
+                    heads[kind] = next(streams[kind], None)
+            yield period
+
+    def _energy(self, frame):
+        """ Energy offers of a period, by station """
+        return {'energy_offers': split_units(frame, 'station',
+                                             ('bands', 'prices', 'offers'),
+                                             ('band', 'price', 'offer'))}
+
+    def _reserve(self, frame):
+        """ Reserve offers of a period, split into spinning stations and
+            interruptible load
+        """
+        if 'prop' not in frame:
+            frame = frame.assign(prop=0.)
+        else:
+            frame = frame.assign(prop=frame['prop'].fillna(0.))
+        offers = split_units(frame, 'unit',
+                             ('bands', 'prices', 'offers', 'props'),
+                             ('band', 'price', 'offer', 'prop'))
+
+        intload = set(self.ISO.intload_names)
+        period = {'reserve_offers': {}, 'il_offers': {}}
+        for name, unit in offers.items():
+            if name in intload:
+                del unit['props']
+                period['il_offers'][name] = unit
+            else:
+                period['reserve_offers'][name] = unit
+        return period
+
+    def _demand(self, frame):
+        """ Nodal demand of a period """
+        return {'demand': dict(zip(frame['node'].values,
+                                   frame['demand'].values.tolist()))}
+
+
+def read_chunks(source, columns, chunksize=100000):
+    """ Read a file, DataFrame or iterable of DataFrames as a sequence of
+        DataFrames of at most chunksize rows (files only), keeping the
+        given columns
+    """
+    if isinstance(source, pd.DataFrame):
+        return iter([source])
+    if not isinstance(source, str):
+        return iter(source)
+
+    if source.endswith(('.parquet', '.pq')):
+        if pq is None:
+            raise ImportError("Reading Parquet files requires pyarrow")
+        parquet = pq.ParquetFile(source)
+        names = [c for c in parquet.schema.names if c in columns]
+        return (records.to_pandas() for records in
+                parquet.iter_batches(batch_size=chunksize, columns=names))
+
+    return pd.read_csv(source, chunksize=chunksize,
+                       usecols=lambda c: c in columns,
+                       dtype=dict((c, t) for c, t in columns.items() if t))
+
+
+def period_frames(chunks):
+    """ Generate (trading period, DataFrame) for each period of a sequence
+        of chunks sorted by trading period, joining periods which span
+        chunks
+    """
+    carry = None
+    last = None
+    for chunk in chunks:
+        if carry is not None:
+            chunk = pd.concat([carry, chunk], ignore_index=True)
+        labels = chunk[PERIOD].values
+        if len(labels) == 0:
+            continue
+
+        starts = np.concatenate([[0], np.flatnonzero(labels[1:] !=
+                                                     labels[:-1]) + 1])
+        ends = np.concatenate([starts[1:], [len(labels)]])
+        # The last period may continue into the next chunk
+        for begin, end in zip(starts[:-1], ends[:-1]):
+            last = _check_order(last, labels[begin])
+            yield last, chunk.iloc[begin:end]
+        carry = chunk.iloc[starts[-1]:]
+
+    if carry is not None and len(carry):
+        last = _check_order(last, carry[PERIOD].values[0])
+        yield last, carry
+
+
+def _check_order(last, label):
+    """ Trading periods must be strictly increasing through a file """
+    label = label.item() if hasattr(label, 'item') else label
+    if last is not None and not label > last:
+        raise ValueError("Files must be sorted by trading period, %s follows "
+                         "%s" % (label, last))
+    return label
+
+
+def split_units(frame, unit, keys, columns):
+    """ Split the columns of a period into arrays for each unit, keeping
+        the row order of each unit
+    """
+    units = frame[unit].values
+    order = np.argsort(units, kind='mergesort')
+    names, first = np.unique(units[order], return_index=True)
+
+    parts = [np.split(frame[c].values[order], first[1:]) for c in columns]
+    return dict((name, dict(zip(keys, values))) for name, values in
+                zip(names, zip(*parts)))
+
+
+if __name__ == '__main__':
+    pass
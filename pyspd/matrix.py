@@ -0,0 +1,773 @@
+"""
+Matrix
+------
+
+Compiles the offer book held by an ISO (see offerbook.OfferBook) directly
+into a sparse constraint matrix with accompanying bound and cost vectors.
+This bypasses the per term construction of pulp expressions used by
+LPSolver.setup_lp while producing exactly the same linear program.
+
+The compiled model is split into its structure (rows, columns and the
+sparsity pattern of the constraint matrix, determined by the network
+topology and the set of offer bands) and its data (band prices, band
+quantities, reserve proportions, capacities and nodal demand). When only
+the data changes between trading periods MatrixBuilder.update rewrites the
+affected entries of an existing model in place and records which ones
+changed, so that persistent backends may update and warm start rather than
+rebuild.
+
+With presolve=True the model is built from the offer book reduced by
+presolve.Presolve, without the band offer rows, the band quantities bounding
+the band variables instead.
+
+Risk rows may be limited to a subset of the risk setting stations and
+branches and further rows added to a built model with
+MatrixBuilder.add_risk, see lazy.py.
+"""
+import numpy as np
+import scipy.sparse as sp
+import pulp as lp
+
+from presolve import Presolve
+
+
+# Families of constraint rows, with the kind of element each row refers to,
+# see MatrixModel.row_family
+ROW_FAMILIES = (('energy_price', 'nodes'),
+                ('nodal_transmission', 'nodes'),
+                ('energy_band', 'energy_bands'),
+                ('reserve_band', 'reserve_bands'),
+                ('transmission_band', 'transmission_bands'),
+                ('energy_total', 'stations'),
+                ('reserve_total', 'providers'),
+                ('transmission_total', 'branches'),
+                ('transmission_limit', 'branches'),
+                ('combined_dispatch', 'stations'),
+                ('proportion', 'reserve_bands'),
+                ('generator_risk', 'stations'),
+                ('branch_risk', 'branches'),
+                ('reserve_price', 'zones'),
+                ('ramp_rate', 'stations'))
+
+FAMILY = dict((name, code) for code, (name, kind) in enumerate(ROW_FAMILIES))
+
+# The offer book names of each kind of element
+ELEMENT_NAMES = {'nodes': 'node_names',
+                 'energy_bands': 'energy_band_names',
+                 'reserve_bands': 'reserve_band_names',
+                 'transmission_bands': 'transmission_band_names',
+                 'stations': 'station_names',
+                 'providers': 'provider_names',
+                 'branches': 'branch_names',
+                 'zones': 'zone_names'}
+
+
+class MatrixModel:
+    """
+    MatrixModel
+    -----------
+    A linear program held in row bound form:
+
+        minimise    cost . x
+        subject to  row_lower <= A x <= row_upper
+                    col_lower <= x <= col_upper
+
+    Unbounded sides are stored as -np.inf and np.inf. Rows and columns are
+    named exactly as the pulp formulation names its constraints and
+    variables so that either representation may be used interchangeably.
+
+    col_slices maps each variable family (e.g. 'Energy_Total') to the slice
+    of columns it occupies, col_elements holds the ISO element names
+    (stations, bands, nodes...) in the same order.
+
+    row_family holds the code of the family of each row (an index into
+    ROW_FAMILIES) and row_element the index of the element it refers to
+    within the offer book names of that family's kind of element, e.g. the
+    station of a combined_dispatch row or the branch of a branch_risk row.
+
+    Changes made to the data of the model by MatrixBuilder.update are
+    accumulated until a backend collects them with pop_changes.
+
+    presolve holds the presolve.Presolve the model was built from, if any,
+    whose reduced offer book the columns and row elements refer to.
+
+    Rows appended with add_rows follow all others and are recorded as
+    'added' changes.
+    """
+
+    def __init__(self, A, cost, row_lower, row_upper, col_lower, col_upper,
+                 row_names, col_names, col_slices, col_elements):
+        self.A = A
+        self.cost = cost
+        self.row_lower = row_lower
+        self.row_upper = row_upper
+        self.col_lower = col_lower
+        self.col_upper = col_upper
+        self.row_names = row_names
+        self.col_names = col_names
+        self.col_slices = col_slices
+        self.col_elements = col_elements
+
+        self.structure = None
+        self.data_rows = {}
+        self.price_rows = {}
+        self.proportion_entries = np.zeros(0, dtype=int)
+        self.row_family = np.zeros(0, dtype=np.int8)
+        self.row_element = np.zeros(0, dtype=int)
+        self.presolve = None
+        self.clear_changes()
+
+    @property
+    def shape(self):
+        """ Number of rows and columns in the model """
+        return self.A.shape
+
+    @property
+    def nnz(self):
+        """ Number of non zero entries in the constraint matrix """
+        return self.A.nnz
+
+    def clear_changes(self):
+        """ Forget all recorded changes to the model data """
+        self.changes = {'cost': [], 'rows': [], 'bounds': [], 'entries': [],
+                        'added': []}
+
+    def pop_changes(self):
+        """ Return the sorted unique indices of the costs, row bounds,
+            column bounds and matrix entries (positions in A.data) changed
+            and of the rows added since the last call
+        """
+        changes = {}
+        for kind, indices in self.changes.items():
+            if indices:
+                changes[kind] = np.unique(np.concatenate(indices))
+            else:
+                changes[kind] = np.zeros(0, dtype=int)
+        self.clear_changes()
+        return changes
+
+    def update_cost(self, index, values):
+        """ Set the costs of the given columns, recording any changes """
+        _assign(self.cost, index, values, self.changes['cost'])
+
+    def update_rows(self, index, lower=None, upper=None):
+        """ Set the bounds of the given rows, recording any changes """
+        if lower is not None:
+            _assign(self.row_lower, index, lower, self.changes['rows'])
+        if upper is not None:
+            _assign(self.row_upper, index, upper, self.changes['rows'])
+
+    def update_bounds(self, index, upper):
+        """ Set the upper bounds of the given columns, recording any
+            changes
+        """
+        _assign(self.col_upper, index, upper, self.changes['bounds'])
+
+    def update_entries(self, entries, values):
+        """ Set the given positions of A.data, recording any changes """
+        _assign(self.A.data, entries, values, self.changes['entries'])
+
+    def add_rows(self, A, lower, upper, names, family, elements):
+        """ Append rows with the CSR matrix A and the given bounds, names,
+            family codes and element indices, recording them as added
+        """
+        first = self.shape[0]
+        self.A = sp.vstack([self.A, A], format='csr')
+        self.A.sort_indices()
+        self.row_lower = np.concatenate([self.row_lower, lower])
+        self.row_upper = np.concatenate([self.row_upper, upper])
+        self.row_names = self.row_names + list(names)
+        self.row_family = np.concatenate([self.row_family,
+                                          family]).astype(np.int8)
+        self.row_element = np.concatenate([self.row_element, elements])
+        self.changes['added'].append(np.arange(first, self.shape[0]))
+
+    def entry_rows(self, entries):
+        """ Row index of each position in A.data """
+        return np.searchsorted(self.A.indptr, entries, side='right') - 1
+
+    def to_pulp(self, name="Model Dispatch"):
+        """ Create the equivalent pulp LpProblem from the matrices so that
+            the model may be solved by any of the pulp solvers.
+
+            Returns the problem and its variables in column order.
+        """
+        prob = lp.LpProblem(name, lp.LpMinimize)
+
+        variables = []
+        for j, col in enumerate(self.col_names):
+            low = self.col_lower[j]
+            up = self.col_upper[j]
+            variables.append(lp.LpVariable(col,
+                                           None if np.isinf(low) else low,
+                                           None if np.isinf(up) else up))
+
+        prob.setObjective(lp.LpAffineExpression(
+            [(variables[j], self.cost[j]) for j in np.flatnonzero(self.cost)]))
+
+        indptr = self.A.indptr
+        indices = self.A.indices
+        data = self.A.data
+        for i, row in enumerate(self.row_names):
+            begin, end = indptr[i], indptr[i + 1]
+            expr = lp.LpAffineExpression([(variables[j], v) for j, v in
+                                zip(indices[begin:end], data[begin:end])])
+            low = self.row_lower[i]
+            up = self.row_upper[i]
+            if low == up:
+                sense, rhs = lp.LpConstraintEQ, low
+            elif np.isinf(up):
+                sense, rhs = lp.LpConstraintGE, low
+            else:
+                sense, rhs = lp.LpConstraintLE, up
+            prob.addConstraint(lp.LpConstraint(expr, sense, row, rhs))
+
+        return prob, variables
+
+
+class MatrixBuilder:
+    """
+    MatrixBuilder
+    -------------
+    Builds a MatrixModel from the OfferBook of a fully compiled ISO (i.e.
+    after ISO.create_offers has been called).
+
+    Constraint families are added in the same order and with the same
+    orientation as LPSolver.setup_lp, so that row numbering, constraint names
+    (including the _C# names pulp gives to unnamed constraints) and dual
+    signs are identical between the two. Each family is assembled as a block
+    of COO triplets directly from the index arrays of the offer book.
+
+    Rows whose bounds depend on offers or demand are recorded by family in
+    data_rows and filled in by _apply_data, which is shared between build
+    and update.
+
+    Each family is timed as a span of the tracer, by default that of the
+    ISO, counting the rows and non zeros it added.
+
+    With presolve=True the offer book is first reduced (see presolve.py),
+    timed as the span 'presolve' counting what was removed, and the band
+    offer family is left out.
+
+    risk gives the indices of the risk setting stations and branches whose
+    risk rows are built, (stations, branches), by default all of them.
+    """
+
+    families = ('nodal_dispatch', 'band_offers', 'transmission_bands',
+                'total_offers', 'transmission_totals', 'spinning_reserve',
+                'risk', 'reserve_dispatch')
+
+    # Variable families, the offer book names of their elements and their
+    # lower bound (0 or None for free)
+    columns = (("Energy_Band", 'energy_band_names', 0),
+               ("Reserve_Band", 'reserve_band_names', 0),
+               ("Transmission_Band", 'transmission_band_names', None),
+               ("Energy_Total", 'station_names', 0),
+               ("Reserve_Total", 'provider_names', 0),
+               ("Transmission_Total", 'branch_names', None),
+               ("Nodal_Inject", 'node_names', None),
+               ("Risk", 'zone_names', None))
+
+    def __init__(self, ISO, tracer=None, presolve=False, risk=None):
+        self.ISO = ISO
+        self.book = ISO.offer_book
+        self.tracer = tracer or ISO.tracer
+        self.presolve = None
+        if presolve:
+            with self.tracer.span('presolve') as span:
+                self.presolve = Presolve(self.book)
+                self.book = self.presolve.reduced
+                span.set(**self.presolve.report)
+
+        if risk is None:
+            risk = (np.flatnonzero(self.book.station_risk),
+                    np.flatnonzero(self.book.branch_risk))
+        self.risk_stations = np.asarray(risk[0], dtype=int)
+        self.risk_branches = np.asarray(risk[1], dtype=int)
+
+        # Spinning stations lead the reserve providers and so their bands
+        # lead the reserve bands
+        self.nspin = int((self.book.provider_station >= 0).sum())
+        self.nspin_bands = int(self.book.provider_band_ptr[self.nspin])
+
+    def build(self):
+        """ Build the full MatrixModel from the ISO """
+        self._add_families()
+
+        nrows = len(self.row_names)
+        ncols = len(self.col_names)
+
+        with self.tracer.span('assemble') as span:
+            rows = np.concatenate(self.rows) if self.rows else np.zeros(0, int)
+            cols = np.concatenate(self.cols) if self.cols else np.zeros(0, int)
+            vals = np.concatenate(self.vals) if self.vals else np.zeros(0)
+
+            A = sp.coo_matrix((vals, (rows, cols)),
+                              shape=(nrows, ncols)).tocsr()
+            A.sort_indices()
+            span.set(rows=nrows, columns=ncols, nonzeros=A.nnz,
+                     bytes=A.data.nbytes + A.indices.nbytes +
+                     A.indptr.nbytes)
+
+        model = MatrixModel(A, np.zeros(ncols),
+                            np.concatenate(self.row_lower),
+                            np.concatenate(self.row_upper),
+                            self.col_lower, self.col_upper,
+                            self.row_names, self.col_names,
+                            self.col_slices, self.col_elements)
+        model.structure = self._structure()
+        model.data_rows = self.data_rows
+        model.price_rows = {'energy': self.energy_price_rows,
+                            'reserve': self.reserve_price_rows}
+        model.proportion_entries = self._entry_positions(A, self.prop_rows,
+                                                         self.prop_cols)
+        model.row_family, model.row_element = self._row_index()
+        model.presolve = self.presolve
+
+        self._apply_data(model)
+        model.clear_changes()
+        return model
+
+    def row_index(self):
+        """ The family code and element index of each row (see MatrixModel),
+            without assembling the model. The rows of the pulp formulation
+            are in the same order.
+        """
+        self._add_families()
+        return self._row_index()
+
+    def _row_index(self):
+        if not self.row_family:
+            return np.zeros(0, dtype=np.int8), np.zeros(0, dtype=int)
+        return (np.concatenate(self.row_family).astype(np.int8),
+                np.concatenate(self.row_element).astype(int))
+
+    def _add_families(self):
+        """ Lay out the columns and add the blocks of every constraint
+            family
+        """
+        self._setup_columns()
+
+        self.rows = []
+        self.cols = []
+        self.vals = []
+        self.row_names = []
+        self.row_lower = []
+        self.row_upper = []
+        self.row_family = []
+        self.row_element = []
+        self.data_rows = {}
+        self.unnamed = 0
+
+        for family in self.families:
+            if self.presolve is not None and family == 'band_offers':
+                continue
+            with self.tracer.span(family) as span:
+                first = len(self.row_names)
+                blocks = len(self.vals)
+                getattr(self, '_' + family)()
+                span.set(rows=len(self.row_names) - first,
+                         nonzeros=sum(len(v) for v in self.vals[blocks:]))
+
+    def update(self, model):
+        """ Update the offers and demand of an existing model in place.
+
+            Returns False, leaving the model untouched, if the topology or
+            the set of bands has changed and the model must be rebuilt.
+        """
+        if model.structure != self._structure():
+            return False
+        # Rows may be added to the model later on, see add_risk
+        self.start = dict((family, columns.start) for family, columns in
+                          model.col_slices.items())
+        with self.tracer.span('update_data') as span:
+            before = dict((kind, len(changes)) for kind, changes in
+                          model.changes.items())
+            self._apply_data(model)
+            model.presolve = self.presolve
+            span.set(**dict(('changed_' + kind,
+                             sum(len(c) for c in changes[before[kind]:]))
+                            for kind, changes in model.changes.items()))
+        return True
+
+    def _structure(self):
+        """ Everything which determines the rows, columns and sparsity
+            pattern of the model, in a form which may be compared directly
+        """
+        book = self.book
+        names = (book.energy_band_names, book.reserve_band_names,
+                 book.transmission_band_names, book.station_names,
+                 book.provider_names, book.branch_names, book.node_names,
+                 book.zone_names)
+        indices = (book.node_zone, book.station_node, book.station_risk,
+                   book.provider_station, book.provider_node,
+                   book.energy_band_station, book.reserve_band_provider,
+                   book.transmission_band_branch, book.branch_from,
+                   book.branch_to, book.branch_risk,
+                   np.sort(self.risk_stations), np.sort(self.risk_branches))
+        return ((self.presolve is not None,) +
+                tuple(tuple(n) for n in names) +
+                tuple(i.tobytes() for i in indices))
+
+    def _apply_data(self, model):
+        """ Write the offer and demand dependent costs, row bounds and
+            matrix coefficients into the model, recording those which change
+        """
+        book = self.book
+        rows = model.data_rows
+        spinning = book.provider_station[:self.nspin]
+
+        cost = np.concatenate([book.energy_band_price,
+                               book.reserve_band_price])
+        model.update_cost(np.arange(len(cost)), cost)
+
+        demand = -book.node_demand
+        tbm = book.transmission_band_capacity
+        ttm = book.branch_capacity
+
+        # Families absent from the formulation have no data rows
+        lower = (('demand', demand),
+                 ('transmission_band_lower', -tbm),
+                 ('transmission_total_lower', -ttm))
+        upper = (('demand', demand),
+                 ('transmission_band_upper', tbm),
+                 ('transmission_total_upper', ttm),
+                 ('combined', book.station_capacity[spinning]))
+
+        quantity = np.concatenate([book.energy_band_quantity,
+                                   book.reserve_band_quantity])
+        if self.presolve is None:
+            bands = len(book.energy_band_names)
+            upper += (('energy_band', quantity[:bands]),
+                      ('reserve_band', quantity[bands:]))
+        else:
+            model.update_bounds(np.arange(len(quantity)), quantity)
+
+        for key, values in lower:
+            if key in rows:
+                model.update_rows(rows[key], lower=values)
+        for key, values in upper:
+            if key in rows:
+                model.update_rows(rows[key], upper=values)
+
+        proportions = -book.reserve_band_proportion[:self.nspin_bands]
+        model.update_entries(model.proportion_entries, proportions)
+
+    def _entry_positions(self, A, rows, cols):
+        """ Positions in A.data of the given entries of a sorted CSR matrix
+
+            With sorted indices the entries are ordered by their linear
+            index row * ncols + col, so each may be found by bisection.
+        """
+        ncols = np.int64(A.shape[1])
+        entry_rows = np.repeat(np.arange(A.shape[0], dtype=np.int64),
+                               np.diff(A.indptr))
+        keys = entry_rows * ncols + A.indices
+        return np.searchsorted(keys, np.asarray(rows, dtype=np.int64) * ncols +
+                               np.asarray(cols, dtype=np.int64))
+
+    def _setup_columns(self):
+        """ Lay out the variables in the same families as the pulp model """
+        book = self.book
+        self.col_names = []
+        self.col_slices = {}
+        self.col_elements = {}
+        self.start = {}
+        lower = []
+        start = 0
+        for family, attribute, low in self.columns:
+            elements = getattr(book, attribute)
+            end = start + len(elements)
+            self.col_slices[family] = slice(start, end)
+            self.col_elements[family] = list(elements)
+            self.start[family] = start
+            self.col_names.extend(['_'.join([family, str(e)])
+                                   for e in elements])
+            lower.append(np.zeros(len(elements)) if low == 0 else
+                         np.repeat(-np.inf, len(elements)))
+            start = end
+
+        self.col_lower = np.concatenate(lower) if lower else np.zeros(0)
+        self.col_upper = np.repeat(np.inf, start)
+
+    def _name(self, name):
+        """ Name a constraint, unnamed constraints follow the pulp scheme """
+        if name is None:
+            self.unnamed += 1
+            return "_C%d" % self.unnamed
+        return name
+
+    def _add_block(self, names, lower, upper, row_offsets, cols, vals,
+                   family, elements):
+        """ Add a block of constraints.
+
+            row_offsets gives, for each entry, the row within the block,
+            cols and vals the column index and coefficient of each entry.
+            family gives the name of the family of every row, or an array of
+            family codes, and elements the element index of each row.
+            Returns the index of the first row of the block.
+        """
+        first = len(self.row_names)
+        if isinstance(family, str):
+            family = np.repeat(FAMILY[family], len(names))
+        self.row_family.append(np.asarray(family))
+        self.row_element.append(np.asarray(elements))
+        self.row_names.extend([self._name(n) for n in names])
+        self.row_lower.append(np.asarray(lower, dtype=float))
+        self.row_upper.append(np.asarray(upper, dtype=float))
+        self.rows.append(np.concatenate(row_offsets).astype(int) + first)
+        self.cols.append(np.concatenate(cols).astype(int))
+        self.vals.append(np.concatenate(vals).astype(float))
+        return first
+
+    def _nodal_dispatch(self):
+        """ Nodal energy price and nodal transmission balance, two rows
+            per node:
+                inject - sum(energy_total) == -demand
+                inject - sum(direction * transmission_total) == 0
+            where the direction of a branch is 1 at its sending node and -1
+            at its receiving node.
+        """
+        book = self.book
+        nn = len(book.node_names)
+        ns = len(book.station_names)
+        nt = len(book.branch_names)
+        inj = self.start["Nodal_Inject"] + np.arange(nn)
+        eto = self.start["Energy_Total"] + np.arange(ns)
+        tto = self.start["Transmission_Total"] + np.arange(nt)
+
+        names = []
+        for n in book.node_names:
+            names.append('_'.join([n, 'Energy_Price']))
+            names.append('_'.join([n, 'Nodal_Transmission']))
+
+        offsets = (2 * np.arange(nn), 2 * book.station_node,
+                   2 * np.arange(nn) + 1, 2 * book.branch_from + 1,
+                   2 * book.branch_to + 1)
+        cols = (inj, eto, inj, tto, tto)
+        vals = (np.ones(nn), -np.ones(ns), np.ones(nn), -np.ones(nt),
+                np.ones(nt))
+
+        zeros = np.zeros(len(names))
+        family = np.tile([FAMILY['energy_price'],
+                          FAMILY['nodal_transmission']], nn)
+        first = self._add_block(names, zeros, zeros, offsets, cols, vals,
+                                family, np.repeat(np.arange(nn), 2))
+        self.data_rows['demand'] = first + 2 * np.arange(nn)
+        self.energy_price_rows = self.data_rows['demand']
+
+    def _band_offers(self):
+        """ Individual energy and reserve band offer limits """
+        book = self.book
+        for column, bands, suffix, key in (
+                ("Energy_Band", book.energy_band_names, 'Band_Energy',
+                 'energy_band'),
+                ("Reserve_Band", book.reserve_band_names, 'Band_Reserve',
+                 'reserve_band')):
+            nb = len(bands)
+            first = self._add_block(['_'.join([b, suffix]) for b in bands],
+                                    np.repeat(-np.inf, nb), np.zeros(nb),
+                                    (np.arange(nb),),
+                                    (np.arange(nb) + self.start[column],),
+                                    (np.ones(nb),), key, np.arange(nb))
+            self.data_rows[key] = first + np.arange(nb)
+
+    def _transmission_bands(self):
+        """ Transmission band limits in both directions, interleaved """
+        nb = len(self.book.transmission_band_names)
+
+        lower = np.zeros(2 * nb)
+        upper = np.zeros(2 * nb)
+        lower[0::2] = -np.inf
+        upper[1::2] = np.inf
+
+        first = self._add_block([None] * (2 * nb), lower, upper,
+                                (np.arange(2 * nb),),
+                                (np.repeat(np.arange(nb), 2) +
+                                 self.start["Transmission_Band"],),
+                                (np.ones(2 * nb),), 'transmission_band',
+                                np.repeat(np.arange(nb), 2))
+        self.data_rows['transmission_band_upper'] = first + 2 * np.arange(nb)
+        self.data_rows['transmission_band_lower'] = first + 2 * np.arange(nb) + 1
+
+    def _total_offers(self):
+        """ Energy and reserve totals, sum(bands) - total == 0 """
+        book = self.book
+        for band_family, total_family, totals, owner, suffix, family in (
+                ("Energy_Band", "Energy_Total", book.station_names,
+                 book.energy_band_station, 'Total_Energy', 'energy_total'),
+                ("Reserve_Band", "Reserve_Total", book.provider_names,
+                 book.reserve_band_provider, 'Total_Reserve',
+                 'reserve_total')):
+            nb = len(owner)
+            nt = len(totals)
+            self._add_block(['_'.join([i, suffix]) for i in totals],
+                            np.zeros(nt), np.zeros(nt),
+                            (owner, np.arange(nt)),
+                            (self.start[band_family] + np.arange(nb),
+                             self.start[total_family] + np.arange(nt)),
+                            (np.ones(nb), -np.ones(nt)), family,
+                            np.arange(nt))
+
+    def _transmission_totals(self):
+        """ Transmission totals, three rows per branch:
+                sum(bands) - total == 0
+                total <= capacity
+                total >= -capacity
+        """
+        book = self.book
+        nb = len(book.transmission_band_names)
+        nt = len(book.branch_names)
+        tto = self.start["Transmission_Total"] + np.arange(nt)
+
+        lower = np.tile([0., -np.inf, 0.], nt)
+        upper = np.tile([0., 0., np.inf], nt)
+        offsets = (3 * book.transmission_band_branch, 3 * np.arange(nt),
+                   3 * np.arange(nt) + 1, 3 * np.arange(nt) + 2)
+        cols = (self.start["Transmission_Band"] + np.arange(nb), tto, tto, tto)
+        vals = (np.ones(nb), -np.ones(nt), np.ones(nt), np.ones(nt))
+
+        family = np.tile([FAMILY['transmission_total'],
+                          FAMILY['transmission_limit'],
+                          FAMILY['transmission_limit']], nt)
+        first = self._add_block([None] * (3 * nt), lower, upper,
+                                offsets, cols, vals, family,
+                                np.repeat(np.arange(nt), 3))
+        self.data_rows['transmission_total_upper'] = first + 3 * np.arange(nt) + 1
+        self.data_rows['transmission_total_lower'] = first + 3 * np.arange(nt) + 2
+
+    def _spinning_reserve(self):
+        """ Combined energy and reserve dispatch limits followed by the
+            reserve proportionality constraints for each spinning station
+
+            Spinning station k is preceded by the combined row and bands of
+            the k stations before it, its own band j (a position in the
+            reserve bands) therefore lies in row j + k + 1.
+        """
+        book = self.book
+        nspin = self.nspin
+        nbands = self.nspin_bands
+        stations = book.provider_station[:nspin]
+        owner = book.reserve_band_provider[:nbands]
+
+        combined = np.arange(nspin) + book.provider_band_ptr[:nspin]
+        prop = np.arange(nbands) + owner + 1
+
+        names = np.empty(nspin + nbands, dtype=object)
+        names[combined] = ['_'.join([book.station_names[i],
+                                     'Combined_Dispatch']) for i in stations]
+        names[prop] = ['_'.join([j, 'Prop']) for j in
+                       book.reserve_band_names[:nbands]]
+
+        eto = self.start["Energy_Total"]
+        offsets = (combined, combined, prop, prop)
+        cols = (self.start["Reserve_Total"] + np.arange(nspin),
+                eto + stations,
+                self.start["Reserve_Band"] + np.arange(nbands),
+                eto + stations[owner])
+        vals = (np.ones(nspin), np.ones(nspin), np.ones(nbands),
+                np.zeros(nbands))
+
+        nr = len(names)
+        family = np.empty(nr, dtype=np.int8)
+        family[combined] = FAMILY['combined_dispatch']
+        family[prop] = FAMILY['proportion']
+        elements = np.empty(nr, dtype=int)
+        elements[combined] = stations
+        elements[prop] = np.arange(nbands)
+        first = self._add_block(names.tolist(), np.repeat(-np.inf, nr),
+                                np.zeros(nr), offsets, cols, vals,
+                                family, elements)
+        self.data_rows['combined'] = first + combined
+        self.prop_rows = first + prop
+        self.prop_cols = eto + stations[owner]
+
+    def _risk(self):
+        """ Reserve zone risk, risk - energy_total >= 0 for each risk
+            setting generator and risk - direction * flow >= 0 for each
+            risk setting branch, where the direction of a branch is -1 in
+            the zone of its sending node and 1 in that of its receiving node.
+
+            Within each zone the generators come first, then the branches.
+        """
+        self._add_block(*self._risk_block(self.risk_stations,
+                                          self.risk_branches))
+
+    def add_risk(self, model, stations, branches):
+        """ Append the risk rows of further risk setting stations and
+            branches to a built model
+        """
+        names, lower, upper, offsets, cols, vals, family, elements = \
+            self._risk_block(stations, branches)
+        A = sp.coo_matrix((np.concatenate(vals),
+                           (np.concatenate(offsets), np.concatenate(cols))),
+                          shape=(len(names), model.shape[1])).tocsr()
+        model.add_rows(A, lower, upper, names, family, elements)
+        self.risk_stations = np.concatenate([self.risk_stations, stations])
+        self.risk_branches = np.concatenate([self.risk_branches, branches])
+        model.structure = self._structure()
+
+    def _risk_block(self, gens, branches):
+        """ Arguments to _add_block for the risk rows of the given
+            stations and branches
+        """
+        book = self.book
+        ng = len(gens)
+        nt = len(branches)
+
+        zone = np.concatenate([book.station_zone[gens],
+                               book.node_zone[book.branch_from[branches]],
+                               book.node_zone[book.branch_to[branches]]])
+        kind = np.concatenate([np.zeros(ng), np.ones(2 * nt)])
+        sequence = np.concatenate([gens, 2 * branches, 2 * branches + 1])
+        cols = np.concatenate([self.start["Energy_Total"] + gens,
+                               self.start["Transmission_Total"] + branches,
+                               self.start["Transmission_Total"] + branches])
+        vals = np.concatenate([-np.ones(ng), np.ones(nt), -np.ones(nt)])
+        elements = ([book.station_names[i] for i in gens] +
+                    [book.branch_names[t] for t in branches] * 2)
+
+        order = np.lexsort((sequence, kind, zone))
+        zone = zone[order]
+        names = ['_'.join([book.zone_names[z], elements[e]]) for z, e in
+                 zip(zone, order)]
+
+        family = np.concatenate([np.repeat(FAMILY['generator_risk'], ng),
+                                 np.repeat(FAMILY['branch_risk'], 2 * nt)])
+        setter = np.concatenate([gens, branches, branches])
+
+        nr = len(names)
+        return (names, np.zeros(nr), np.repeat(np.inf, nr),
+                (np.arange(nr), np.arange(nr)),
+                (self.start["Risk"] + zone, cols[order]),
+                (np.ones(nr), vals[order]), family[order], setter[order])
+
+    def _reserve_dispatch(self):
+        """ Reserve zone price, sum(reserve_total) - risk >= 0 """
+        book = self.book
+        nr = len(book.zone_names)
+        nproviders = len(book.provider_names)
+
+        first = self._add_block(['_'.join([r, 'Reserve_Price']) for r in
+                                 book.zone_names],
+                                np.zeros(nr), np.repeat(np.inf, nr),
+                                (book.provider_zone, np.arange(nr)),
+                                (self.start["Reserve_Total"] +
+                                 np.arange(nproviders),
+                                 self.start["Risk"] + np.arange(nr)),
+                                (np.ones(nproviders), -np.ones(nr)),
+                                'reserve_price', np.arange(nr))
+        self.reserve_price_rows = first + np.arange(nr)
+
+
+def _assign(target, index, values, changed):
+    """ Assign values to target[index], noting the indices changed """
+    values = np.asarray(values, dtype=float)
+    diff = target[index] != values
+    if diff.any():
+        target[index[diff]] = values[diff]
+        changed.append(index[diff])
+
+
+if __name__ == '__main__':
+    pass
@@ -0,0 +1,205 @@
+"""
+Merit
+-----
+
+Clear the dispatch by merit order, sorting the energy bands by price and
+stacking them against the demand, in place of solving the linear program
+when doing so gives exactly the same solution.
+
+This is the case when:
+
+    no station or branch sets a reserve risk, so that no reserve is
+    dispatched and every reserve price is zero
+    no reserve band has a negative price
+    the network is a forest, so that the branch flows are fixed by the
+    nodal injections
+    within each island the demand is positive and falls strictly within a
+    band whose price no other band of the island shares, so that the price
+    and dispatch are unique
+    no branch flow reaches its capacity and no spinning station is
+    dispatched to its capacity
+
+clear returns None whenever any of these fail, and the linear program must
+be solved instead.
+
+Each island clears at the price of its marginal band. Dual values are
+returned for every row of the model in the matrix row order: the price rows,
+the band limits of the bands dispatched below the price and the energy
+totals. Where the duals of the linear program are not unique, e.g. the total
+row of a station which is not dispatched, the values given are one of the
+equally optimal solutions and may differ from those a solver picks. Risk is
+zero.
+"""
+import numpy as np
+import scipy.sparse as sp
+from scipy.sparse.csgraph import connected_components, dijkstra
+
+from matrix import FAMILY
+
+
+def clear(book, row_family, row_element, tolerance=1e-9):
+    """ Clear the offer book by merit order.
+
+        row_family, row_element : index of the rows of the model, see
+                                  MatrixBuilder.row_index
+
+        Returns None if the merit order is not exact, otherwise a dictionary
+        of the values gathered by LPSolver (prices, dispatch, flows, duals...)
+        along with the objective.
+    """
+    if book.station_risk.any() or book.branch_risk.any():
+        return None
+    if (book.reserve_band_price < 0).any():
+        return None
+
+    nn = len(book.node_names)
+    islands, label, graph = _islands(book)
+    if islands is None:
+        return None
+
+    demand = np.bincount(label, weights=book.node_demand, minlength=islands)
+    if (demand <= tolerance).any():
+        return None
+
+    cleared = _stack(book, label[book.energy_band_node], demand, islands,
+                     tolerance)
+    if cleared is None:
+        return None
+    price, bands = cleared
+
+    stations = np.bincount(book.energy_band_station, weights=bands,
+                           minlength=len(book.station_names))
+    spinning = book.station_spinning
+    if (stations[spinning] >= book.station_capacity[spinning] -
+            tolerance).any():
+        return None
+
+    injection = (np.bincount(book.station_node, weights=stations,
+                             minlength=nn) - book.node_demand)
+    flows = _tree_flows(book, graph, label, islands, injection)
+    if (np.abs(flows) >= book.branch_capacity - tolerance).any():
+        return None
+
+    node_price = price[label]
+    duals = np.zeros(len(row_family))
+    rows = row_family == FAMILY['energy_price']
+    duals[rows] = -node_price[row_element[rows]]
+    rows = row_family == FAMILY['nodal_transmission']
+    duals[rows] = node_price[row_element[rows]]
+    rows = row_family == FAMILY['energy_band']
+    band = row_element[rows]
+    duals[rows] = np.minimum(book.energy_band_price[band] -
+                             node_price[book.energy_band_node[band]], 0.)
+    rows = row_family == FAMILY['energy_total']
+    duals[rows] = node_price[book.station_node[row_element[rows]]]
+
+    zones = len(book.zone_names)
+    return {'prices': node_price,
+            'reserve_prices': np.zeros(zones),
+            'risk': np.zeros(zones),
+            'energy_dispatch': stations,
+            'reserve_dispatch': np.zeros(len(book.provider_names)),
+            'flows': flows,
+            'duals': duals,
+            'row_family': row_family,
+            'row_element': row_element,
+            'objective': float(np.dot(bands, book.energy_band_price))}
+
+
+def _islands(book):
+    """ Number of islands, the island of each node and the network as a
+        sparse graph, or None if the network is not a forest
+    """
+    nn = len(book.node_names)
+    nb = len(book.branch_names)
+    graph = sp.coo_matrix((np.arange(1, nb + 1), (book.branch_from,
+                                                  book.branch_to)),
+                          shape=(nn, nn)).tocsr()
+    islands, label = connected_components(graph, directed=False)
+    # A graph of n nodes in c components is a forest with n - c edges
+    if nb != nn - islands:
+        return None, None, None
+    return islands, label, graph
+
+
+def _stack(book, island, demand, islands, tolerance):
+    """ Stack the bands of each island in price order against its demand.
+
+        Returns the price of each island and the dispatch of each band, or
+        None if the demand leaves the price or dispatch of an island
+        ambiguous or cannot be met.
+    """
+    offered = np.flatnonzero(book.energy_band_quantity > tolerance)
+    price = book.energy_band_price[offered]
+    order = offered[np.lexsort((price, island[offered]))]
+
+    quantity = book.energy_band_quantity[order]
+    owner = island[order]
+    price = book.energy_band_price[order]
+    total = np.concatenate([[0.], np.cumsum(quantity)])
+
+    first = np.searchsorted(owner, np.arange(islands), side='left')
+    last = np.searchsorted(owner, np.arange(islands), side='right')
+    target = total[first] + demand
+    if (total[last] <= target + tolerance).any():
+        return None
+
+    # The marginal band of each island is part dispatched
+    marginal = np.searchsorted(total[1:], target, side='left')
+    if (total[marginal + 1] - target <= tolerance).any():
+        return None
+    if (total[marginal] - target >= -tolerance).any():
+        return None
+
+    clearing = price[marginal]
+    below = marginal > first
+    if (np.abs(price[marginal - 1] - clearing) <= tolerance)[below].any():
+        return None
+    above = marginal + 1 < last
+    after = np.minimum(marginal + 1, len(price) - 1)
+    if (np.abs(price[after] - clearing) <= tolerance)[above].any():
+        return None
+
+    bands = np.zeros(len(book.energy_band_names))
+    bands[order] = np.clip(target[owner] - total[:-1], 0., quantity)
+    return clearing, bands
+
+
+def _tree_flows(book, graph, label, islands, injection):
+    """ Branch flows of a forest, the flow on the branch from each node to
+        its parent carrying the net injection of the subtree below the node
+    """
+    nn = len(book.node_names)
+    flows = np.zeros(len(book.branch_names))
+    if not len(flows):
+        return flows
+
+    depth = np.zeros(nn, dtype=int)
+    parent = np.repeat(-1, nn)
+    roots = np.unique(label, return_index=True)[1]
+    sizes = np.bincount(label, minlength=islands)
+    for root in roots[sizes[label[roots]] > 1]:
+        distance, predecessor = dijkstra(graph, directed=False,
+                                         indices=root, unweighted=True,
+                                         return_predecessors=True)
+        nodes = np.flatnonzero(label == label[root])
+        depth[nodes] = distance[nodes].astype(int)
+        parent[nodes] = predecessor[nodes]
+
+    # Accumulate the injections up the trees, deepest nodes first
+    subtree = injection.astype(float)
+    children = np.flatnonzero(parent >= 0)
+    levels = children[np.argsort(-depth[children], kind='mergesort')]
+    bounds = np.flatnonzero(np.diff(depth[levels])) + 1
+    for level in np.split(levels, bounds):
+        np.add.at(subtree, parent[level], subtree[level])
+
+    symmetric = graph + graph.T
+    branch = np.asarray(symmetric[children, parent[children]]).ravel() - 1
+    sending = book.branch_from[branch] == children
+    flows[branch] = np.where(sending, subtree[children], -subtree[children])
+    return flows
+
+
+if __name__ == '__main__':
+    pass
@@ -1,6 +1,20 @@
+from __future__ import print_function
+import logging
 import pulp as lp
 import numpy as np
 import time
+from contextlib import contextmanager
+
+from matrix import MatrixBuilder, ELEMENT_NAMES
+from backends import get_backend, SolverResult
+from result import DispatchResult
+import merit
+import lazy
+from ptdf import PTDFBuilder
+from instrument import Tracer
+from cache import solve_key
+
+logger = logging.getLogger('pyspd')
 
 class LPSolver:
     """
@@ -27,6 +41,94 @@ class LPSolver:
 
     For ease of use these have been bundled together in a single function.
     
+    Results
+    -------
+    return_dispatch keeps the dispatch as arrays in result, a
+    result.DispatchResult ordered as the compiled ISO which may be exported
+    to Arrow or Parquet. With push=False the values are not passed to the
+    participant objects until push_dispatch is called.
+    
+    Build Modes
+    -----------
+    pulp : Construct every constraint as a pulp expression (default)
+    matrix : Compile the ISO directly into a sparse constraint matrix, see
+             matrix.MatrixBuilder. The resulting model is identical.
+    
+    Backends
+    --------
+    coin : Solve the pulp problem with COIN_CMD in a subprocess (default)
+    highs : Solve the matrices in process with HiGHS through highspy
+    scipy : Solve the matrices in process with scipy.optimize.linprog
+    
+    Any object following the backends.py interface may also be passed.
+    In process backends always use the matrix build mode.
+    
+    Persistent Models
+    -----------------
+    In the matrix build mode the compiled model is kept between calls to
+    setup_lp. If the topology and band sets of the (re)compiled ISO are
+    unchanged only the offer and demand data of the model is updated, and
+    the HiGHS backend applies just those changes and warm starts from the
+    previous basis. The ISO attribute may be pointed at a new ISO between
+    trading periods.
+    
+    Tracing
+    -------
+    Each phase (setup_lp, solve_lp, return_dispatch) and the steps within it
+    are timed as spans of tracer, an instrument.Tracer which defaults to
+    that of the ISO. Add a sink to it to record them, see instrument.py.
+    A non optimal solution is logged as a warning to the 'pyspd' logger.
+    
+    Merit Order
+    -----------
+    With merit_order=True full_setup_and_solve first checks
+    whether sorting the energy bands by price and stacking them against the
+    demand gives exactly the solution of the linear program (no reserve
+    risk, a forest network, no branch or spinning station at its limit, see
+    merit.py). If so the dispatch is cleared that way without setting up
+    or solving the linear program, otherwise the linear program is solved
+    as usual. path records which was used, 'merit_order' or 'lp', as does
+    the result. The model, solution and lp attributes are only set up when
+    the linear program is solved.
+    
+    Presolve
+    --------
+    With presolve=True (which implies the matrix build mode) bands offering
+    nothing are dropped and bands of the same owner and price merged before
+    the model is built, the band limits becoming bounds of the band
+    variables (see presolve.py). What was removed is reported by model.presolve.report and
+    the span 'presolve'. band_dispatch maps the dispatch back to the bands
+    of the offer book, the rows of the result and their duals are those of
+    the reduced model.
+    
+    Lazy Risk
+    ---------
+    With lazy_risk=k (which implies the matrix build mode) the model is
+    built with the risk rows of only the k risk setting stations and k
+    branches of each zone with the most capacity. solve_lp then adds the
+    rows of those whose dispatch exceeds the risk of their zone and solves
+    again until none do, see lazy.py. lazy_iterations counts the solves.
+    The rows added are kept for the following trading periods.
+    
+    Network Formulations
+    --------------------
+    transport : flows are free to take any path within the branch
+                capacities (default)
+    ptdf : DC flows following the branch reactances, with the branch limits
+           added only once flows exceed or come near them, see ptdf.py
+           (implies the matrix build mode). lazy_iterations counts the
+           solves.
+    
+    Solve Cache
+    -----------
+    With cache, a cache.SolveCache, full_setup_and_solve keys each solve by
+    the fingerprint of the offer book, the options of the solver and the
+    settings of its backend (e.g. HiGHS options or the linprog method). The
+    result of an identical earlier solve is taken from the cache without
+    setting up or solving the linear program, path is then 'cache' while
+    the result keeps the path by which it was found. The model, solution
+    and lp attributes are left as they were.
+    
     Usage Flags (Not currently implemented)
     -----------
     reserve : Specify whether it is desirable to constraint the dispatch
@@ -39,21 +141,116 @@ class LPSolver:
     losses : Whether the loss constraints should be binding.
     """
     
-    def __init__(self, ISO):
+    def __init__(self, ISO, build='pulp', backend='coin', tracer=None,
+                 push=True, merit_order=False, presolve=False,
+                 lazy_risk=None, network='transport', cache=None):
         self.ISO = ISO
+        self.build = build
+        self.backend = get_backend(backend)
+        if (self.backend.in_process or presolve or lazy_risk is not None or
+                network == 'ptdf'):
+            self.build = 'matrix'
+        self.model = None
+        self.tracer = tracer or ISO.tracer
+        self.push = push
+        self.merit_order = merit_order
+        self.presolve = presolve
+        self.lazy_risk = lazy_risk
+        self.network = network
+        self.cache = cache
+        self.lazy_iterations = 0
+        self.path = None
+        self._rows = None
         
         
     def full_setup_and_solve(self, reserve=True, proportion=True,
                              combined=True, transmission=True):
                              
+        if self.cache is not None:
+            key = self.cache_key()
+            if self.clear_cache(key):
+                return
+                
+        if self.merit_order and self.clear_merit_order():
+            self.return_dispatch()
+        else:
+            begin = time.time()
+            self.setup_lp(reserve=reserve, proportion=proportion,
+                          combined=combined, transmission=transmission)
+            self.setup_time = time.time() - begin
+            
+            self.solve_lp()
+            self.return_dispatch()
+            
+        if self.cache is not None and self.status == 1:
+            self.cache.put(key, self.result)
+            
+    def cache_key(self):
+        """ Key of the solve of the compiled ISO in the solve cache """
+        return solve_key(self.ISO.offer_book, self.build,
+                         self.backend.__class__.__name__,
+                         self.backend.settings(), self.merit_order,
+                         self.presolve, self.lazy_risk, self.network)
+        
+    def clear_cache(self, key):
+        """ Take the dispatch from the solve cache if it holds the key,
+            returning whether it did. The dispatch is passed to the
+            participant objects as by return_dispatch.
+        """
         begin = time.time()
-        self.setup_lp(reserve=reserve, proportion=proportion,
-                      combined=combined, transmission=transmission)
-        self.setup_time = time.time() - begin
-        
-        self.solve_lp()
-        self.return_dispatch()
+        with self.tracer.span('solve_cache') as span:
+            result = self.cache.get(key)
+            span.set(hit=result is not None)
+            if result is None:
+                return False
+                
+            self.path = 'cache'
+            self.result = result
+            self.objective = result.objective
+            self.status = result.status
+            self.setup_time = 0.
+            self.solution_time = 0.
+            self._log_duals()
+            if self.push:
+                self._setup_handles()
+                self.push_dispatch()
+        self.dispatch_time = time.time() - begin
+        return True
     
+    def clear_merit_order(self):
+        """ Clear the dispatch by merit order if it is exact (see merit.py),
+            returning whether it was. The dispatch is then returned with
+            return_dispatch as for the linear program.
+        """
+        begin = time.time()
+        with self.tracer.span('merit_order') as span:
+            names, family, element = self._row_index()
+            values = merit.clear(self.ISO.offer_book, family, element)
+            span.set(cleared=values is not None)
+        if values is None:
+            return False
+            
+        self.path = 'merit_order'
+        self.status = 1
+        self.objective = values.pop('objective')
+        values['row_names'] = names
+        self.merit_values = values
+        self._setup_handles()
+        self.setup_time = 0.
+        self.solution_time = time.time() - begin
+        return True
+        
+    def _row_index(self):
+        """ Names, family codes and element indices of the rows of the
+            model, kept while the structure of the ISO is unchanged
+        """
+        builder = MatrixBuilder(self.ISO, tracer=Tracer())
+        structure = builder._structure()
+        if self._rows is None or self._rows[0] != structure:
+            family, element = builder.row_index()
+            self._rows = (structure, builder.row_names, family, element)
+        return self._rows[1:]
+        
     def setup_lp(self, reserve=True, proportion=True, combined=True,
                  transmission=True):
         """ Set up the Linear Program by creating an objective function and 
@@ -63,6 +260,18 @@ class LPSolver:
         
         """
         
+        with self.tracer.span('setup_lp') as span:
+            if self.build == 'matrix':
+                self.setup_matrix()
+            else:
+                self.setup_pulp()
+            if self.tracer.enabled:
+                span.set(**self._size())
+            
+    def setup_pulp(self):
+        """ Set up the Linear Program by creating each constraint as a pulp
+            expression
+        """
         # Get the Constraints and lists for model creation simplification
         eb = self.ISO.energy_bands
         rb = self.ISO.reserve_bands
@@ -132,209 +341,477 @@ class LPSolver:
         self.lp.setObjective(SUM([ebo[i] * ebp[i] for i in eb]) +\
                              SUM([rbo[j] * rbp[j] for j in rb]))
                              
-        # Begin Adding Constraint
+        # Begin Adding Constraint, timing each family
+        family = self._pulp_family
         
         # Nodal Dispatch
-        for n in nd:
-            n1 = '_'.join([n, 'Energy_Price'])
-            n2 = '_'.join([n, 'Nodal_Transmission'])
-            addC(node_inj[n] == SUM([eto[i] for i in node_map[n]]) - demand[n], n1)
-            addC(node_inj[n] == SUM([tto[i] * td[n][i] for i in node_t_map[n]]), n2)
-        
-        # Individual Band Offer
-        for i in eb:
-            name = '_'.join([i, 'Band_Energy'])
-            addC(ebo[i] <= ebm[i], name)
-            
-        # Reserve Band Offer
-        for j in rb:
-            name = '_'.join([j, 'Band_Reserve'])
-            addC(rbo[j] <= rbm[j], name)
+        energy_price = []
+        with family('nodal_dispatch'):
+            for n in nd:
+                n1 = '_'.join([n, 'Energy_Price'])
+                n2 = '_'.join([n, 'Nodal_Transmission'])
+                price = node_inj[n] == SUM([eto[i] for i in node_map[n]]) - demand[n]
+                addC(price, n1)
+                addC(node_inj[n] == SUM([tto[i] * td[n][i] for i in node_t_map[n]]), n2)
+                energy_price.append(price)
+        
+        with family('band_offers'):
+            # Individual Band Offer
+            for i in eb:
+                name = '_'.join([i, 'Band_Energy'])
+                addC(ebo[i] <= ebm[i], name)
+                
+            # Reserve Band Offer
+            for j in rb:
+                name = '_'.join([j, 'Band_Reserve'])
+                addC(rbo[j] <= rbm[j], name)
             
         # Transmission band Offer
-        for t in tb:
-            addC(tbo[t] <= tbm[t])
-            addC(tbo[t] >= tbm[t] * -1)
-            
-        # Energy Total Offer
-        for i in et:
-            name = '_'.join([i, 'Total_Energy'])
-            addC(SUM([ebo[j] for j in ebmap[i]]) == eto[i], name)
-            
-        # Reserve Total Offer
-        for i in rt:
-            name = '_'.join([i, 'Total_Reserve'])
-            addC(SUM([rbo[j] for j in rbmap[i]]) == rto[i], name)
+        with family('transmission_bands'):
+            for t in tb:
+                addC(tbo[t] <= tbm[t])
+                addC(tbo[t] >= tbm[t] * -1)
+        
+        with family('total_offers'):
+            # Energy Total Offer
+            for i in et:
+                name = '_'.join([i, 'Total_Energy'])
+                addC(SUM([ebo[j] for j in ebmap[i]]) == eto[i], name)
+                
+            # Reserve Total Offer
+            for i in rt:
+                name = '_'.join([i, 'Total_Reserve'])
+                addC(SUM([rbo[j] for j in rbmap[i]]) == rto[i], name)
             
         # Transmission Total offer
-        for i in tt:
-            addC(SUM([tbo[j] for j in tbmap[i]]) == tto[i])
-            addC(tto[i] <= ttm[i])
-            addC(tto[i] >= ttm[i] * -1)
+        with family('transmission_totals'):
+            for i in tt:
+                addC(SUM([tbo[j] for j in tbmap[i]]) == tto[i])
+                addC(tto[i] <= ttm[i])
+                addC(tto[i] >= ttm[i] * -1)
             
         # Spinning Reserve Constraints
-        for i in spin:
-            name = '_'.join([i, 'Combined_Dispatch'])
-            addC(rto[i] + eto[i] <= etm[i], name)
-            
-            for j in spin_map[i]:
-                name = '_'.join([j, 'Prop'])
-                addC(rbo[j] <= rbpr[j] * eto[i], name)
+        with family('spinning_reserve'):
+            for i in spin:
+                name = '_'.join([i, 'Combined_Dispatch'])
+                addC(rto[i] + eto[i] <= etm[i], name)
+                
+                for j in spin_map[i]:
+                    name = '_'.join([j, 'Prop'])
+                    addC(rbo[j] <= rbpr[j] * eto[i], name)
                 
         
         # Risk Constraints
-        
-        for r in rzones:
-            # Generation Risk
-            for i in rzone_g[r]:
-                name = '_'.join([r, i])
-                addC(risk[r] >= eto[i], name)
-        
-            # Transmission Risk        
-            for t in rzone_t[r]:
-                name = '_'.join([r, t])
-                addC(risk[r] >= tto[t] * rztd[r][t], name)
+        with family('risk'):
+            for r in rzones:
+                # Generation Risk
+                for i in rzone_g[r]:
+                    name = '_'.join([r, i])
+                    addC(risk[r] >= eto[i], name)
+            
+                # Transmission Risk        
+                for t in rzone_t[r]:
+                    name = '_'.join([r, t])
+                    addC(risk[r] >= tto[t] * rztd[r][t], name)
                 
         # Reserve Dispatch
-        for r in rzones:
-            n1 = '_'.join([r, 'Reserve_Price'])
-            addC(SUM(rto[i] for i in rz_providers[r]) - risk[r] >= 0., n1)
+        reserve_price = []
+        with family('reserve_dispatch'):
+            for r in rzones:
+                n1 = '_'.join([r, 'Reserve_Price'])
+                price = SUM(rto[i] for i in rz_providers[r]) - risk[r] >= 0.
+                addC(price, n1)
+                reserve_price.append(price)
+            
+        # Keep the model elements in the same order as the handles
+        self.lp_handles = {'energy_price': energy_price,
+                           'reserve_price': reserve_price,
+                           'energy_dispatch': [eto[i] for i in et],
+                           'reserve_dispatch': [rto[i] for i in rt],
+                           'branch_flow': [tto[i] for i in tt],
+                           'risk': [risk[r] for r in rzones]}
+        self._setup_handles()
+        
+        # The rows are in the same order as those of the matrix build
+        self.row_index = self._row_index()[1:]
+        
+        
+    @contextmanager
+    def _pulp_family(self, name):
+        """ Time a family of pulp constraints, counting its rows and non
+            zeros
+        """
+        before = len(self.lp.constraints)
+        with self.tracer.span(name) as span:
+            yield
+            if self.tracer.enabled:
+                added = list(self.lp.constraints.values())[before:]
+                span.set(rows=len(added),
+                         nonzeros=sum(len(c) for c in added))
+        
+        
+    def _size(self):
+        """ Rows, columns and non zeros of the linear program """
+        if self.build == 'matrix':
+            rows, columns = self.model.shape
+            return {'rows': rows, 'columns': columns,
+                    'nonzeros': self.model.nnz}
+        return {'rows': len(self.lp.constraints),
+                'columns': self.lp.numVariables(),
+                'nonzeros': sum(len(c) for c in self.lp.constraints.values())}
+        
+        
+    def _setup_handles(self):
+        """ Map the elements of the model directly to the participant
+            objects which receive the dispatch, in the order of the ISO
+        """
+        self.handles = dispatch_handles(self.ISO)
         
         
+    def setup_matrix(self):
+        """ Set up the Linear Program by compiling the ISO into a sparse
+            constraint matrix, the pulp problem is only created from it
+            when it is to be solved by a pulp solver.
+            
+            An existing model is updated in place if its structure is
+            unchanged.
+        """
+        if self.network == 'ptdf':
+            builder = PTDFBuilder(self.ISO, tracer=self.tracer,
+                                  presolve=self.presolve,
+                                  risk=self._risk_rows(),
+                                  limits=self._limit_rows())
+        else:
+            builder = MatrixBuilder(self.ISO, tracer=self.tracer,
+                                    presolve=self.presolve,
+                                    risk=self._risk_rows())
+        if self.model is None or not builder.update(self.model):
+            self.model = builder.build()
+        self.builder = builder
+        if not self.backend.in_process:
+            with self.tracer.span('to_pulp'):
+                self.lp, self.lp_columns = self.model.to_pulp()
+        self._setup_handles()
+        
+        
+    def _risk_rows(self):
+        """ Stations and branches whose risk rows are built, all of them
+            unless lazy_risk is set
+        """
+        if self.lazy_risk is None:
+            return None
+        book = self.ISO.offer_book
+        stations, branches = lazy.risk_candidates(book, self.lazy_risk)
+        if self.model is not None:
+            # Keep the rows added in earlier periods, which still exist
+            kept = self.builder.risk_stations
+            stations = np.union1d(stations, kept[kept < len(book.station_risk)])
+            stations = stations[book.station_risk[stations]]
+            kept = self.builder.risk_branches
+            branches = np.union1d(branches, kept[kept < len(book.branch_risk)])
+            branches = branches[book.branch_risk[branches]]
+        return stations, branches
+        
+    def _limit_rows(self):
+        """ Branches whose limits are built in the ptdf network, those
+            added in earlier periods
+        """
+        if self.model is None:
+            return ()
+        kept = self.builder.limits
+        return kept[kept < len(self.ISO.offer_book.branch_names)]
+        
     def write_lp(self, name="Test.lp"):
         """ Write the linear program to a file """
-        self.lp.writeLP(name)
+        if self.backend.in_process:
+            self.model.to_pulp()[0].writeLP(name)
+        else:
+            self.lp.writeLP(name)
         
     def solve_lp(self):
         """ Solve the linear program, time it and return the written 
             linear program if a non-optimal solution is determined
         """
         begin = time.time()
-        self.lp.solve(lp.COIN_CMD())
+        self.backend.tracer = self.tracer
+        with self.tracer.span('solve_lp') as span:
+            self._solve()
+            if self.lazy_risk is not None or self.network == 'ptdf':
+                self._solve_lazy()
+                span.set(lazy_iterations=self.lazy_iterations)
+            span.set(status=self.status)
         solved = time.time() - begin
         self.solution_time = solved
-        if self.lp.status is not 1:
-            print "LP Status is:", lp.LpStatus[self.lp.status]
-            print "Dumping LP"
+        self.path = 'lp'
+        if self.status != 1:
+            logger.warning("LP Status is: %s, objective function value is: "
+                           "%s. Dumping LP to Infeasiable_LP_Debug.lp",
+                           lp.LpStatus[self.status], self.objective)
             self.write_lp(name="Infeasiable_LP_Debug.lp")
-            print 'Objective function value is:', lp.value(self.lp.objective)
+            
+    def _solve(self):
+        """ Solve the model once with the backend """
+        if self.backend.in_process:
+            self.solution = self.backend.solve(self.model)
+            self.status = self.solution.status
+            self.objective = self.solution.objective
+        else:
+            self.status = self.backend.solve(self.lp)
+            self.objective = lp.value(self.lp.objective)
+            if self.build == 'matrix':
+                with self.tracer.span('read'):
+                    self.solution = SolverResult(self.status,
+                        np.array([v.varValue for v in self.lp_columns],
+                                 float),
+                        np.array([c.pi for c in
+                                  self.lp.constraints.values()], float),
+                        self.objective)
+                        
+    def _solve_lazy(self):
+        """ Add the rows violated by the solution, the risk rows of
+            lazy_risk and the branch limits of the ptdf network, and solve
+            again until there are none
+        """
+        builder = self.builder
+        cols = self.model.col_slices
+        none = np.zeros(0, dtype=int)
+        self.lazy_iterations = 1
+        while self.status == 1:
+            x = self.solution.x
+            flows = self._flows(x)
+            stations, branches, limits = none, none, none
+            if self.lazy_risk is not None:
+                stations, branches = lazy.risk_violations(
+                    builder.book, x[cols['Energy_Total']], flows,
+                    x[cols['Risk']], builder.risk_stations,
+                    builder.risk_branches)
+            if self.network == 'ptdf':
+                limits = builder.limit_violations(flows)
+            if not (len(stations) or len(branches) or len(limits)):
+                break
+            with self.tracer.span('add_rows', stations=len(stations),
+                                  branches=len(branches),
+                                  limits=len(limits)):
+                if len(stations) or len(branches):
+                    builder.add_risk(self.model, stations, branches)
+                if len(limits):
+                    builder.add_limits(self.model, limits)
+                if not self.backend.in_process:
+                    self.lp, self.lp_columns = self.model.to_pulp()
+            self._solve()
+            self.lazy_iterations += 1
+            
+    def _flows(self, x):
+        """ Branch flows of a solution of the matrix model """
+        if self.network == 'ptdf':
+            return self.builder.flows(self.model, x)
+        return x[self.model.col_slices['Transmission_Total']]
         
         
     def get_values(self):
         """ Print all variables and values """
-        for val in self.lp.variables():
-            print val, val.varValue
+        for name, value in self._variable_values():
+            print(name, value)
             
             
     def get_shadow_values(self):
         """ Print all shadow value constraints and values """
-        for n in self.lp.constraints:
-            try:
-                print n, self.lp.constraints[n].pi
-            except:
-                print n, 0.
+        for n, pi in self._constraint_duals():
+            print(n, pi if pi is not None else 0.)
         
     def get_prices(self):
         """ Print all prices (energy and reserve) """
-        for n in self.lp.constraints:
+        for n, pi in self._constraint_duals():
             if "Price" in n:
-                try:
-                    print n, self.lp.constraints[n].pi
-                except:
-                    print n, "no value"
+                print(n, pi if pi is not None else "no value")
                     
                     
-    def return_dispatch(self):
-        """ Return the entire dispatch from the solved linear program """
+    def return_dispatch(self, push=None):
+        """ Return the entire dispatch from the solved linear program
+        
+            The values are gathered directly from the model elements kept
+            during setup, as vectors in the matrix build mode, into a
+            DispatchResult (see result.py) held as result. They are then
+            passed to the participant objects if push is True, by default
+            as set on creation, otherwise push_dispatch may be called later.
+        """
         begin = time.time()
-        self._energy_prices()
-        self._reserve_prices()
-        self._energy_dispatch()
-        self._reserve_dispatch()
-        self._branch_flow()
-        self._log_duals()
-        self._risk_dispatch()
+        if push is None:
+            push = self.push
+        span = self.tracer.span
+        with span('return_dispatch'):
+            with span('gather'):
+                if self.path == 'merit_order':
+                    values = dict(self.merit_values)
+                elif self.build == 'matrix':
+                    values = self._gather_matrix()
+                else:
+                    values = self._gather_pulp()
+                ISO = self.ISO
+                book = ISO.offer_book
+                if self.path == 'lp' and self.build == 'matrix' and \
+                        self.model.presolve is not None:
+                    book = self.model.presolve.reduced
+                names = {'nodes': ISO.all_nodes,
+                         'zones': ISO.reserve_zone_names,
+                         'stations': ISO.energy_totals,
+                         'providers': ISO.reserve_totals,
+                         'branches': ISO.transmission_totals,
+                         'rows': values.pop('row_names'),
+                         'elements': dict((kind, getattr(book, a))
+                                          for kind, a in
+                                          ELEMENT_NAMES.items())}
+                self.result = DispatchResult(names, values, self.objective,
+                                             self.status, self.path)
+            with span('log_duals') as s:
+                self._log_duals()
+                s.set(duals=len(self.duals))
+            if push:
+                self.push_dispatch()
         self.dispatch_time = time.time() - begin
         
+    def band_dispatch(self):
+        """ Dispatch of each energy and reserve band of the offer book,
+            from the solution of the matrix model. The dispatch of merged
+            bands is split in proportion to their offers.
+        """
+        x = self.solution.x
+        cols = self.model.col_slices
+        energy = x[cols['Energy_Band']]
+        reserve = x[cols['Reserve_Band']]
+        presolve = self.model.presolve
+        if presolve is None:
+            return energy, reserve
+        return presolve.expand_energy(energy), presolve.expand_reserve(reserve)
+        
+    def push_dispatch(self):
+        """ Pass the values of the last result to the participant objects """
+        push_result(self.ISO, self.result, self.handles, self.tracer)
+        
     def print_time(self):
         """ Print the model run timings """
-        print "Model created in %0.3f ms" % float(self.setup_time * 1000)
-        print "Model solved in %0.3f ms" % float(self.solution_time * 1000)
-        print "Model post process in %0.3f ms" % float(self.dispatch_time * 1000)
+        print("Model created in %0.3f ms" % float(self.setup_time * 1000))
+        print("Model solved in %0.3f ms" % float(self.solution_time * 1000))
+        print("Model post process in %0.3f ms" % float(self.dispatch_time * 1000))
         
                     
 
-    def _energy_prices(self):
-        """ Will return the energy prices to the respective nodes """
-        # Get the energy prices
-        prices = {n.split('_')[0]: -1* self.lp.constraints[n].pi 
-                    for n in self.lp.constraints if 'Energy_Price' in n}
-                               
-        # Add tonode  
-        for node in prices:
-            self.ISO.node_name_map[node].add_price(prices[node])
-            
-            
-    def _reserve_prices(self):
-        """ Will return the reserve prices to the respective reserve zones """
-        prices = {n.split('_')[0]: self.lp.constraints[n].pi
-                    for n in self.lp.constraints if 'Reserve_Price' in n}
-                
-        # Add to Reserve Zone
-        for rzone in prices:
-            self.ISO.reserve_zone_name_map[rzone].add_price(prices[rzone])
-            
-
-    def _energy_dispatch(self):
-        """ Returns the energy dispatch to the respective stations """
-        dispatch = {v.name.split('_')[-1] : v.varValue
-                    for v in self.lp.variables() if 'Energy_Total' in v.name}
-                        
-        for station in dispatch:
-            self.ISO.station_name_map[station].add_dispatch(dispatch[station])
-            
-            
-    def _reserve_dispatch(self):
-        """ Return the reserve dispatch to the respective units """
-        dispatch = {v.name.split('_')[-1] : v.varValue
-                    for v in self.lp.variables() if 'Reserve_Total' in v.name}
-                    
-        for unit in dispatch:
-            self.ISO.reserve_name_map[unit].add_res_dispatch(dispatch[unit])
-            
+    def _constraint_duals(self):
+        """ Pairs of constraint names and dual values from the solution """
+        if self.path in ('merit_order', 'cache'):
+            return zip(self.result.row_names, self.result.duals)
+        if self.build == 'matrix':
+            return zip(self.model.row_names, self.solution.duals)
+        return [(n, c.pi) for n, c in self.lp.constraints.items()]
+        
+        
+    def _variable_values(self):
+        """ Pairs of variable names and values from the solution """
+        if self.build == 'matrix':
+            return zip(self.model.col_names, self.solution.x)
+        return [(v.name, v.varValue) for v in self.lp.variables()]
+        
+        
+    def _gather_pulp(self):
+        """ Read the dispatch from the pulp constraints and variables """
+        handles = self.lp_handles
+        constraints = self.lp.constraints
+        return {'prices': [-1 * c.pi for c in handles['energy_price']],
+                'reserve_prices': [c.pi for c in handles['reserve_price']],
+                'energy_dispatch': [v.varValue for v in
+                                    handles['energy_dispatch']],
+                'reserve_dispatch': [v.varValue for v in
+                                     handles['reserve_dispatch']],
+                'flows': [v.varValue for v in handles['branch_flow']],
+                'risk': [v.varValue for v in handles['risk']],
+                'duals': [c.pi or 0. for c in constraints.values()],
+                'row_names': list(constraints.keys()),
+                'row_family': self.row_index[0],
+                'row_element': self.row_index[1]}
+        
+        
+    def _gather_matrix(self):
+        """ Gather the dispatch from the solution vectors """
+        x = self.solution.x
+        duals = self.solution.duals
+        cols = self.model.col_slices
+        rows = self.model.price_rows
+        if self.network == 'ptdf':
+            prices = self.builder.prices(self.model, duals)
+        else:
+            prices = -1 * duals[rows['energy']]
+        return {'prices': prices,
+                'reserve_prices': duals[rows['reserve']],
+                'energy_dispatch': x[cols['Energy_Total']],
+                'reserve_dispatch': x[cols['Reserve_Total']],
+                'flows': self._flows(x),
+                'risk': x[cols['Risk']],
+                'duals': duals,
+                'row_names': self.model.row_names,
+                'row_family': self.model.row_family,
+                'row_element': self.model.row_element}
+        
 
-    def _branch_flow(self):
-        """ Return the transfer on branches """
-        dispatch = {'_'.join(v.name.split('_')[-2:]): v.varValue
-                    for v in self.lp.variables()
-                    if 'Transmission_Total' in v.name}
-                    
-        for b in dispatch:
-            self.ISO.branch_name_map[b].add_flow(dispatch[b])
-            
     def _log_duals(self):
-        """ Log the dual variables for later analysis"""
-        duals = {}
-        for n in self.lp.constraints:
-            if 'Price' not in n:
-                try:
-                    duals[n] = self.lp.constraints[n].pi
-                except:
-                    duals[n] = 0.
-        
-        self.duals = duals
-        self.non_zero_duals = {n: duals[n] for n in duals if duals[n] != 0.}
-        self.negative_duals = {n: duals[n] for n in duals if duals[n] < 0.}
-        
-        
-    def _risk_dispatch(self):
-        dispatch = {v.name.split('_')[-1]: v.varValue 
-                        for v in self.lp.variables()
-                        if "Risk" in v.name}
-                        
-        for zone in dispatch:
-            self.ISO.reserve_zone_name_map[zone].add_dispatch(dispatch[zone])
-        
-                
+        """ Keep the dense dual vector of the result for later analysis,
+            with masks of the non zero and negative duals of every
+            constraint other than the energy and reserve price constraints.
+            See DispatchResult for indexing the rows by family and element.
+        """
+        result = self.result
+        keep = ~result.family_mask('energy_price', 'reserve_price')
+        self.duals = result.duals
+        self.non_zero_duals = keep & (result.duals != 0.)
+        self.negative_duals = keep & result.negative()
+
+
+def dispatch_handles(ISO):
+    """ The participant objects receiving each element of the dispatch of
+        an ISO, in the order of the ISO
+    """
+    return {
+        'energy_price': [ISO.node_name_map[n] for n in ISO.all_nodes],
+        'reserve_price': [ISO.reserve_zone_name_map[r] for r in
+                          ISO.reserve_zone_names],
+        'energy_dispatch': [ISO.station_name_map[i] for i in
+                            ISO.energy_totals],
+        'reserve_dispatch': [ISO.reserve_name_map[i] for i in
+                             ISO.reserve_totals],
+        'branch_flow': [ISO.branch_name_map[t] for t in
+                        ISO.transmission_totals],
+        'risk': [ISO.reserve_zone_name_map[r] for r in
+                 ISO.reserve_zone_names]}
+
+
+# Steps of push_result: the span, the handles, the result field and the
+# method of the participant objects receiving it
+PUSH_STEPS = (('energy_prices', 'energy_price', 'prices', 'add_price'),
+              ('reserve_prices', 'reserve_price', 'reserve_prices',
+               'add_price'),
+              ('energy_dispatch', 'energy_dispatch', 'energy_dispatch',
+               'add_dispatch'),
+              ('reserve_dispatch', 'reserve_dispatch', 'reserve_dispatch',
+               'add_res_dispatch'),
+              ('branch_flow', 'branch_flow', 'flows', 'add_flow'),
+              ('risk_dispatch', 'risk', 'risk', 'add_dispatch'))
+
+
+def push_result(ISO, result, handles=None, tracer=None):
+    """ Pass the values of a DispatchResult, in the order of the ISO, to
+        its participant objects. handles are those of dispatch_handles,
+        built if not given.
+    """
+    if handles is None:
+        handles = dispatch_handles(ISO)
+    span = (tracer or ISO.tracer).span
+    with span('push_dispatch'):
+        for step, key, field, method in PUSH_STEPS:
+            with span(step) as s:
+                for element, value in zip(handles[key],
+                                          getattr(result, field)):
+                    getattr(element, method)(value)
+                s.set(elements=len(handles[key]))
+
+
 if __name__ == '__main__':
     pass
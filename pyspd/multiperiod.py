@@ -0,0 +1,276 @@
+"""
+Multi Period
+------------
+
+Co-optimise the dispatch of consecutive trading periods in one linear
+program, coupled by the ramp rates of the stations.
+
+Each period is applied to the ISO in turn (in the format of a
+batch.BatchDispatch period) and its data written into a single
+MatrixModel of the ISO, built for the first period and updated in place
+for the others, exactly as a persistent LPSolver would. Every period must
+therefore share the structure of the first, its nodes, stations, bands and
+branches, only the offers, demand and capacities changing.
+
+The period blocks share one sparsity pattern, so the block diagonal matrix
+of T periods is assembled directly from the CSR arrays of the single
+period model: the column indices shifted by the columns of each period and
+the row pointers by its entries. Rows limiting the change in the energy
+output of each station with a ramp rate (Station.ramp_rate) between
+consecutive periods, and from its initial output if given, are appended
+below the blocks:
+
+    -ramp_rate <= Energy_Total[t, s] - Energy_Total[t - 1, s] <= ramp_rate
+
+Assembly time and memory are linear in the number of periods, no pulp
+model is created and the program is solved by an in process backend.
+
+Rows and columns of period t are named as those of the single period model
+prefixed by T<t>_, ramp rows T<t>_<station>_Ramp_Rate, and col_slices and
+col_elements are keyed by (family, t). results holds a
+DispatchResult for each period, whose prices and duals are those of the
+coupled program.
+
+Usage
+-----
+>>> Solver = MultiPeriodSolver(SO, archive.between(start, end),
+...                            initial={'ST1': 120.})
+>>> Solver.full_setup_and_solve()
+>>> [r.prices for r in Solver.results]
+"""
+import time
+
+import numpy as np
+import scipy.sparse as sp
+
+from backends import get_backend
+from batch import apply_period
+from matrix import MatrixBuilder, MatrixModel, ELEMENT_NAMES, FAMILY
+from result import DispatchResult
+
+
+class MultiPeriodSolver:
+    """
+    MultiPeriodSolver
+    -----------------
+    ISO : a fully defined ISO, left with the offers and demand of the last
+          period once set up
+    periods : sequence of periods in the format of batch.BatchDispatch
+    backend : name of an in process backend, 'highs' or 'scipy', or a
+              backend object
+    initial : optional {station name: energy output} before the first
+              period, from which the first period is ramp limited
+    tracer : instrument.Tracer timing each step, defaults to that of the ISO
+
+    After solving, objective and status are those of the whole program,
+    results a DispatchResult per period and ramp_duals the duals of the
+    ramp rows, one row per period and column per station (zero for
+    stations without a ramp rate). If the program is not solved to
+    optimality, for example when a ramp rate cannot follow the demand, the
+    dispatch, prices, objectives and ramp_duals of every period are NaN.
+    """
+
+    def __init__(self, ISO, periods, backend='highs', initial=None,
+                 tracer=None):
+        self.ISO = ISO
+        self.periods = list(periods)
+        self.backend = get_backend(backend)
+        if not self.backend.in_process:
+            raise ValueError("MultiPeriodSolver requires an in process "
+                             "backend")
+        self.initial = initial or {}
+        self.tracer = tracer or ISO.tracer
+        self.model = None
+
+    def full_setup_and_solve(self):
+        """ Set up, solve and gather the dispatch of every period """
+        self.setup()
+        self.solve()
+        return self.return_dispatch()
+
+    def setup(self):
+        """ Build the coupled MatrixModel of all the periods """
+        begin = time.time()
+        span = self.tracer.span
+        with span('multi_period_setup') as s:
+            with span('period_data'):
+                data = self._period_data()
+            with span('assemble'):
+                self.model = self._stack(data)
+            with span('ramp_rows') as r:
+                rows = self._ramp_rows()
+                r.set(rows=rows)
+            s.set(periods=len(self.periods), rows=self.model.shape[0],
+                  columns=self.model.shape[1], nonzeros=self.model.nnz)
+        self.setup_time = time.time() - begin
+
+    def solve(self):
+        """ Solve the coupled program """
+        begin = time.time()
+        with self.tracer.span('multi_period_solve') as span:
+            self.backend.tracer = self.tracer
+            self.solution = self.backend.solve(self.model)
+            self.objective = self.solution.objective
+            self.status = self.solution.status
+            span.set(status=self.status)
+        self.solution_time = time.time() - begin
+
+    def return_dispatch(self):
+        """ A DispatchResult for each period, held as results """
+        begin = time.time()
+        with self.tracer.span('multi_period_dispatch'):
+            base = self.base
+            book = self.book
+            x = self.solution.x
+            duals = self.solution.duals
+            if self.status != 1:
+                # No dispatch to read, every period is filled with NaN
+                x = np.full(self.model.shape[1], np.nan)
+                duals = np.full(self.model.shape[0], np.nan)
+            nrows, ncols = base.shape
+            cols = base.col_slices
+            names = {'nodes': book.node_names,
+                     'zones': book.zone_names,
+                     'stations': book.station_names,
+                     'providers': book.provider_names,
+                     'branches': book.branch_names,
+                     'rows': base.row_names,
+                     'elements': dict((kind, getattr(book, a)) for kind, a in
+                                      ELEMENT_NAMES.items())}
+            self.results = []
+            for t in range(len(self.periods)):
+                xt = x[t * ncols:(t + 1) * ncols]
+                dt = duals[t * nrows:(t + 1) * nrows]
+                values = {'prices': -1 * dt[base.price_rows['energy']],
+                          'reserve_prices': dt[base.price_rows['reserve']],
+                          'risk': xt[cols['Risk']],
+                          'energy_dispatch': xt[cols['Energy_Total']],
+                          'reserve_dispatch': xt[cols['Reserve_Total']],
+                          'flows': xt[cols['Transmission_Total']],
+                          'duals': dt,
+                          'row_family': base.row_family,
+                          'row_element': base.row_element}
+                objective = np.dot(self.costs[t], xt)
+                self.results.append(DispatchResult(names, values, objective,
+                                                   self.status,
+                                                   'multi_period'))
+
+            self.ramp_duals = np.zeros((len(self.periods),
+                                        len(book.station_names)))
+            if self.status != 1:
+                self.ramp_duals[:] = np.nan
+            ramp = duals[len(self.periods) * nrows:]
+            self.ramp_duals[self._ramp_period, self._ramp_station] = ramp
+        self.dispatch_time = time.time() - begin
+        return self.results
+
+    def _period_data(self):
+        """ Costs, bounds and matrix values of every period, writing each
+            into the model of the first
+        """
+        data = []
+        model = None
+        for t, period in enumerate(self.periods):
+            apply_period(self.ISO, period)
+            builder = MatrixBuilder(self.ISO, tracer=self.tracer)
+            if model is None:
+                model = builder.build()
+            elif not builder.update(model):
+                raise ValueError("Period %s changes the structure of the "
+                                 "ISO" % period.get('period', t))
+            data.append((model.cost.copy(), model.row_lower.copy(),
+                         model.row_upper.copy(), model.col_lower.copy(),
+                         model.col_upper.copy(), model.A.data.copy()))
+        model.clear_changes()
+        self.base = model
+        self.book = self.ISO.offer_book
+        return data
+
+    def _stack(self, data):
+        """ The block diagonal model of the periods """
+        base = self.base
+        T = len(data)
+        nrows, ncols = base.shape
+        A = base.A
+        nnz = A.nnz
+        index = np.int32 if max(T * ncols, T * nnz) < 2 ** 31 else np.int64
+
+        shift = np.arange(T, dtype=index)
+        indices = (A.indices.astype(index)[None, :] +
+                   (shift * ncols)[:, None]).ravel()
+        indptr = np.concatenate([(A.indptr[:-1].astype(index)[None, :] +
+                                  (shift * nnz)[:, None]).ravel(),
+                                 [T * nnz]]).astype(index)
+        values = np.concatenate([d[5] for d in data])
+        stacked = sp.csr_matrix((values, indices, indptr),
+                                shape=(T * nrows, T * ncols))
+
+        cost, row_lower, row_upper, col_lower, col_upper = [
+            np.concatenate([d[k] for d in data]) for k in range(5)]
+        self.costs = [d[0] for d in data]
+
+        prefix = ['T%d_' % t for t in range(T)]
+        row_names = [p + n for p in prefix for n in base.row_names]
+        col_names = [p + n for p in prefix for n in base.col_names]
+        col_slices = dict(((family, t), slice(c.start + t * ncols,
+                                              c.stop + t * ncols))
+                          for t in range(T)
+                          for family, c in base.col_slices.items())
+        col_elements = dict(((family, t), elements) for t in range(T)
+                            for family, elements in
+                            base.col_elements.items())
+        model = MatrixModel(stacked, cost, row_lower, row_upper, col_lower,
+                            col_upper, row_names, col_names, col_slices,
+                            col_elements)
+        model.row_family = np.tile(base.row_family, T)
+        model.row_element = np.tile(base.row_element, T)
+        return model
+
+    def _ramp_rows(self):
+        """ Append the ramp rows of the stations with a ramp rate, returning
+            the number of rows
+        """
+        model = self.model
+        book = self.book
+        T = len(self.periods)
+        ncols = self.base.shape[1]
+        start = self.base.col_slices['Energy_Total'].start
+
+        stations = np.flatnonzero(np.isfinite(book.station_ramp))
+        ramp = book.station_ramp[stations]
+        initial = np.array([book.station_index[name] for name in
+                            self.initial], dtype=int)
+        initial = initial[np.isfinite(book.station_ramp[initial])]
+        output = np.array([self.initial[book.station_names[s]] for s in
+                           initial], dtype=float)
+
+        # Ramp from the initial output into the first period, then between
+        # each pair of consecutive periods
+        period = np.concatenate([np.zeros(len(initial), dtype=int),
+                                 np.repeat(np.arange(1, T), len(stations))])
+        station = np.concatenate([initial, np.tile(stations, T - 1)])
+        rate = np.concatenate([book.station_ramp[initial],
+                               np.tile(ramp, T - 1)])
+        previous = np.concatenate([output, np.zeros(len(station) -
+                                                    len(initial))])
+        n = len(station)
+
+        current = period * ncols + start + station
+        coupled = np.arange(len(initial), n)
+        rows = np.concatenate([np.arange(n), coupled])
+        cols = np.concatenate([current, current[coupled] - ncols])
+        vals = np.concatenate([np.ones(n), -np.ones(len(coupled))])
+        A = sp.csr_matrix((vals, (rows, cols)), shape=(n, model.shape[1]))
+
+        names = ['T%d_%s_Ramp_Rate' % (t, book.station_names[s]) for t, s in
+                 zip(period, station)]
+        model.add_rows(A, previous - rate, previous + rate, names,
+                       np.repeat(FAMILY['ramp_rate'], n), station)
+        model.clear_changes()
+        self._ramp_period = period
+        self._ramp_station = station
+        return n
+
+
+if __name__ == '__main__':
+    pass
@@ -0,0 +1,425 @@
+"""
+Offer Book
+----------
+
+An integer indexed, array backed representation of the offers compiled by
+the ISO. Every element (node, reserve zone, station, reserve provider,
+branch and band) is identified by its position in the ISO ordering and the
+relationships between them are held as index arrays, so that the build of
+the linear program and any analysis of the offers may be vectorised rather
+than performed through name keyed dictionaries.
+"""
+import copy
+import hashlib
+
+import numpy as np
+
+
+class OfferBook:
+    """
+    OfferBook
+    ---------
+    Compiled from a fully defined ISO. The orderings are those of the ISO:
+
+        nodes : ISO.nodes
+        zones : ISO.reserve_zones
+        stations : ISO.stations
+        providers : ISO.spinning_stations followed by ISO.intload
+        branches : ISO.branches
+
+    Bands are held contiguously per owner in owner order, the band pointer
+    arrays (e.g. station_band_ptr) give the first band of each owner with a
+    final entry equal to the number of bands. The *_index dictionaries give
+    the position of each node, station, provider and branch by name.
+
+    The update_* methods recompile the slices belonging to a single element
+    in place, the set of elements must be unchanged.
+
+    Nodes and Zones
+    ---------------
+    node_names, node_index, node_zone, node_demand
+    zone_names
+
+    Stations
+    --------
+    station_names, station_index, station_node, station_zone,
+    station_capacity, station_spinning, station_risk, station_ramp (inf
+    without a limit), station_band_ptr
+
+    Energy Bands
+    ------------
+    energy_band_names, energy_band_price, energy_band_quantity,
+    energy_band_station, energy_band_node, energy_band_zone
+
+    Reserve Providers
+    -----------------
+    provider_names, provider_index, provider_station (-1 for interruptible
+    load), provider_node, provider_zone, provider_band_ptr
+
+    Reserve Bands
+    -------------
+    reserve_band_names, reserve_band_price, reserve_band_quantity,
+    reserve_band_proportion (0 for interruptible load), reserve_band_provider,
+    reserve_band_zone
+
+    Branches
+    --------
+    branch_names, branch_index, branch_from, branch_to, branch_capacity,
+    branch_risk, branch_reactance, branch_band_ptr
+
+    Transmission Bands
+    ------------------
+    transmission_band_names, transmission_band_branch,
+    transmission_band_capacity, transmission_band_loss_factor
+    """
+
+    def __init__(self, ISO=None):
+        # Without an ISO the book is left empty, to be filled from a
+        # snapshot (see snapshot.load_book)
+        if ISO is None:
+            return
+        self._compile_nodes(ISO)
+        self._compile_stations(ISO)
+        self._compile_providers(ISO)
+        self._compile_branches(ISO)
+
+    def _compile_nodes(self, ISO):
+        """ Nodes, their demand and reserve zones """
+        self.zone_names = [RZ.name for RZ in ISO.reserve_zones]
+        zone_index = _index(self.zone_names)
+
+        self.node_names = [node.name for node in ISO.nodes]
+        self.node_index = _index(self.node_names)
+        self.node_zone = np.array([zone_index[node.RZ.name] for node in
+                                   ISO.nodes], dtype=int)
+        self.node_demand = np.array([node.demand for node in ISO.nodes],
+                                    dtype=float)
+
+    def _compile_stations(self, ISO):
+        """ Stations and their energy bands """
+        stations = ISO.stations
+
+        self.station_names = [s.name for s in stations]
+        self.station_index = _index(self.station_names)
+        self.station_node = np.array([self.node_index[s.node.name] for s in
+                                      stations], dtype=int)
+        self.station_zone = self.node_zone[self.station_node]
+        self.station_capacity = np.array([s.capacity for s in stations],
+                                         dtype=float)
+        self.station_spinning = np.array([s.spinning for s in stations],
+                                         dtype=bool)
+        self.station_risk = np.array([s.risk for s in stations], dtype=bool)
+        self.station_ramp = np.array([_ramp(s) for s in stations], dtype=float)
+
+        offers = [s.energy.columns() for s in stations]
+        counts = np.array([len(o[0]) for o in offers], dtype=int)
+        self.station_band_ptr = _pointer(counts)
+
+        self.energy_band_names = [b for o in offers for b in o[0]]
+        self.energy_band_price = _concatenate([o[1] for o in offers])
+        self.energy_band_quantity = _concatenate([o[2] for o in offers])
+        self._map_energy_bands()
+
+    def _map_energy_bands(self):
+        """ Owning station, node and zone of each energy band """
+        counts = np.diff(self.station_band_ptr)
+        self.energy_band_station = np.repeat(np.arange(len(counts)), counts)
+        self.energy_band_node = self.station_node[self.energy_band_station]
+        self.energy_band_zone = self.station_zone[self.energy_band_station]
+
+    def _compile_providers(self, ISO):
+        """ Reserve providers, spinning stations then interruptible load,
+            and their reserve bands
+        """
+        providers = ISO.spinning_stations + ISO.intload
+
+        self.provider_names = [u.name for u in providers]
+        self.provider_index = _index(self.provider_names)
+        self.provider_station = np.array([self.station_index[s.name] for s in
+                                          ISO.spinning_stations] +
+                                         [-1] * len(ISO.intload), dtype=int)
+        self.provider_node = np.array([self.node_index[u.node.name] for u in
+                                       providers], dtype=int)
+        self.provider_zone = self.node_zone[self.provider_node]
+
+        offers = [u.reserve.columns() for u in providers]
+        counts = np.array([len(o[0]) for o in offers], dtype=int)
+        self.provider_band_ptr = _pointer(counts)
+
+        self.reserve_band_names = [b for o in offers for b in o[0]]
+        self.reserve_band_price = _concatenate([o[1] for o in offers])
+        self.reserve_band_quantity = _concatenate([o[2] for o in offers])
+        self.reserve_band_proportion = _concatenate([o[3] for o in offers])
+        self._map_reserve_bands()
+
+    def _map_reserve_bands(self):
+        """ Owning provider and zone of each reserve band """
+        counts = np.diff(self.provider_band_ptr)
+        self.reserve_band_provider = np.repeat(np.arange(len(counts)), counts)
+        self.reserve_band_zone = self.provider_zone[self.reserve_band_provider]
+
+    def _compile_branches(self, ISO):
+        """ Branches and their transmission bands """
+        branches = ISO.branches
+
+        self.branch_names = [b.name for b in branches]
+        self.branch_index = _index(self.branch_names)
+        self.branch_from = np.array([self.node_index[b.sending_node.name] for
+                                     b in branches], dtype=int)
+        self.branch_to = np.array([self.node_index[b.receiving_node.name] for
+                                   b in branches], dtype=int)
+        self.branch_capacity = np.array([b.capacity for b in branches],
+                                        dtype=float)
+        self.branch_risk = np.array([b.risk for b in branches], dtype=bool)
+        self.branch_reactance = np.array([b.reactance for b in branches],
+                                         dtype=float)
+
+        counts = np.array([len(b.bands) for b in branches], dtype=int)
+        self.branch_band_ptr = _pointer(counts)
+        self.transmission_band_names = [t for b in branches for t in b.bands]
+        self.transmission_band_branch = np.repeat(np.arange(len(branches)),
+                                                  counts)
+        self.transmission_band_capacity = np.array([b.bc[t] for b in branches
+                                                    for t in b.bands],
+                                                   dtype=float)
+        self.transmission_band_loss_factor = np.array([b.blf[t] for b in
+                                                       branches for t in
+                                                       b.bands], dtype=float)
+
+    def update_node(self, node):
+        """ Recompile the demand of a single node """
+        self.node_demand[self.node_index[node.name]] = node.demand
+
+    def update_station(self, station):
+        """ Recompile the capacity, ramp rate and energy bands of a single
+            station, along with its reserve bands if it is spinning
+        """
+        k = self.station_index[station.name]
+        self.station_capacity[k] = station.capacity
+        self.station_ramp[k] = _ramp(station)
+
+        names, prices, quantities, _ = station.energy.columns()
+        begin, end = self.station_band_ptr[k], self.station_band_ptr[k + 1]
+        self.energy_band_names[begin:end] = names
+        self.energy_band_price = _splice(self.energy_band_price, begin, end,
+                                         prices)
+        self.energy_band_quantity = _splice(self.energy_band_quantity, begin,
+                                            end, quantities)
+        if len(names) != end - begin:
+            self.station_band_ptr = _resize(self.station_band_ptr, k,
+                                            len(names))
+            self._map_energy_bands()
+
+        if station.spinning:
+            self.update_provider(station)
+
+    def update_provider(self, unit):
+        """ Recompile the reserve bands of a single spinning station or
+            interruptible load
+        """
+        k = self.provider_index[unit.name]
+
+        names, prices, quantities, proportions = unit.reserve.columns()
+        begin, end = self.provider_band_ptr[k], self.provider_band_ptr[k + 1]
+        self.reserve_band_names[begin:end] = names
+        self.reserve_band_price = _splice(self.reserve_band_price, begin, end,
+                                          prices)
+        self.reserve_band_quantity = _splice(self.reserve_band_quantity,
+                                             begin, end, quantities)
+        self.reserve_band_proportion = _splice(self.reserve_band_proportion,
+                                               begin, end, proportions)
+        if len(names) != end - begin:
+            self.provider_band_ptr = _resize(self.provider_band_ptr, k,
+                                             len(names))
+            self._map_reserve_bands()
+
+    def update_branch(self, branch):
+        """ Recompile the capacity, reactance and transmission bands of a
+            branch
+        """
+        k = self.branch_index[branch.name]
+        self.branch_capacity[k] = branch.capacity
+        self.branch_reactance[k] = branch.reactance
+
+        names = list(branch.bands)
+        begin, end = self.branch_band_ptr[k], self.branch_band_ptr[k + 1]
+        self.transmission_band_names[begin:end] = names
+        self.transmission_band_capacity = _splice(
+            self.transmission_band_capacity, begin, end,
+            [branch.bc[t] for t in names])
+        self.transmission_band_loss_factor = _splice(
+            self.transmission_band_loss_factor, begin, end,
+            [branch.blf[t] for t in names])
+        if len(names) != end - begin:
+            self.branch_band_ptr = _resize(self.branch_band_ptr, k,
+                                           len(names))
+            counts = np.diff(self.branch_band_ptr)
+            self.transmission_band_branch = np.repeat(np.arange(len(counts)),
+                                                      counts)
+
+    def take(self, nodes):
+        """ A new offer book of the given nodes along with their reserve
+            zones, which must lie wholly within them, and the stations,
+            reserve providers and branches at them.
+
+            parent_index holds the positions in this book of the elements of
+            the new one, by kind of element (as matrix.ELEMENT_NAMES).
+        """
+        nodes = np.sort(np.asarray(nodes, dtype=int))
+        inside = np.zeros(len(self.node_names), dtype=bool)
+        inside[nodes] = True
+
+        index = {'nodes': nodes,
+                 'zones': np.unique(self.node_zone[nodes]),
+                 'stations': np.flatnonzero(inside[self.station_node]),
+                 'providers': np.flatnonzero(inside[self.provider_node]),
+                 'branches': np.flatnonzero(inside[self.branch_from]),
+                 'energy_bands': np.flatnonzero(inside[self.energy_band_node]),
+                 'reserve_bands': np.flatnonzero(
+                     inside[self.provider_node[self.reserve_band_provider]]),
+                 'transmission_bands': np.flatnonzero(
+                     inside[self.branch_from[self.transmission_band_branch]])}
+        node = _local(nodes, len(self.node_names))
+        zone = _local(index['zones'], len(self.zone_names))
+        station = _local(index['stations'], len(self.station_names))
+
+        book = copy.copy(self)
+        book.parent_index = index
+
+        zones = index['zones']
+        book.zone_names = [self.zone_names[z] for z in zones]
+        book.node_names = [self.node_names[n] for n in nodes]
+        book.node_index = _index(book.node_names)
+        book.node_zone = zone[self.node_zone[nodes]]
+        book.node_demand = self.node_demand[nodes]
+
+        stations = index['stations']
+        book.station_names = [self.station_names[s] for s in stations]
+        book.station_index = _index(book.station_names)
+        book.station_node = node[self.station_node[stations]]
+        book.station_zone = book.node_zone[book.station_node]
+        book.station_capacity = self.station_capacity[stations]
+        book.station_spinning = self.station_spinning[stations]
+        book.station_risk = self.station_risk[stations]
+        book.station_ramp = self.station_ramp[stations]
+
+        bands = index['energy_bands']
+        book.energy_band_names = [self.energy_band_names[b] for b in bands]
+        book.energy_band_price = self.energy_band_price[bands]
+        book.energy_band_quantity = self.energy_band_quantity[bands]
+        book.station_band_ptr = _pointer(np.diff(self.station_band_ptr)
+                                         [stations])
+        book._map_energy_bands()
+
+        providers = index['providers']
+        owner = self.provider_station[providers]
+        book.provider_names = [self.provider_names[p] for p in providers]
+        book.provider_index = _index(book.provider_names)
+        book.provider_station = np.repeat(-1, len(providers))
+        book.provider_station[owner >= 0] = station[owner[owner >= 0]]
+        book.provider_node = node[self.provider_node[providers]]
+        book.provider_zone = book.node_zone[book.provider_node]
+
+        bands = index['reserve_bands']
+        book.reserve_band_names = [self.reserve_band_names[b] for b in bands]
+        book.reserve_band_price = self.reserve_band_price[bands]
+        book.reserve_band_quantity = self.reserve_band_quantity[bands]
+        book.reserve_band_proportion = self.reserve_band_proportion[bands]
+        book.provider_band_ptr = _pointer(np.diff(self.provider_band_ptr)
+                                          [providers])
+        book._map_reserve_bands()
+
+        branches = index['branches']
+        book.branch_names = [self.branch_names[t] for t in branches]
+        book.branch_index = _index(book.branch_names)
+        book.branch_from = node[self.branch_from[branches]]
+        book.branch_to = node[self.branch_to[branches]]
+        book.branch_capacity = self.branch_capacity[branches]
+        book.branch_risk = self.branch_risk[branches]
+        book.branch_reactance = self.branch_reactance[branches]
+
+        bands = index['transmission_bands']
+        counts = np.diff(self.branch_band_ptr)[branches]
+        book.branch_band_ptr = _pointer(counts)
+        book.transmission_band_names = [self.transmission_band_names[t]
+                                        for t in bands]
+        book.transmission_band_branch = np.repeat(np.arange(len(branches)),
+                                                  counts)
+        book.transmission_band_capacity = self.transmission_band_capacity[
+            bands]
+        book.transmission_band_loss_factor = \
+            self.transmission_band_loss_factor[bands]
+        return book
+
+    def fingerprint(self):
+        """ Hex digest of the names, offers, demand and network of the
+            book, equal for books compiled from identical inputs
+        """
+        digest = hashlib.sha1()
+        for key in sorted(self.__dict__):
+            value = self.__dict__[key]
+            if isinstance(value, np.ndarray):
+                digest.update(('%s %s %s' % (key, value.dtype.str,
+                                             value.shape)).encode('utf-8'))
+                digest.update(np.ascontiguousarray(value).tobytes())
+            elif isinstance(value, list):
+                digest.update(('%s %s' % (key, '\x1f'.join(value)))
+                              .encode('utf-8'))
+        return digest.hexdigest()
+
+    @property
+    def nbytes(self):
+        """ Memory held by the arrays of the offer book """
+        return sum(v.nbytes for v in self.__dict__.values()
+                   if isinstance(v, np.ndarray))
+
+
+def _concatenate(arrays):
+    """ Concatenate the band arrays of each owner """
+    return np.concatenate(arrays) if arrays else np.zeros(0)
+
+
+def _index(names):
+    """ Position of each name """
+    return {name: k for k, name in enumerate(names)}
+
+
+def _ramp(station):
+    """ Ramp rate of a station, inf without a limit """
+    return np.inf if station.ramp_rate is None else station.ramp_rate
+
+
+def _local(positions, size):
+    """ Map from the positions of size elements of a book to their
+        positions in a subset of them (-1 outside it)
+    """
+    local = np.repeat(-1, size)
+    local[positions] = np.arange(len(positions))
+    return local
+
+
+def _splice(array, begin, end, values):
+    """ Replace array[begin:end] with values, in place if the length is
+        unchanged
+    """
+    values = np.asarray(values, dtype=array.dtype)
+    if len(values) == end - begin:
+        array[begin:end] = values
+        return array
+    return np.concatenate([array[:begin], values, array[end:]])
+
+
+def _resize(ptr, k, count):
+    """ Pointer array with group k resized to count entries """
+    counts = np.diff(ptr)
+    counts[k] = count
+    return _pointer(counts)
+
+
+def _pointer(counts):
+    """ Pointer array of the first entry of each group given their sizes """
+    return np.concatenate([[0], np.cumsum(counts)]).astype(int)
+
+
+if __name__ == '__main__':
+    pass
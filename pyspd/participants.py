@@ -5,23 +5,125 @@ Participants
 Classes to define different agents within the system
 
 """
-class Station:
+from array import array
+
+import numpy as np
+
+
+def zero_cost(dispatch):
+    """ Default station cost function, no cost of generation """
+    return 0.
+    
+    
+class OfferBands(object):
+    """
+    OfferBands
+    ----------
+    Columnar store of the offer bands of a single unit.
+    
+    The band labels are kept as given and the full band names
+    (prefix_label) are only built when requested. Prices, offers and
+    reserve proportions are held in compact arrays of doubles, proportions
+    is None for units which do not offer proportional reserve.
+    """
+    __slots__ = ('prefix', 'labels', 'prices', 'offers', 'proportions')
+    
+    def __init__(self, prefix, proportional=False):
+        self.prefix = prefix
+        self.labels = []
+        self.prices = array('d')
+        self.offers = array('d')
+        self.proportions = array('d') if proportional else None
+        
+    def __len__(self):
+        return len(self.labels)
+        
+    def add(self, band, price, offer, prop=0):
+        """ Add a single band """
+        self.labels.append(band)
+        self.prices.append(price)
+        self.offers.append(offer)
+        if self.proportions is not None:
+            self.proportions.append(prop)
+            
+    def extend(self, bands, prices, offers, proportions=None):
+        """ Add many bands at once from sequences or arrays """
+        self.labels.extend([str(b) for b in bands])
+        _extend(self.prices, prices)
+        _extend(self.offers, offers)
+        if self.proportions is not None:
+            _extend(self.proportions, np.zeros(len(self.labels) -
+                                               len(self.proportions))
+                    if proportions is None else proportions)
+            
+    def clear(self):
+        """ Remove all bands """
+        del self.labels[:]
+        del self.prices[:]
+        del self.offers[:]
+        if self.proportions is not None:
+            del self.proportions[:]
+            
+    @property
+    def names(self):
+        """ Full band names """
+        prefix = self.prefix + '_'
+        return [prefix + band for band in self.labels]
+        
+    def columns(self):
+        """ Band names with NumPy arrays of the prices, offers and
+            proportions (zero where not offered)
+        """
+        proportions = (np.zeros(len(self.labels)) if self.proportions is None
+                       else np.array(self.proportions, dtype=float))
+        return (self.names, np.array(self.prices, dtype=float),
+                np.array(self.offers, dtype=float), proportions)
+        
+    def mapping(self, values):
+        """ Dictionary of values keyed by band name """
+        return dict(zip(self.names, values))
+        
+        
+def _extend(store, values):
+    """ Append an array of values to a store in bulk """
+    data = np.ascontiguousarray(values, dtype=float).tobytes()
+    if hasattr(store, 'frombytes'):
+        store.frombytes(data)
+    else:
+        store.fromstring(data)
+        
+        
+class Station(object):
     """
     A generation station which is associated with a node and a particular
     company.
     
     May be capable of providing spinning reserve if explicitly set to and is
     capable of providing energy and reserve offers to the ISO.
+    
+    Offers are held in the OfferBands stores energy and, for spinning
+    stations, reserve. The band_* and rband_* attributes present them keyed
+    by band name, the rband_* attributes only exist for spinning stations.
+    
+    ramp_rate limits the change in output between consecutive trading
+    periods of a multi period dispatch (see multiperiod.py), None for no
+    limit.
     """
+    __slots__ = ('name', 'capacity', 'spinning', 'risk', 'cost_func', 'ISO',
+                 'node', 'energy', 'reserve', 'costs', 'energy_dispatch',
+                 'energy_revenue', 'reserve_dispatch', 'reserve_revenue',
+                 'total_revenue', 'ramp_rate')
+    
     def __init__(self, name, node, ISO, Company, capacity=0, ebands=3,
-                 spinning=False, risk=True):
+                 spinning=False, risk=True, ramp_rate=None):
         self.name = name
         self.capacity = capacity
         self.spinning = spinning
-        self.band_names = []
-        self.band_offers = {}
-        self.band_prices = {}
+        self.energy = OfferBands(name)
         self.risk = risk
+        self.ramp_rate = ramp_rate
+        self.cost_func = zero_cost
+        self.ISO = ISO
         
         node.add_station(self)
         ISO._add_station(self)
@@ -31,42 +133,82 @@ class Station:
         
         
         if self.spinning:
-            self.rband_names = []
-            self.rband_offers = {}
-            self.rband_prices = {}
-            self.rband_proportions = {}
+            self.reserve = OfferBands('_'.join([name, 'Reserve']),
+                                      proportional=True)
+        else:
+            self.reserve = None
+            
+    @property
+    def band_names(self):
+        return self.energy.names
+        
+    @property
+    def band_offers(self):
+        return self.energy.mapping(self.energy.offers)
+        
+    @property
+    def band_prices(self):
+        return self.energy.mapping(self.energy.prices)
+        
+    @property
+    def rband_names(self):
+        return self._reserve_bands().names
+        
+    @property
+    def rband_offers(self):
+        return self._reserve_bands().mapping(self.reserve.offers)
+        
+    @property
+    def rband_prices(self):
+        return self._reserve_bands().mapping(self.reserve.prices)
+        
+    @property
+    def rband_proportions(self):
+        return self._reserve_bands().mapping(self.reserve.proportions)
+        
+    def _reserve_bands(self):
+        if self.reserve is None:
+            raise AttributeError("Station %s is not spinning" % self.name)
+        return self.reserve
         
     def add_energy_offer(self, band='0', price=0, offer=0):
         """ Add an Energy Offer to the Station"""
-        # Get the band name
-        band_name = '_'.join([self.name, band])
-        
-        self.band_names.append(band_name)
-        self.band_offers[band_name] = offer
-        self.band_prices[band_name] = price
+        self.energy.add(band, price, offer)
+        self.ISO._station_changed(self)
         
     def add_reserve_offer(self, band='0', price=0, prop=0, offer=0):
         """ Add a reserve offer """
         if self.spinning:
-            rband_name = '_'.join([self.name, 'Reserve', band])
-            self.rband_names.append(rband_name)
-            self.rband_offers[rband_name] = offer
-            self.rband_prices[rband_name] = price
-            self.rband_proportions[rband_name] = prop
+            self.reserve.add(band, price, offer, prop)
+            self.ISO._station_changed(self)
             
         else:
             pass 
             
-    def add_multiple_energy_offers(self, offer_dict):
-        """ Add multiple energy offers to the stations"""
+    def add_multiple_energy_offers(self, offer_dict=(), bands=None,
+                                   prices=None, offers=None):
+        """ Add multiple energy offers to the stations, either as a
+            sequence of offer dictionaries or in bulk as sequences (or
+            arrays) of bands, prices and offers
+        """
         for row in offer_dict:
             self.add_energy_offer(**row)
+        if bands is not None:
+            self.energy.extend(bands, prices, offers)
+            self.ISO._station_changed(self)
             
     
-    def add_multiple_reserve_offers(self, offer_dict):
-        """ Add multiple reserve offers to the station """
+    def add_multiple_reserve_offers(self, offer_dict=(), bands=None,
+                                    prices=None, offers=None, props=None):
+        """ Add multiple reserve offers to the station, either as a
+            sequence of offer dictionaries or in bulk as sequences (or
+            arrays) of bands, prices, offers and proportions
+        """
         for row in offer_dict:
             self.add_reserve_offer(**row)
+        if bands is not None and self.spinning:
+            self.reserve.extend(bands, prices, offers, props)
+            self.ISO._station_changed(self)
             
             
     def add_dispatch(self, dispatch):
@@ -103,19 +245,29 @@ class Station:
     def add_cost_function(self, cfunc):
         self.cost_func = cfunc
         
+    def set_ramp_rate(self, ramp_rate):
+        """ Change the ramp rate of the station, None for no limit """
+        self.ramp_rate = ramp_rate
+        self.ISO._station_changed(self)
+        
     def calculate_cost(self):
         self.costs = self.cost_func(self.energy_dispatch)
         
-    def clear_all_offers(self):
-    
-        self.band_names = []
-        self.band_offers = {}
-        self.band_prices = {}
+    def clear_energy_offers(self):
+        """ Remove all energy offers from the station """
+        self.energy.clear()
+        self.ISO._station_changed(self)
+        
+    def clear_reserve_offers(self):
+        """ Remove all reserve offers from the station """
         if self.spinning:
-            self.rband_name = []
-            self.rband_offers = {}
-            self.rband_prices = {}
-            self.rband_proportions = {}
+            self.reserve.clear()
+            self.ISO._station_changed(self)
+        
+    def clear_all_offers(self):
+        """ Remove all energy and reserve offers from the station """
+        self.clear_energy_offers()
+        self.clear_reserve_offers()
         
         
         
@@ -155,6 +307,7 @@ class Node:
     def set_demand(self, demand):
         """ Set the nodal demand to a non default value """
         self.demand = demand
+        self.ISO._node_changed(self)
         
         
     def add_intload(self, Load):
@@ -184,10 +337,13 @@ class Branch:
     nodes in the grid with automated support for declaring it a risk, naming it
     and determining piece wise linear losses from a loss factor and the total
     capacity.
+    
+    The reactance (per unit) determines how flows divide across a meshed
+    network in the PTDF network formulation, see ptdf.py.
     """
 
     def __init__(self, SN, RN, ISO, capacity=0, loss_factor=0.0001, bands=3,
-                 risk=False):
+                 risk=False, reactance=1.0):
         self.name = '_'.join([SN.name, RN.name])
         self.sending_node = SN
         self.receiving_node = RN
@@ -195,6 +351,7 @@ class Branch:
         self.lf = loss_factor
         self.ISO = ISO
         self.risk = risk
+        self.reactance = reactance
 
         
         self.bands = []
@@ -205,6 +362,21 @@ class Branch:
         
         self._create_bands(bands=bands)
         
+    def set_capacity(self, capacity):
+        """ Change the capacity of the branch, recreating its bands """
+        self.capacity = capacity
+        bands = len(self.bands)
+        self.bands = []
+        self.bc = {}
+        self.blf = {}
+        self._create_bands(bands=bands)
+        self.ISO._branch_changed(self)
+        
+    def set_reactance(self, reactance):
+        """ Change the reactance of the branch """
+        self.reactance = reactance
+        self.ISO._branch_changed(self)
+        
     def _create_bands(self, bands=3):
         """ Create a band structure and determine the piece wise linear loss
         factors for each band
@@ -214,7 +386,7 @@ class Branch:
         
         """
         
-        for band in xrange(bands):
+        for band in range(bands):
             b = str(band + 1)
             band_name = '_'.join([self.name, b])
             
@@ -267,48 +439,66 @@ class ReserveZone:
         self.dispatch = dispatch
         
         
-class InterruptibleLoad:
+class InterruptibleLoad(object):
     """
     InterruptibleLoad
     -----------------
     An interruptible load copany is one who is capable of providing reserve
     and is not associated with an individual generation plant.
     
+    Offers are held in the OfferBands store reserve, the band_* attributes
+    present them keyed by band name.
+    
     To do
     -----
     Add support for making sure a units load is greater than the IL provided.
     """
+    __slots__ = ('name', 'node', 'capacity', 'ISO', 'reserve',
+                 'reserve_dispatch', 'reserve_revenue')
 
     def __init__(self, name, node, ISO, Company, capacity=0):
         self.name = name
         self.node = node
         self.capacity=0
+        self.ISO = ISO
         
         
         node.add_intload(self)
         ISO._add_intload(self)
         Company.add_intload(self)
         
-        self.band_names = []
-        self.band_prices = {}
-        self.band_offers = {}
+        self.reserve = OfferBands(name)
+        
+    @property
+    def band_names(self):
+        return self.reserve.names
+        
+    @property
+    def band_prices(self):
+        return self.reserve.mapping(self.reserve.prices)
+        
+    @property
+    def band_offers(self):
+        return self.reserve.mapping(self.reserve.offers)
         
-    
     def add_offer(self, band='0', price=0, offer=0):
         """ Add an offer to the company consisting of a band name, price 
             and offer
         """
-        name = '_'.join([self.name, band])
-        self.band_names.append(name)
-        self.band_prices[name] = price
-        self.band_offers[name] = offer
+        self.reserve.add(band, price, offer)
+        self.ISO._intload_changed(self)
         
-    def add_multiple_offers(self, offer_dict):
+    def add_multiple_offers(self, offer_dict=(), bands=None, prices=None,
+                            offers=None):
         """ Helper to add multiple offers at once for a station.
-            Must be passed a tuple of dictionaries which are then iterated over.
+            Must be passed a tuple of dictionaries which are then iterated
+            over, or sequences (or arrays) of bands, prices and offers.
         """
         for row in offer_dict:
-            self.add_offer(**row)   
+            self.add_offer(**row)
+        if bands is not None:
+            self.reserve.extend(bands, prices, offers)
+            self.ISO._intload_changed(self)
             
             
     def add_res_dispatch(self, dispatch):
@@ -323,9 +513,9 @@ class InterruptibleLoad:
         self.reserve_revenue = self.reserve_dispatch * self.node.RZ.price  
         
     def clear_all_offers(self):
-        self.band_names = []
-        self.band_prices = {}
-        self.band_offers = {}  
+        """ Remove all offers from the interruptible load """
+        self.reserve.clear()
+        self.ISO._intload_changed(self)
     
     
 class Company:
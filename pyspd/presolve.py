@@ -0,0 +1,162 @@
+"""
+Presolve
+--------
+
+Reduce the offer book before the linear program is built (see
+MatrixBuilder(presolve=True)):
+
+    bands offering nothing are dropped
+    energy bands of a station at the same price are merged into one
+    reserve bands of an interruptible load at the same price are merged
+    the band offer limits become upper bounds of the band variables rather
+    than constraint rows
+
+Spinning reserve bands are only dropped, never merged, as each is limited
+by its own proportion of the station's energy dispatch.
+
+Merging bands of the same price and owner leaves the linear program
+unchanged, any split of the merged band's dispatch between its bands being
+equally optimal. expand_energy and expand_reserve map the dispatch of the
+reduced bands back to the original bands in proportion to their offers.
+"""
+import copy
+
+import numpy as np
+
+from offerbook import _pointer
+
+
+class Presolve:
+    """
+    Presolve
+    --------
+    book : the offer book of a compiled ISO
+
+    reduced : the reduced offer book, a copy of book sharing everything
+              other than its bands
+    energy_map, reserve_map : the reduced band of each original band, -1
+                              where it was dropped
+    report : sizes of the offer book before and after and the number of
+             rows and columns removed from the linear program
+    """
+
+    def __init__(self, book, tolerance=0.):
+        self.book = book
+        self.reduced = copy.copy(book)
+        self._reduce_energy(tolerance)
+        self._reduce_reserve(tolerance)
+
+        nspin_bands = int(book.provider_band_ptr[(book.provider_station >= 0)
+                                                 .sum()])
+        kept_spin = int((self.reserve_map[:nspin_bands] >= 0).sum())
+        energy = len(book.energy_band_names)
+        reserve = len(book.reserve_band_names)
+        columns = (energy - len(self.reduced.energy_band_names) + reserve -
+                   len(self.reduced.reserve_band_names))
+        self.report = {'energy_bands': energy,
+                       'energy_bands_kept': len(self.reduced.energy_band_names),
+                       'reserve_bands': reserve,
+                       'reserve_bands_kept':
+                           len(self.reduced.reserve_band_names),
+                       'rows_removed': energy + reserve +
+                                       nspin_bands - kept_spin,
+                       'columns_removed': columns}
+
+    def _reduce_energy(self, tolerance):
+        """ Merge and drop the energy bands of each station """
+        book = self.book
+        reduced = self.reduced
+        groups, first = _merge(book.energy_band_station,
+                                       book.energy_band_price,
+                                       book.energy_band_quantity, tolerance)
+        self.energy_map = groups
+        self.energy_quantity = _group_sum(groups, book.energy_band_quantity,
+                                          len(first))
+
+        reduced.energy_band_names = [book.energy_band_names[i] for i in first]
+        reduced.energy_band_price = book.energy_band_price[first]
+        reduced.energy_band_quantity = self.energy_quantity
+        reduced.station_band_ptr = _pointer(np.bincount(
+            book.energy_band_station[first],
+            minlength=len(book.station_names)))
+        reduced._map_energy_bands()
+
+    def _reduce_reserve(self, tolerance):
+        """ Drop reserve bands and merge those of interruptible load """
+        book = self.book
+        reduced = self.reduced
+        owner = book.reserve_band_provider
+        spinning = book.provider_station[owner] >= 0
+        # Spinning bands are kept apart by keying them on their position
+        key = np.where(spinning, np.arange(len(owner)),
+                       book.reserve_band_price)
+        groups, first = _merge(owner, key, book.reserve_band_quantity,
+                                       tolerance)
+        self.reserve_map = groups
+        self.reserve_quantity = _group_sum(groups,
+                                           book.reserve_band_quantity,
+                                           len(first))
+
+        reduced.reserve_band_names = [book.reserve_band_names[i]
+                                      for i in first]
+        reduced.reserve_band_price = book.reserve_band_price[first]
+        reduced.reserve_band_quantity = self.reserve_quantity
+        reduced.reserve_band_proportion = book.reserve_band_proportion[first]
+        reduced.provider_band_ptr = _pointer(np.bincount(
+            owner[first], minlength=len(book.provider_names)))
+        reduced._map_reserve_bands()
+
+    def expand_energy(self, dispatch):
+        """ Dispatch of the original energy bands from that of the reduced
+            bands
+        """
+        return _expand(self.energy_map, self.book.energy_band_quantity,
+                       self.energy_quantity, dispatch)
+
+    def expand_reserve(self, dispatch):
+        """ Dispatch of the original reserve bands from that of the reduced
+            bands
+        """
+        return _expand(self.reserve_map, self.book.reserve_band_quantity,
+                       self.reserve_quantity, dispatch)
+
+
+def _merge(owner, key, quantity, tolerance):
+    """ Group the bands offering more than tolerance by owner and key.
+
+        Returns the group of each band (-1 if dropped) and the first band of
+        each group. Groups are ordered by owner and then key.
+    """
+    kept = np.flatnonzero(quantity > tolerance)
+    order = kept[np.lexsort((key[kept], owner[kept]))]
+
+    new = np.ones(len(order), dtype=bool)
+    new[1:] = ((owner[order][1:] != owner[order][:-1]) |
+               (key[order][1:] != key[order][:-1]))
+    starts = np.flatnonzero(new)
+
+    groups = np.repeat(-1, len(owner))
+    groups[order] = np.cumsum(new) - 1
+    return groups, order[starts]
+
+
+def _group_sum(groups, values, count):
+    """ Sum of the values of each group, ignoring those outside a group """
+    kept = groups >= 0
+    return np.bincount(groups[kept], weights=values[kept], minlength=count)
+
+
+def _expand(groups, quantity, total, dispatch):
+    """ Split the dispatch of each group between its bands in proportion to
+        their quantities
+    """
+    dispatch = np.asarray(dispatch, dtype=float)
+    expanded = np.zeros(len(groups))
+    kept = groups >= 0
+    expanded[kept] = (dispatch[groups[kept]] * quantity[kept] /
+                      total[groups[kept]])
+    return expanded
+
+
+if __name__ == '__main__':
+    pass
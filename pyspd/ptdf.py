@@ -0,0 +1,350 @@
+"""
+PTDF
+----
+
+DC network formulation using power transfer distribution factors, an
+alternative to the transport model of MatrixBuilder.
+
+The transport model carries a Nodal_Inject variable and two balance rows per
+node along with free band and total flow variables for every branch, and
+lets flows take any path. Here the flow of each branch follows from the
+nodal injections and the branch reactances:
+
+    flow = PTDF (G energy_total - demand)
+
+where G places each station at its node. The model keeps a single energy
+balance row per island and the variables of the offers, reserve and risk.
+Branch flows are expressions rather than variables, and the limits of a
+branch are only added to the model when its flow exceeds, or comes within
+margin of, its capacity (see LPSolver(network='ptdf')). Each addition is
+solved again, warm with an in process backend, until no flow exceeds its
+capacity.
+
+Nodal prices are the price of the island's balance row plus the congestion
+prices of the limited branches weighted by their distribution factors.
+
+The PTDF of a topology is computed once, from a sparse factorisation of the
+reduced susceptance matrix of each island, and cached by the branch ends and
+reactances (see ptdf_matrix).
+"""
+from collections import OrderedDict
+
+import numpy as np
+import scipy.sparse as sp
+from scipy.sparse.csgraph import connected_components
+from scipy.sparse.linalg import splu
+
+from matrix import MatrixBuilder, FAMILY
+
+
+class PTDF:
+    """
+    PTDF
+    ----
+    Power transfer distribution factors of the network of an offer book.
+
+    matrix : dense array (branches x nodes), the flow on each branch of an
+             injection at each node withdrawn at the slack node of its island
+    island : the island of each node
+    slack : the slack node of each island, its first node
+    """
+
+    def __init__(self, book):
+        nn = len(book.node_names)
+        nb = len(book.branch_names)
+        if (book.branch_reactance <= 0).any():
+            raise ValueError("Branch reactances must be positive")
+
+        branches = np.arange(nb)
+        incidence = sp.csr_matrix((np.concatenate([np.ones(nb),
+                                                   -np.ones(nb)]),
+                                   (np.concatenate([branches, branches]),
+                                    np.concatenate([book.branch_from,
+                                                    book.branch_to]))),
+                                  shape=(nb, nn))
+        islands, self.island = connected_components(
+            abs(incidence.T * incidence), directed=False)
+        self.slack = np.unique(self.island, return_index=True)[1]
+
+        keep = np.ones(nn, dtype=bool)
+        keep[self.slack] = False
+        self.matrix = np.zeros((nb, nn))
+        if nb and keep.any():
+            flows = sp.diags(1. / book.branch_reactance) * incidence[:, keep]
+            susceptance = (incidence[:, keep].T * flows).tocsc()
+            # The reduced susceptance matrix is symmetric
+            self.matrix[:, keep] = splu(susceptance).solve(
+                flows.T.toarray()).T
+
+    def flows(self, book, energy):
+        """ Branch flows of the station dispatch and the demand """
+        injection = (np.bincount(book.station_node, weights=energy,
+                                 minlength=len(book.node_names)) -
+                     book.node_demand)
+        return self.matrix.dot(injection)
+
+
+_cache = OrderedDict()
+CACHE_SIZE = 8
+
+
+def ptdf_matrix(book):
+    """ The PTDF of the network of the offer book, cached by topology and
+        reactance (the CACHE_SIZE most recent networks are kept)
+    """
+    key = (len(book.node_names), book.branch_from.tobytes(),
+           book.branch_to.tobytes(), book.branch_reactance.tobytes())
+    if key in _cache:
+        _cache[key] = _cache.pop(key)
+    else:
+        _cache[key] = PTDF(book)
+        while len(_cache) > CACHE_SIZE:
+            _cache.popitem(last=False)
+    return _cache[key]
+
+
+class PTDFBuilder(MatrixBuilder):
+    """
+    PTDFBuilder
+    -----------
+    Builds the DC formulation of the dispatch as a MatrixModel.
+
+    The constraint families are those of MatrixBuilder with the nodal and
+    transmission families replaced by an energy balance row per island
+    (named after and indexed by the island's slack node, in the energy_price
+    family), and with the limits of the given branches (two rows each,
+    <branch>_Flow_Upper and <branch>_Flow_Lower, in the transmission_limit
+    family) after all other rows.
+
+    limits : indices of the branches whose limits are built
+    margin : fraction of its capacity within which a branch's flow is
+             treated as near binding, see limit_violations
+    """
+
+    families = ('system_balance', 'band_offers', 'total_offers',
+                'spinning_reserve', 'risk', 'reserve_dispatch',
+                'branch_limits')
+
+    columns = (("Energy_Band", 'energy_band_names', 0),
+               ("Reserve_Band", 'reserve_band_names', 0),
+               ("Energy_Total", 'station_names', 0),
+               ("Reserve_Total", 'provider_names', 0),
+               ("Risk", 'zone_names', None))
+
+    def __init__(self, ISO, tracer=None, presolve=False, risk=None,
+                 limits=(), margin=0.05):
+        MatrixBuilder.__init__(self, ISO, tracer=tracer, presolve=presolve,
+                               risk=risk)
+        with self.tracer.span('ptdf'):
+            self.ptdf = ptdf_matrix(self.book)
+        self.limits = np.asarray(limits, dtype=int)
+        self.margin = margin
+
+    def _structure(self):
+        book = self.book
+        return (MatrixBuilder._structure(self) +
+                (book.branch_reactance.tobytes(),
+                 np.sort(self.limits).tobytes()))
+
+    def _apply_data(self, model):
+        """ Write the data shared with MatrixBuilder, then the island
+            demand and the bounds shifted by the flows of the demand
+        """
+        MatrixBuilder._apply_data(self, model)
+        book = self.book
+        rows = model.data_rows
+        demand = np.bincount(self.ptdf.island, weights=book.node_demand,
+                             minlength=len(self.ptdf.slack))
+        model.update_rows(rows['balance'], lower=demand, upper=demand)
+
+        # Only the upper limits are bounded above
+        for key, sign, limit in (('limit_upper', 1., True),
+                                 ('limit_lower', -1., True),
+                                 ('risk_sending', 1., False),
+                                 ('risk_receiving', -1., False)):
+            index = rows[key]
+            bound = self._bound(model.row_element[index], sign, limit)
+            if key == 'limit_upper':
+                model.update_rows(index, upper=bound)
+            else:
+                model.update_rows(index, lower=bound)
+
+    def _bound(self, branches, sign, limit):
+        """ Bounds of the limit (capacity +- the flow of the demand) or
+            risk (+- the flow of the demand) rows of the given branches
+        """
+        shift = self.ptdf.matrix[branches].dot(self.book.node_demand)
+        if limit:
+            return shift + sign * self.book.branch_capacity[branches]
+        return sign * shift
+
+    def _flow_terms(self, branches):
+        """ Row offsets, columns and distribution factors of the flow
+            expressions of the given branches in terms of the station
+            dispatch
+        """
+        factors = self.ptdf.matrix[branches][:, self.book.station_node]
+        offsets, stations = np.nonzero(np.abs(factors) > 1e-12)
+        return (offsets, self.start["Energy_Total"] + stations,
+                factors[offsets, stations])
+
+    def _system_balance(self):
+        """ Energy balance of each island, sum(energy_total) == demand """
+        book = self.book
+        ns = len(book.station_names)
+        slack = self.ptdf.slack
+        names = ['_'.join([book.node_names[n], 'Energy_Price'])
+                 for n in slack]
+        zeros = np.zeros(len(slack))
+        first = self._add_block(names, zeros, zeros,
+                                (self.ptdf.island[book.station_node],),
+                                (self.start["Energy_Total"] + np.arange(ns),),
+                                (np.ones(ns),), 'energy_price', slack)
+        self.data_rows['balance'] = first + np.arange(len(slack))
+        self.energy_price_rows = self.data_rows['balance']
+
+    def _branch_limits(self):
+        """ Limits of the flow of each given branch,
+                -capacity <= flow <= capacity
+            as two rows on the station dispatch, upper then lower
+        """
+        first = self._add_block(*self._limit_block(self.limits))
+        self._record_limits(self.data_rows, first, len(self.limits))
+
+    def _limit_block(self, branches):
+        """ Arguments to _add_block for the limits of the given branches,
+            bounded by the current demand
+        """
+        book = self.book
+        nl = len(branches)
+        offsets, cols, vals = self._flow_terms(branches)
+        lower = np.repeat(-np.inf, 2 * nl)
+        upper = np.repeat(np.inf, 2 * nl)
+        upper[0::2] = self._bound(branches, 1., limit=True)
+        lower[1::2] = self._bound(branches, -1., limit=True)
+        names = ['_'.join([book.branch_names[t], limit]) for t in branches
+                 for limit in ('Flow_Upper', 'Flow_Lower')]
+        return (names, lower, upper,
+                (2 * offsets, 2 * offsets + 1), (cols, cols), (vals, vals),
+                'transmission_limit', np.repeat(branches, 2))
+
+    def _record_limits(self, rows, first, count):
+        """ Note the data rows of limits added from row first """
+        upper = first + 2 * np.arange(count)
+        rows['limit_upper'] = np.concatenate([rows.get('limit_upper', []),
+                                              upper]).astype(int)
+        rows['limit_lower'] = np.concatenate([rows.get('limit_lower', []),
+                                              upper + 1]).astype(int)
+
+    def add_limits(self, model, branches):
+        """ Append the limits of further branches to a built model """
+        first = model.shape[0]
+        names, lower, upper, offsets, cols, vals, family, elements = \
+            self._limit_block(branches)
+        model.add_rows(self._block_matrix(model, len(names), offsets, cols,
+                                          vals),
+                       lower, upper, names,
+                       np.repeat(FAMILY[family], len(names)), elements)
+        self._record_limits(model.data_rows, first, len(branches))
+        self.limits = np.concatenate([self.limits, branches])
+        model.structure = self._structure()
+
+    def limit_violations(self, flows, tolerance=1e-6):
+        """ Branches without limits in the model whose flow exceeds their
+            capacity, along with those within margin of it, or no branches
+            if none exceeds its capacity
+        """
+        capacity = self.book.branch_capacity
+        free = np.ones(len(capacity), dtype=bool)
+        free[self.limits] = False
+        flows = np.abs(flows)
+        if not (free & (flows > capacity + tolerance)).any():
+            return np.zeros(0, dtype=int)
+        return np.flatnonzero(free & (flows >= (1 - self.margin) * capacity))
+
+    def _risk_block(self, gens, branches):
+        """ Reserve zone risk as in MatrixBuilder, with the flows of the risk
+            setting branches as expressions of the station dispatch
+        """
+        book = self.book
+        ng = len(gens)
+        nt = len(branches)
+
+        zone = np.concatenate([book.station_zone[gens],
+                               book.node_zone[book.branch_from[branches]],
+                               book.node_zone[book.branch_to[branches]]])
+        kind = np.concatenate([np.zeros(ng), np.ones(2 * nt)])
+        sequence = np.concatenate([gens, 2 * branches, 2 * branches + 1])
+        sign = np.concatenate([np.zeros(ng), np.ones(nt), -np.ones(nt)])
+        setter = np.concatenate([gens, branches, branches]).astype(int)
+        elements = ([book.station_names[i] for i in gens] +
+                    [book.branch_names[t] for t in branches] * 2)
+
+        order = np.lexsort((sequence, kind, zone))
+        nr = len(order)
+        names = ['_'.join([book.zone_names[zone[k]], elements[k]])
+                 for k in order]
+        family = np.concatenate([np.repeat(FAMILY['generator_risk'], ng),
+                                 np.repeat(FAMILY['branch_risk'], 2 * nt)])
+
+        # risk - energy_total >= 0, risk + sign * flow >= 0
+        position = np.empty(nr, dtype=int)
+        position[order] = np.arange(nr)
+        gen_rows = position[:ng]
+        line_rows = position[ng:]
+        offsets, cols, vals = self._flow_terms(setter[ng:])
+        lower = np.zeros(nr)
+        lower[line_rows] = self._bound(setter[ng:], sign[ng:], limit=False)
+
+        self._risk_sign = sign[order]
+        return (names, lower, np.repeat(np.inf, nr),
+                (np.arange(nr), gen_rows, line_rows[offsets]),
+                (self.start["Risk"] + zone[order],
+                 self.start["Energy_Total"] + gens, cols),
+                (np.ones(nr), -np.ones(ng), sign[ng:][offsets] * vals),
+                family[order], setter[order])
+
+    def _risk(self):
+        first = self._add_block(*self._risk_block(self.risk_stations,
+                                                  self.risk_branches))
+        self._record_risk(self.data_rows, first)
+
+    def add_risk(self, model, stations, branches):
+        first = model.shape[0]
+        MatrixBuilder.add_risk(self, model, stations, branches)
+        self._record_risk(model.data_rows, first)
+
+    def _record_risk(self, rows, first):
+        """ Note the data rows of branch risk added from row first """
+        for key, sign in (('risk_sending', 1.), ('risk_receiving', -1.)):
+            added = first + np.flatnonzero(self._risk_sign == sign)
+            rows[key] = np.concatenate([rows.get(key, []),
+                                        added]).astype(int)
+
+    def _block_matrix(self, model, nrows, offsets, cols, vals):
+        """ CSR matrix of a block of rows to append to the model """
+        return sp.coo_matrix((np.concatenate(vals),
+                              (np.concatenate(offsets),
+                               np.concatenate(cols))),
+                             shape=(nrows, model.shape[1])).tocsr()
+
+    def prices(self, model, duals):
+        """ Nodal prices from the duals of the balance, limit and branch
+            risk rows, whose bounds each shift with the flow of the demand
+        """
+        rows = model.data_rows
+        prices = duals[rows['balance']][self.ptdf.island]
+        for key, sign in (('limit_upper', 1.), ('limit_lower', 1.),
+                          ('risk_sending', 1.), ('risk_receiving', -1.)):
+            index = rows[key]
+            prices += sign * duals[index].dot(
+                self.ptdf.matrix[model.row_element[index]])
+        return prices
+
+    def flows(self, model, x):
+        """ Branch flows of a solution of the model """
+        return self.ptdf.flows(self.book, x[model.col_slices['Energy_Total']])
+
+
+if __name__ == '__main__':
+    pass
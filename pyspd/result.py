@@ -0,0 +1,166 @@
+"""
+Result
+------
+
+The dispatch of a solved linear program held as numpy arrays, indexed by the
+ordering of the compiled ISO, so that it may be analysed or exported without
+walking the participant objects.
+
+Pushing the values into the participant objects (Node.add_price,
+Station.add_dispatch etc.) is a separate step, see LPSolver.push_dispatch.
+
+Duals
+-----
+The dual of every constraint is held in a single dense array, with the
+family of each row (see matrix.ROW_FAMILIES) and the element it refers to in
+row_family and row_element. Selections are boolean masks over the rows,
+which may be combined with & and |:
+
+>>> res = Solver.result
+>>> congested = res.family_mask('transmission_limit') & res.binding()
+>>> res.elements(congested)
+
+Export
+------
+to_arrow returns a pyarrow Table for each kind of element, built directly
+from the arrays (numeric columns are not copied), to_parquet writes them.
+
+>>> Solver = LPSolver(SO, backend='highs', push=False)
+>>> Solver.full_setup_and_solve()
+>>> Solver.result.prices
+>>> Solver.result.to_parquet('dispatch', period=12)
+"""
+import os
+
+import numpy as np
+
+from matrix import ROW_FAMILIES, FAMILY
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+    pq = None
+
+
+class DispatchResult:
+    """
+    DispatchResult
+    --------------
+    prices : nodal energy prices, by node_names
+    reserve_prices : reserve zone prices, by zone_names
+    risk : reserve zone risk, by zone_names
+    energy_dispatch : station energy dispatch, by station_names
+    reserve_dispatch : reserve dispatch of spinning stations followed by
+                       interruptible load, by provider_names
+    flows : branch flows, by branch_names
+    duals : dual value of every constraint, by row_names
+    row_family, row_element : family code and element index of each row
+    element_names : names of each kind of element, by kind
+    objective, status : objective value and pulp status code
+    path : how the dispatch was found, 'lp' or 'merit_order'
+    """
+
+    fields = ('prices', 'reserve_prices', 'risk', 'energy_dispatch',
+              'reserve_dispatch', 'flows', 'duals')
+
+    # The element names and array columns of each exported table
+    tables = {'nodes': ('node_names', ('prices',)),
+              'reserve_zones': ('zone_names', ('reserve_prices', 'risk')),
+              'stations': ('station_names', ('energy_dispatch',)),
+              'reserve_providers': ('provider_names', ('reserve_dispatch',)),
+              'branches': ('branch_names', ('flows',)),
+              'constraints': ('row_names', ('duals',))}
+
+    def __init__(self, names, arrays, objective, status, path='lp'):
+        self.node_names = names['nodes']
+        self.zone_names = names['zones']
+        self.station_names = names['stations']
+        self.provider_names = names['providers']
+        self.branch_names = names['branches']
+        self.row_names = names['rows']
+        self.element_names = names['elements']
+        self.row_family = np.asarray(arrays['row_family'])
+        self.row_element = np.asarray(arrays['row_element'])
+        for field in self.fields:
+            setattr(self, field, np.asarray(arrays[field], dtype=float))
+        self.objective = objective
+        self.status = status
+        self.path = path
+
+    def family_mask(self, *families):
+        """ Mask of the rows belonging to any of the named families """
+        selected = np.zeros(len(ROW_FAMILIES), dtype=bool)
+        selected[[FAMILY[f] for f in families]] = True
+        return selected[self.row_family]
+
+    def binding(self, tolerance=1e-9):
+        """ Mask of the rows with a non zero dual """
+        return np.abs(self.duals) > tolerance
+
+    def negative(self):
+        """ Mask of the rows with a negative dual """
+        return self.duals < 0
+
+    def family_duals(self, family):
+        """ Duals of a family by element, in the order of its kind of
+            element. Elements with several rows in the family (e.g. the
+            upper and lower transmission limits) sum their duals.
+        """
+        code = FAMILY[family]
+        kind = ROW_FAMILIES[code][1]
+        rows = self.row_family == code
+        return np.bincount(self.row_element[rows], weights=self.duals[rows],
+                           minlength=len(self.element_names[kind]))
+
+    def elements(self, mask):
+        """ (family, element name, dual) of each selected row """
+        rows = np.flatnonzero(mask)
+        return [(ROW_FAMILIES[f][0],
+                 self.element_names[ROW_FAMILIES[f][1]][e], d)
+                for f, e, d in zip(self.row_family[rows],
+                                   self.row_element[rows],
+                                   self.duals[rows])]
+
+    def to_arrow(self, period=None):
+        """ A pyarrow Table of each kind of element, keyed as in tables,
+            with a trading_period column if a period is given
+        """
+        if pa is None:
+            raise ImportError("Exporting a DispatchResult requires pyarrow")
+        tables = {}
+        for table, (names, fields) in self.tables.items():
+            names = getattr(self, names)
+            columns = [pa.array(names, type=pa.string())]
+            labels = ['name']
+            for field in fields:
+                columns.append(pa.array(getattr(self, field)))
+                labels.append(field)
+            if table == 'constraints':
+                families = [name for name, kind in ROW_FAMILIES]
+                columns.append(pa.DictionaryArray.from_arrays(
+                    self.row_family.astype(np.int32), families))
+                columns.append(pa.array(self.row_element))
+                labels.extend(['family', 'element'])
+            if period is not None:
+                columns.insert(0, pa.repeat(period, len(names)))
+                labels.insert(0, 'trading_period')
+            tables[table] = pa.Table.from_arrays(columns, names=labels)
+        return tables
+
+    def to_parquet(self, directory, period=None):
+        """ Write each table of to_arrow to directory/<table>.parquet,
+            returning the paths written
+        """
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        paths = {}
+        for table, data in self.to_arrow(period).items():
+            paths[table] = os.path.join(directory, table + '.parquet')
+            pq.write_table(data, paths[table])
+        return paths
+
+
+if __name__ == '__main__':
+    pass
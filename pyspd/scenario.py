@@ -0,0 +1,289 @@
+"""
+Scenario
+--------
+
+Sweep many demand and offer price scenarios over a single network.
+
+The ISO is compiled into a MatrixModel once. Each scenario then only writes
+its nodal demand and band costs into the model, which an in process backend
+re-solves (warm started for HiGHS), and the prices, dispatch and flows are
+copied straight from the solution vectors into preallocated arrays. No
+participant objects are touched.
+
+Scenarios are split into contiguous chunks, one per worker process, each
+worker solving its chunk on its own copy of the model.
+
+A sweep which is run many times, as by bidding.BiddingGame, may start its
+workers once with start. Each keeps its model and backend until close, so
+a run only sends the scenario arrays to the workers, which re-solve the
+model already loaded into their backend.
+"""
+import copy
+import multiprocessing
+import time
+
+import numpy as np
+
+from backends import get_backend
+from matrix import MatrixBuilder
+
+
+class ScenarioResult:
+    """
+    ScenarioResult
+    --------------
+    The dispatch of every scenario, stacked by scenario along the first
+    axis. Columns follow the ISO ordering given by the name lists.
+
+    prices : (scenarios, nodes) nodal energy prices
+    reserve_prices : (scenarios, zones) reserve zone prices
+    risk : (scenarios, zones) reserve zone risk
+    energy_dispatch : (scenarios, stations) station energy dispatch
+    reserve_dispatch : (scenarios, providers) reserve dispatch of spinning
+                       stations followed by interruptible load
+    flows : (scenarios, branches) branch flows
+    objective, status : (scenarios,) objective value and pulp status code
+
+    Scenarios which are not solved to optimality (status other than 1) have
+    NaN prices, dispatch, flows and objective.
+
+    node_names, zone_names, station_names, provider_names, branch_names
+    """
+
+    fields = ('prices', 'reserve_prices', 'risk', 'energy_dispatch',
+              'reserve_dispatch', 'flows', 'objective', 'status')
+
+    def __init__(self, book, arrays):
+        self.node_names = book.node_names
+        self.zone_names = book.zone_names
+        self.station_names = book.station_names
+        self.provider_names = book.provider_names
+        self.branch_names = book.branch_names
+        for field in self.fields:
+            setattr(self, field, arrays[field])
+
+    def __len__(self):
+        return len(self.objective)
+
+
+class ScenarioSweep:
+    """
+    ScenarioSweep
+    -------------
+    ISO : a fully defined ISO, compiled on creation
+    processes : number of worker processes, defaults to the number of CPUs.
+                With a single process the scenarios are solved in process.
+    backend : name of an in process backend, 'highs' or 'scipy'
+
+    Scenarios
+    ---------
+    run takes arrays with one row per scenario, any of which may be omitted
+    to keep the base values of the ISO:
+
+    demand : (scenarios, nodes) nodal demand
+    price_multipliers : multipliers of the energy band prices, broadcast to
+                        (scenarios, energy bands). Station multipliers may
+                        be expanded to bands with
+                        sweep.book.energy_band_station.
+    reserve_price_multipliers : as above for the reserve band prices
+
+    Usage
+    -----
+    >>> sweep = ScenarioSweep(SO, processes=8)
+    >>> demand = base_demand * np.random.lognormal(0, 0.1, (10000, 1))
+    >>> result = sweep.run(demand=demand)
+    >>> result.prices.mean(axis=0)
+
+    >>> sweep.start()
+    >>> results = [sweep.run(price_multipliers=m) for m in multipliers]
+    >>> sweep.close()
+    """
+
+    def __init__(self, ISO, processes=None, backend='highs'):
+        if not get_backend(backend).in_process:
+            raise ValueError("ScenarioSweep requires an in process backend")
+        ISO.create_offers()
+        self.book = ISO.offer_book
+        self.model = MatrixBuilder(ISO).build()
+        self.processes = processes or multiprocessing.cpu_count()
+        self.backend = backend
+        self.pool = None
+        self._state = None
+
+    def start(self):
+        """ Start the workers, each loading a copy of the model, to solve
+            every run until close. Does nothing if already started.
+        """
+        if self.pool is not None or self._state is not None:
+            return
+        if self.processes == 1:
+            self._state = {}
+            _initialise_worker(copy.deepcopy(self.model), self.backend,
+                               self._state)
+        else:
+            self.pool = multiprocessing.Pool(self.processes,
+                                             initializer=_initialise_worker,
+                                             initargs=(self.model,
+                                                       self.backend))
+
+    def close(self):
+        """ Stop the workers started by start """
+        if self.pool is not None:
+            self.pool.close()
+            self.pool.join()
+        self.pool = None
+        self._state = None
+
+    def run(self, demand=None, price_multipliers=None,
+            reserve_price_multipliers=None):
+        """ Solve every scenario, returning a ScenarioResult """
+        begin = time.time()
+        book = self.book
+        scenarios = _scenario_count(demand, price_multipliers,
+                                    reserve_price_multipliers)
+        inputs = {
+            'demand': _broadcast(demand, scenarios, len(book.node_names)),
+            'energy': _broadcast(price_multipliers, scenarios,
+                                 len(book.energy_band_names)),
+            'reserve': _broadcast(reserve_price_multipliers, scenarios,
+                                  len(book.reserve_band_names))}
+
+        bounds = np.linspace(0, scenarios, min(self.processes, scenarios) + 1)
+        bounds = bounds.astype(int)
+        chunks = [dict((key, None if value is None else value[b:e])
+                       for key, value in inputs.items())
+                  for b, e in zip(bounds[:-1], bounds[1:])]
+
+        if self.pool is not None:
+            parts = self.pool.map(_solve_chunk, chunks, 1)
+        elif self._state is not None:
+            parts = [_solve_chunk(c, self._state) for c in chunks]
+        elif len(chunks) <= 1:
+            _initialise_worker(copy.deepcopy(self.model), self.backend)
+            parts = [_solve_chunk(c) for c in chunks]
+        else:
+            pool = multiprocessing.Pool(len(chunks),
+                                        initializer=_initialise_worker,
+                                        initargs=(self.model, self.backend))
+            try:
+                parts = pool.map(_solve_chunk, chunks)
+            finally:
+                pool.close()
+                pool.join()
+
+        arrays = dict((field, np.concatenate([p[field] for p in parts])
+                       if parts else np.zeros((0,)))
+                      for field in ScenarioResult.fields)
+        self.result = ScenarioResult(book, arrays)
+        self.run_time = time.time() - begin
+        return self.result
+
+
+def _scenario_count(*arrays):
+    """ Number of scenarios, the length of the first axis of the arrays """
+    counts = set(np.shape(a)[0] for a in arrays
+                 if a is not None and np.ndim(a) > 0)
+    if len(counts) != 1:
+        raise ValueError("At least one scenario array is required and all "
+                         "must share their first dimension")
+    return counts.pop()
+
+
+def _broadcast(values, scenarios, width):
+    """ Broadcast scenario values to (scenarios, width) """
+    if values is None:
+        return None
+    values = np.asarray(values, dtype=float)
+    if values.ndim == 1:
+        values = values[:, None]
+    return np.broadcast_to(values, (scenarios, width))
+
+
+# State of each worker process, set up once by _initialise_worker
+_worker = {}
+
+
+def _initialise_worker(model, backend, state=_worker):
+    """ Keep the worker's copy of the model, its base costs and row bounds
+        and a backend
+    """
+    state['model'] = model
+    state['backend'] = get_backend(backend)
+    state['cost'] = model.cost.copy()
+    state['row_lower'] = model.row_lower.copy()
+    state['row_upper'] = model.row_upper.copy()
+
+
+def _solve_chunk(chunk, state=_worker):
+    """ Solve a contiguous chunk of scenarios on the worker model """
+    model = state['model']
+    backend = state['backend']
+    base = state['cost']
+
+    demand_rows = model.price_rows['energy']
+    reserve_rows = model.price_rows['reserve']
+    cols = model.col_slices
+    energy_cols = np.arange(cols['Energy_Band'].start,
+                            cols['Energy_Band'].stop)
+    reserve_cols = np.arange(cols['Reserve_Band'].start,
+                             cols['Reserve_Band'].stop)
+
+    scenarios = _scenario_count(*chunk.values())
+    widths = {'prices': len(demand_rows), 'reserve_prices': len(reserve_rows),
+              'risk': len(reserve_rows),
+              'energy_dispatch': _width(cols['Energy_Total']),
+              'reserve_dispatch': _width(cols['Reserve_Total']),
+              'flows': _width(cols['Transmission_Total'])}
+    out = dict((field, np.empty((scenarios, width)))
+               for field, width in widths.items())
+    out['objective'] = np.empty(scenarios)
+    out['status'] = np.empty(scenarios, dtype=int)
+
+    # Inputs omitted from this run take their base values and the first
+    # scenario is solved cold, so that a run dispatches the same (among
+    # tied optima) whichever runs the worker solved before it
+    backend.clear_basis()
+    if chunk['demand'] is None:
+        model.update_rows(demand_rows, state['row_lower'][demand_rows],
+                          state['row_upper'][demand_rows])
+    if chunk['energy'] is None:
+        model.update_cost(energy_cols, base[energy_cols])
+    if chunk['reserve'] is None:
+        model.update_cost(reserve_cols, base[reserve_cols])
+
+    for k in range(scenarios):
+        if chunk['demand'] is not None:
+            model.update_rows(demand_rows, -chunk['demand'][k],
+                              -chunk['demand'][k])
+        if chunk['energy'] is not None:
+            model.update_cost(energy_cols,
+                              base[energy_cols] * chunk['energy'][k])
+        if chunk['reserve'] is not None:
+            model.update_cost(reserve_cols,
+                              base[reserve_cols] * chunk['reserve'][k])
+
+        solution = backend.solve(model)
+        out['status'][k] = solution.status
+        if solution.status != 1:
+            for field in widths:
+                out[field][k] = np.nan
+            out['objective'][k] = np.nan
+            continue
+        x = solution.x
+        out['prices'][k] = -solution.duals[demand_rows]
+        out['reserve_prices'][k] = solution.duals[reserve_rows]
+        out['risk'][k] = x[cols['Risk']]
+        out['energy_dispatch'][k] = x[cols['Energy_Total']]
+        out['reserve_dispatch'][k] = x[cols['Reserve_Total']]
+        out['flows'][k] = x[cols['Transmission_Total']]
+        out['objective'][k] = solution.objective
+    return out
+
+
+def _width(columns):
+    """ Number of columns in a slice """
+    return columns.stop - columns.start
+
+
+if __name__ == '__main__':
+    pass
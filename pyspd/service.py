@@ -0,0 +1,438 @@
+"""
+Service
+-------
+
+A local dispatch service, so that other systems may dispatch offer books
+without paying the cost of starting Python and importing pulp for every
+request.
+
+The service is an asyncio HTTP server, over TCP or a Unix socket, in front
+of a bounded pool of worker processes. Each worker imports pyspd once when
+the pool starts and then, for every request, builds the ISO described by
+the payload, solves it with an LPSolver and sends back its result.
+
+Requires Python 3, it is not imported by api.
+
+Endpoints
+---------
+POST /dispatch : dispatch the JSON payload below, returning the result as
+                 JSON, or a table of the result as an Arrow IPC stream with
+                 ?format=arrow&table=<table> (see DispatchResult.tables,
+                 'nodes' by default)
+GET /status : counts of the requests queued, running, completed, rejected
+              and failed
+
+Payload
+-------
+The network, in the order the elements are created:
+
+    reserve_zones : [name, ...]
+    nodes : [{name, zone, demand}, ...]
+    branches : [{from, to, capacity, risk, reactance}, ...]
+    stations : [{name, node, capacity, spinning, risk, company}, ...]
+    interruptible_loads : [{name, node, company}, ...]
+
+along with the offers and demand of the trading period, in the format of a
+batch.BatchDispatch period (period, demand, energy_offers, reserve_offers,
+il_offers). Keys other than the names are optional.
+
+Queuing and Back Pressure
+-------------------------
+At most workers requests are solved at once, up to queue_size more wait
+for a worker. Further requests are refused at once with 503 Service
+Unavailable and a Retry-After header rather than queued without bound.
+A request not answered within timeout seconds (if given) gets 504. If it
+was still waiting for a worker it is dropped. If its solve had started, the
+solve keeps its worker and its place in the bound until it ends, since a
+running solve can not be stopped.
+
+Timing
+------
+Every JSON response carries a timing object: seconds spent queued for a
+worker, in setup, solve and dispatch of the LPSolver and in total. The
+total is also sent as the X-Dispatch-Time header of either format.
+
+Shutdown
+--------
+close stops accepting connections, lets the requests already accepted run
+to completion and then shuts down the worker pool. serve closes the
+service on SIGINT or SIGTERM.
+
+Usage
+-----
+>>> service = DispatchService(port=8750, workers=4, backend='highs')
+>>> asyncio.run(service.serve())
+
+$ python service.py --port 8750 --workers 4 --backend highs
+$ curl -X POST --data @payload.json localhost:8750/dispatch
+
+fetch is a minimal client, e.g. for tests on localhost.
+"""
+import argparse
+import asyncio
+import concurrent.futures
+import json
+import multiprocessing
+import os
+import signal
+import time
+from urllib.parse import urlsplit, parse_qs
+
+from api import ISO, ReserveZone, Node, Branch, Station
+from api import InterruptibleLoad, Company, LPSolver
+from batch import PeriodResult, apply_period
+
+try:
+    import pyarrow as pa
+except ImportError:
+    pa = None
+
+
+REASONS = {200: 'OK', 400: 'Bad Request', 404: 'Not Found',
+           405: 'Method Not Allowed', 500: 'Internal Server Error',
+           503: 'Service Unavailable', 504: 'Gateway Timeout'}
+
+# Errors of the payload rather than of the service
+PAYLOAD_ERRORS = (KeyError, ValueError, TypeError, AttributeError)
+
+
+class DispatchService:
+    """
+    DispatchService
+    ---------------
+    host, port : TCP address to listen on, port 0 picks a free port (see
+                 address once started)
+    path : Unix socket path to listen on instead of TCP
+    workers : number of worker processes, defaults to the number of CPUs
+    queue_size : number of requests which may wait for a worker
+    backend : name of the backend of each worker's LPSolver
+    timeout : seconds after which an unanswered request gets 504
+    """
+
+    def __init__(self, host='127.0.0.1', port=8750, path=None, workers=None,
+                 queue_size=16, backend='coin', timeout=None):
+        self.host = host
+        self.port = port
+        self.path = path
+        self.workers = workers or os.cpu_count()
+        self.queue_size = queue_size
+        self.backend = backend
+        self.timeout = timeout
+        self.server = None
+        self.pool = None
+        self.stats = {'queued': 0, 'running': 0, 'completed': 0,
+                      'rejected': 0, 'failed': 0}
+
+    async def start(self):
+        """ Start the worker pool and listen for requests """
+        # Workers are spawned rather than forked, and before listening, so
+        # that none holds a copy of a client connection
+        self.pool = concurrent.futures.ProcessPoolExecutor(
+            self.workers, mp_context=multiprocessing.get_context('spawn'))
+        loop = asyncio.get_running_loop()
+        await asyncio.gather(*[loop.run_in_executor(self.pool, _ready)
+                               for k in range(self.workers)])
+        self._slots = asyncio.Semaphore(self.workers)
+        self._requests = set()
+        self._jobs = set()
+        self._waiting = set()
+        self._admitted = 0
+        if self.path is not None:
+            self.server = await asyncio.start_unix_server(self._handle,
+                                                          path=self.path)
+        else:
+            self.server = await asyncio.start_server(self._handle, self.host,
+                                                     self.port)
+        self.address = self.server.sockets[0].getsockname()
+
+    async def close(self):
+        """ Stop accepting requests, finish those accepted and shut down
+            the worker pool
+        """
+        if self.server is None:
+            return
+        self.server.close()
+        await self.server.wait_closed()
+        if self._requests:
+            await asyncio.wait(self._requests)
+        if self._jobs:
+            await asyncio.wait(self._jobs)
+        self.pool.shutdown(wait=True)
+        self.server = None
+
+    async def serve(self):
+        """ Start the service and run it until SIGINT or SIGTERM """
+        await self.start()
+        stop = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(signum, stop.set)
+        try:
+            await stop.wait()
+        finally:
+            await self.close()
+
+    async def _handle(self, reader, writer):
+        """ Answer a single request on a connection """
+        task = asyncio.current_task()
+        self._requests.add(task)
+        try:
+            status, headers, body = await self._respond(reader)
+            writer.write(_response(status, headers, body))
+            await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+            self._requests.discard(task)
+
+    async def _respond(self, reader):
+        """ Status, headers and body of the response to a request """
+        try:
+            method, target, body = await _read_request(reader)
+        except ValueError as e:
+            return _json(400, {'error': str(e)})
+        url = urlsplit(target)
+        query = dict((k, v[-1]) for k, v in parse_qs(url.query).items())
+
+        if url.path == '/status':
+            return _json(200, self.stats)
+        if url.path != '/dispatch':
+            return _json(404, {'error': 'No such endpoint %s' % url.path})
+        if method != 'POST':
+            return _json(405, {'error': 'Dispatch with POST'})
+        fmt = query.get('format', 'json')
+        if fmt not in ('json', 'arrow'):
+            return _json(400, {'error': 'Unknown format %s' % fmt})
+        if fmt == 'arrow' and pa is None:
+            return _json(400, {'error': 'Arrow responses require pyarrow'})
+        try:
+            payload = json.loads(body.decode('utf-8'))
+        except ValueError as e:
+            return _json(400, {'error': 'Invalid JSON: %s' % e})
+
+        # Refuse rather than queue beyond the workers and the queue
+        if self._admitted >= self.workers + self.queue_size:
+            self.stats['rejected'] += 1
+            status, headers, body = _json(503, {'error': 'Queue is full'})
+            headers['Retry-After'] = '1'
+            return status, headers, body
+
+        begin = time.time()
+        self._admitted += 1
+        job = asyncio.ensure_future(self._dispatch(payload))
+        self._jobs.add(job)
+        job.add_done_callback(self._finished)
+        try:
+            period, result, timing = await asyncio.wait_for(
+                asyncio.shield(job), self.timeout)
+        except asyncio.TimeoutError:
+            # Only a request still waiting for a worker is given up
+            if job in self._waiting:
+                job.cancel()
+            self.stats['failed'] += 1
+            return _json(504, {'error': 'Dispatch timed out'})
+        except PAYLOAD_ERRORS as e:
+            self.stats['failed'] += 1
+            return _json(400, {'error': '%s: %s' % (type(e).__name__, e)})
+        except Exception as e:
+            self.stats['failed'] += 1
+            return _json(500, {'error': '%s: %s' % (type(e).__name__, e)})
+        self.stats['completed'] += 1
+        timing['total'] = time.time() - begin
+
+        if fmt == 'arrow':
+            table = query.get('table', 'nodes')
+            if table not in result.tables:
+                return _json(400, {'error': 'Unknown table %s' % table})
+            status, headers, body = 200, {}, _arrow(
+                result.to_arrow(period.period)[table])
+            headers['Content-Type'] = 'application/vnd.apache.arrow.stream'
+        else:
+            values = dict((k, v) for k, v in period.__dict__.items()
+                          if not k.endswith('_time'))
+            values['timing'] = timing
+            status, headers, body = _json(200, values)
+        headers['X-Dispatch-Time'] = '%.6f' % timing['total']
+        return status, headers, body
+
+    def _finished(self, job):
+        """ Give up the place of a request in the bound once its dispatch
+            has ended, whether or not the request is still waiting for it
+        """
+        self._admitted -= 1
+        self._jobs.discard(job)
+        if not job.cancelled():
+            # Retrieved so that a timed out failure is not reported
+            job.exception()
+
+    async def _dispatch(self, payload):
+        """ Solve a payload on a worker once one is free """
+        queued = time.time()
+        self.stats['queued'] += 1
+        job = asyncio.current_task()
+        self._waiting.add(job)
+        try:
+            await self._slots.acquire()
+        finally:
+            self._waiting.discard(job)
+            self.stats['queued'] -= 1
+        self.stats['running'] += 1
+        try:
+            loop = asyncio.get_running_loop()
+            wait = time.time() - queued
+            period, result = await loop.run_in_executor(
+                self.pool, dispatch_payload, payload, self.backend)
+        finally:
+            self.stats['running'] -= 1
+            self._slots.release()
+        timing = {'queued': wait, 'setup': period.setup_time,
+                  'solve': period.solution_time,
+                  'dispatch': period.dispatch_time}
+        return period, result, timing
+
+
+def build_iso(payload):
+    """ The ISO of the network of a payload, with the offers and demand of
+        its period applied and compiled
+    """
+    SO = ISO(payload.get('name', 'System Operator'))
+    zones = dict((name, ReserveZone(name, SO)) for name in
+                 payload.get('reserve_zones', []))
+    nodes = {}
+    for spec in payload.get('nodes', []):
+        nodes[spec['name']] = Node(spec['name'], SO, zones[spec['zone']],
+                                   demand=spec.get('demand', 0))
+    for spec in payload.get('branches', []):
+        Branch(nodes[spec['from']], nodes[spec['to']], SO,
+               capacity=spec.get('capacity', 0),
+               risk=spec.get('risk', False),
+               reactance=spec.get('reactance', 1.0))
+
+    companies = {}
+
+    def company(spec):
+        name = spec.get('company', 'Company')
+        if name not in companies:
+            companies[name] = Company(name)
+        return companies[name]
+
+    for spec in payload.get('stations', []):
+        Station(spec['name'], nodes[spec['node']], SO, company(spec),
+                capacity=spec.get('capacity', 0),
+                spinning=spec.get('spinning', False),
+                risk=spec.get('risk', True))
+    for spec in payload.get('interruptible_loads', []):
+        InterruptibleLoad(spec['name'], nodes[spec['node']], SO,
+                          company(spec))
+
+    # Compiles the offers
+    apply_period(SO, payload)
+    return SO
+
+
+def dispatch_payload(payload, backend='coin'):
+    """ Build and solve the ISO of a payload, returning its PeriodResult
+        and DispatchResult
+    """
+    SO = build_iso(payload)
+    Solver = LPSolver(SO, backend=backend, push=False)
+    Solver.full_setup_and_solve()
+    return PeriodResult(payload.get('period'), SO, Solver), Solver.result
+
+
+async def fetch(address, method, target, payload=None):
+    """ Send a request to a service at address, a (host, port) pair or a
+        Unix socket path, returning the status, headers and body of the
+        response
+    """
+    if isinstance(address, str):
+        reader, writer = await asyncio.open_unix_connection(address)
+    else:
+        reader, writer = await asyncio.open_connection(*address[:2])
+    body = json.dumps(payload).encode('utf-8') if payload is not None else b''
+    writer.write(('%s %s HTTP/1.1\r\nHost: localhost\r\n'
+                  'Content-Length: %d\r\n\r\n' % (method, target, len(body)))
+                 .encode('latin-1') + body)
+    response = await reader.read()
+    writer.close()
+    head, _, body = response.partition(b'\r\n\r\n')
+    lines = head.decode('latin-1').split('\r\n')
+    headers = dict(line.split(': ', 1) for line in lines[1:])
+    return int(lines[0].split()[1]), headers, body
+
+
+def _ready():
+    """ Called on the workers as the service starts, by which time they
+        have imported pyspd
+    """
+    return os.getpid()
+
+
+async def _read_request(reader):
+    """ Method, target and body of an HTTP request """
+    line = await reader.readline()
+    parts = line.decode('latin-1').split()
+    if len(parts) != 3:
+        raise ValueError("Malformed request line")
+    method, target, version = parts
+
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b'\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        headers[name.strip().lower()] = value.strip()
+    length = int(headers.get('content-length', 0))
+    body = await reader.readexactly(length) if length else b''
+    return method, target, body
+
+
+def _json(status, values):
+    """ A JSON response """
+    body = json.dumps(values, default=_plain).encode('utf-8')
+    return status, {'Content-Type': 'application/json'}, body
+
+
+def _plain(value):
+    """ Plain values of the numpy values of a result """
+    if hasattr(value, 'tolist'):
+        return value.tolist()
+    raise TypeError("%r is not JSON serialisable" % (value,))
+
+
+def _arrow(table):
+    """ A table as an Arrow IPC stream """
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as stream:
+        stream.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+
+def _response(status, headers, body):
+    """ The bytes of an HTTP response, the connection closing after it """
+    lines = ['HTTP/1.1 %d %s' % (status, REASONS[status])]
+    headers = dict(headers, **{'Content-Length': str(len(body)),
+                               'Connection': 'close'})
+    lines.extend('%s: %s' % item for item in headers.items())
+    return ('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1') + body
+
+
+def main():
+    parser = argparse.ArgumentParser(description="pyspd dispatch service")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8750)
+    parser.add_argument('--path', help="Unix socket path, instead of TCP")
+    parser.add_argument('--workers', type=int)
+    parser.add_argument('--queue-size', type=int, default=16)
+    parser.add_argument('--backend', default='coin')
+    parser.add_argument('--timeout', type=float)
+    args = parser.parse_args()
+    service = DispatchService(args.host, args.port, args.path, args.workers,
+                              args.queue_size, args.backend, args.timeout)
+    asyncio.run(service.serve())
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,202 @@
+"""
+Snapshot
+--------
+
+Save the compiled state of a dispatch to disk and load it back without
+recreating the participant objects or recompiling the ISO.
+
+A snapshot is a directory holding the offer book of a compiled ISO and,
+optionally, a MatrixModel built from it and a solved DispatchResult, each
+in a subdirectory of its own ('book', 'model' and 'result'). Every array is
+written as a raw .npy file, the names and other small values go into a
+single meta.pickle alongside them.
+
+On load the arrays are memory mapped (mmap_mode='r' by default), so that
+loading a snapshot of a multi GB replay takes no longer than reading its
+names, and the pages of the arrays are only read as they are used. Worker
+processes loading the same snapshot share those pages through the
+operating system rather than each holding a copy. Memory mapped arrays are
+read only, load with mmap_mode='c' (copy on write) or None (into memory)
+to recompile or update the loaded book or model in place.
+
+Models built with presolve are not saved, their columns refer to the
+reduced offer book.
+
+Usage
+-----
+>>> SO.create_offers()
+>>> Solver = LPSolver(SO, build='matrix', backend='highs')
+>>> Solver.full_setup_and_solve()
+>>> save_snapshot('period_1', SO.offer_book, Solver.model, Solver.result)
+
+>>> snap = Snapshot('period_1')
+>>> solution = get_backend('highs').solve(snap.model)
+>>> model = MatrixBuilder(snap).build()
+"""
+import os
+import pickle
+
+import numpy as np
+import scipy.sparse as sp
+
+from offerbook import OfferBook, _index
+from matrix import MatrixModel
+from result import DispatchResult
+from instrument import Tracer
+
+META = 'meta.pickle'
+
+# Dictionaries of the offer book rebuilt from its names on load
+BOOK_INDICES = {'node_index': 'node_names',
+                'station_index': 'station_names',
+                'provider_index': 'provider_names',
+                'branch_index': 'branch_names'}
+
+MODEL_FIELDS = ('cost', 'row_lower', 'row_upper', 'col_lower', 'col_upper',
+                'row_names', 'col_names', 'col_slices', 'col_elements')
+
+
+class Snapshot:
+    """
+    Snapshot
+    --------
+    Loads the parts of a snapshot directory which it holds, as attributes
+    offer_book, model and result (None if absent). With a tracer it may
+    stand in for the ISO of a MatrixBuilder.
+    """
+
+    def __init__(self, directory, mmap_mode='r'):
+        self.directory = directory
+        self.tracer = Tracer()
+        parts = (('offer_book', 'book', load_book),
+                 ('model', 'model', load_model),
+                 ('result', 'result', load_result))
+        for attribute, part, load in parts:
+            path = os.path.join(directory, part)
+            value = load(path, mmap_mode) if os.path.isdir(path) else None
+            setattr(self, attribute, value)
+
+
+def save_snapshot(directory, book, model=None, result=None):
+    """ Save the offer book, and the model and result if given """
+    save_book(book, os.path.join(directory, 'book'))
+    if model is not None:
+        save_model(model, os.path.join(directory, 'model'))
+    if result is not None:
+        save_result(result, os.path.join(directory, 'result'))
+
+
+def save_book(book, directory):
+    """ Save a compiled offer book """
+    values = dict((k, v) for k, v in book.__dict__.items()
+                  if k not in BOOK_INDICES and k != 'parent_index')
+    _save(directory, values)
+
+
+def load_book(directory, mmap_mode='r'):
+    """ Load an offer book saved with save_book """
+    book = OfferBook()
+    book.__dict__.update(_load(directory, mmap_mode))
+    for index, names in BOOK_INDICES.items():
+        setattr(book, index, _index(getattr(book, names)))
+    return book
+
+
+def save_model(model, directory):
+    """ Save a MatrixModel, without its pending changes """
+    if model.presolve is not None:
+        raise ValueError("Models built with presolve can not be saved")
+    A = model.A.tocsr()
+    values = dict((k, v) for k, v in model.__dict__.items()
+                  if k not in ('A', 'changes', 'presolve'))
+    values.update(A_data=A.data, A_indices=A.indices, A_indptr=A.indptr,
+                  A_shape=A.shape)
+    _save(directory, values)
+
+
+def load_model(directory, mmap_mode='r'):
+    """ Load a MatrixModel saved with save_model """
+    values = _load(directory, mmap_mode)
+    A = sp.csr_matrix((values.pop('A_data'), values.pop('A_indices'),
+                       values.pop('A_indptr')), shape=values.pop('A_shape'),
+                      copy=False)
+    model = MatrixModel(A, *[values.pop(k) for k in MODEL_FIELDS])
+    model.__dict__.update(values)
+    return model
+
+
+def save_result(result, directory):
+    """ Save a DispatchResult """
+    _save(directory, result.__dict__)
+
+
+def load_result(directory, mmap_mode='r'):
+    """ Load a DispatchResult saved with save_result """
+    values = _load(directory, mmap_mode)
+    names = {'nodes': values['node_names'],
+             'zones': values['zone_names'],
+             'stations': values['station_names'],
+             'providers': values['provider_names'],
+             'branches': values['branch_names'],
+             'rows': values['row_names'],
+             'elements': values['element_names']}
+    arrays = dict((field, values[field]) for field in
+                  DispatchResult.fields + ('row_family', 'row_element'))
+    return DispatchResult(names, arrays, values['objective'],
+                          values['status'], values['path'])
+
+
+def _save(directory, values):
+    """ Write each array, and each dictionary of arrays, as .npy files and
+        everything else into the meta file
+    """
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    meta = {}
+    for key, value in values.items():
+        if isinstance(value, np.ndarray):
+            np.save(os.path.join(directory, key + '.npy'), value)
+            meta[key] = ('array', None)
+        elif (isinstance(value, dict) and value and
+              all(isinstance(v, np.ndarray) for v in value.values())):
+            for name, array in value.items():
+                np.save(os.path.join(directory, '%s.%s.npy' % (key, name)),
+                        array)
+            meta[key] = ('arrays', sorted(value))
+        else:
+            meta[key] = ('value', value)
+    with open(os.path.join(directory, META), 'wb') as f:
+        pickle.dump(meta, f, pickle.HIGHEST_PROTOCOL)
+
+
+def _load(directory, mmap_mode):
+    """ Values written by _save, the arrays mapped with mmap_mode """
+    with open(os.path.join(directory, META), 'rb') as f:
+        meta = pickle.load(f)
+    values = {}
+    for key, (kind, value) in meta.items():
+        if kind == 'array':
+            values[key] = _array(os.path.join(directory, key + '.npy'),
+                                 mmap_mode)
+        elif kind == 'arrays':
+            values[key] = dict(
+                (name, _array(os.path.join(directory, '%s.%s.npy' %
+                                           (key, name)), mmap_mode))
+                for name in value)
+        else:
+            values[key] = value
+    return values
+
+
+def _array(path, mmap_mode):
+    """ Load an array, mapping it unless it is empty (an empty file can
+        not be mapped by older versions of numpy)
+    """
+    try:
+        return np.load(path, mmap_mode=mmap_mode)
+    except ValueError:
+        return np.load(path)
+
+
+if __name__ == '__main__':
+    pass
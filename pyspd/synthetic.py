@@ -0,0 +1,92 @@
+"""
+Synthetic
+---------
+
+Seeded generation of synthetic networks, with offers, for testing and
+benchmarking the dispatch at scale.
+
+The network is a random spanning tree over the nodes, so that it is always
+connected, with further branches added between random pairs of nodes. Nodes
+are split into contiguous reserve zones and branches between zones set the
+risk. Half of the stations are spinning and offer reserve, while an
+interruptible load in each zone offers enough expensive reserve to cover
+any risk, so that every generated dispatch is feasible.
+"""
+import numpy as np
+
+from iso import ISO
+from participants import Node, Branch, ReserveZone, Station
+from participants import InterruptibleLoad, Company
+
+
+def create_grid(nodes=10, branch_density=0.1, stations=20, bands=3,
+                reserve_zones=2, seed=0):
+    """ Create a fully offered (uncompiled) ISO
+
+        nodes : number of nodes
+        branch_density : fraction of the node pairs, beyond those of the
+                         spanning tree, joined by a branch
+        stations : number of generation stations, placed at random nodes
+        bands : number of energy offer bands per station
+        reserve_zones : number of reserve zones
+        seed : random seed, the same arguments always give the same grid
+    """
+    rng = np.random.RandomState(seed)
+    SO = ISO("Synthetic %d" % seed)
+
+    zones = [ReserveZone("RZ%d" % z, SO) for z in range(reserve_zones)]
+    node_zone = np.arange(nodes) * reserve_zones // nodes
+    demand = rng.uniform(10, 100, nodes).round(1)
+    grid = [Node("N%d" % n, SO, zones[node_zone[n]], demand=demand[n])
+            for n in range(nodes)]
+
+    # Capacity to carry all of the demand across any branch
+    capacity = demand.sum()
+    for a, b in _branch_pairs(rng, nodes, branch_density):
+        Branch(grid[a], grid[b], SO, capacity=capacity,
+               risk=node_zone[a] != node_zone[b])
+
+    # Stations together able to supply twice the demand
+    station_capacity = 2 * capacity / stations
+    CO = Company("Generator")
+    for s in range(stations):
+        ST = Station("ST%d" % s, grid[rng.randint(nodes)], SO, CO,
+                     capacity=station_capacity, spinning=s % 2 == 0)
+        prices = np.sort(rng.uniform(0, 150, bands)).round(2)
+        ST.add_multiple_energy_offers(
+            bands=[str(b + 1) for b in range(bands)], prices=prices,
+            offers=np.repeat(station_capacity / bands, bands))
+        if ST.spinning:
+            ST.add_reserve_offer(band='1', price=round(rng.uniform(0, 20), 2),
+                                 offer=station_capacity / 4, prop=0.5)
+
+    ILC = Company("Interruptible Load")
+    for z, RZ in enumerate(zones):
+        IL = InterruptibleLoad("IL%d" % z, RZ.nodes[0], SO, ILC)
+        IL.add_offer(band='1', price=500, offer=2 * capacity)
+
+    return SO
+
+
+def _branch_pairs(rng, nodes, density):
+    """ Node pairs of a random spanning tree followed by the extra branches,
+        sending node first
+    """
+    order = rng.permutation(nodes)
+    pairs = [(order[rng.randint(k)], order[k]) for k in range(1, nodes)]
+
+    existing = set(tuple(sorted(p)) for p in pairs)
+    candidates = (nodes * (nodes - 1)) // 2 - len(existing)
+    extra = int(round(min(density, 1.) * candidates))
+    while extra > 0:
+        a, b = rng.randint(nodes, size=2)
+        pair = tuple(sorted((a, b)))
+        if a != b and pair not in existing:
+            existing.add(pair)
+            pairs.append((a, b))
+            extra -= 1
+    return pairs
+
+
+if __name__ == '__main__':
+    pass
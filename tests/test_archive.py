@@ -0,0 +1,147 @@
+""" Test the memory mapped offer archive """
+
+from nose.tools import *
+from nose.plugins.skip import SkipTest
+
+import os
+import shutil
+import sys
+import tempfile
+sys.path.append(os.path.expanduser('~/python/pyspd/pyspd/'))
+
+import numpy as np
+
+from api import *
+import archive
+import batch
+
+
+def create_system():
+    SO = ISO("System Operator")
+    RZ = ReserveZone("RZ", SO)
+    ND1 = Node("ND1", SO, RZ, demand=50)
+    ND2 = Node("ND2", SO, RZ, demand=50)
+    Branch(ND1, ND2, SO, capacity=300)
+    CO = Company("CO")
+    Station("ST1", ND1, SO, CO, capacity=300, spinning=True)
+    Station("ST2", ND2, SO, CO, capacity=300)
+    InterruptibleLoad("IL", ND2, SO, CO)
+    return SO
+
+
+def create_periods():
+    return [{'period': 1,
+             'energy_offers': {'ST1': {'bands': ['1', '2'],
+                                       'prices': [10, 30],
+                                       'offers': [100, 100]},
+                               'ST2': ({'band': '1', 'price': 20,
+                                        'offer': 100},)},
+             'reserve_offers': {'ST1': ({'band': '1', 'price': 1,
+                                         'offer': 50, 'prop': 0.5},)},
+             'il_offers': {'IL': {'bands': ['1'], 'prices': [2],
+                                  'offers': [30]}},
+             'demand': {'ND1': 80}},
+            {'period': 2,
+             'energy_offers': {'ST1': {'bands': ['1'], 'prices': [15],
+                                       'offers': [150]}},
+             'demand': {'ND1': 120, 'ND2': 10}},
+            {'period': 5,
+             'il_offers': {'IL': ({'band': '1', 'price': 4,
+                                   'offer': 20},)}}]
+
+
+def test_archive():
+
+    directory = tempfile.mkdtemp()
+    try:
+        assert archive.write_archive(directory, create_periods()) == 3
+        offers = archive.OfferArchive(directory)
+        assert len(offers) == 3
+        assert isinstance(offers.columns['energy', 'price'], np.memmap)
+
+        first = offers[1]
+        assert first['period'] == 1
+        assert first['energy_offers']['ST1']['bands'] == ['1', '2']
+        assert first['energy_offers']['ST1']['prices'].tolist() == [10, 30]
+        assert first['energy_offers']['ST2']['offers'].tolist() == [100]
+        assert first['reserve_offers']['ST1']['props'].tolist() == [0.5]
+        assert 'props' not in first['il_offers']['IL']
+        assert first['demand'] == {'ND1': 80}
+
+        assert offers[2]['reserve_offers'] == {}
+        assert offers[2]['demand'] == {'ND1': 120, 'ND2': 10}
+        assert offers[5]['il_offers']['IL']['prices'].tolist() == [4]
+        assert_raises(KeyError, offers.__getitem__, 3)
+
+        assert [p['period'] for p in offers.between(2, 5)] == [2]
+        assert [p['period'] for p in offers.between(0, 10)] == [1, 2, 5]
+        assert [p['period'] for p in offers] == [1, 2, 5]
+
+        # Applying a period gives the ISO of the original period
+        SO = create_system()
+        Other = create_system()
+        for label, period in zip(offers.labels, create_periods()):
+            offers.apply(SO, label)
+            batch.apply_period(Other, period)
+            assert (SO.offer_book.fingerprint() ==
+                    Other.offer_book.fingerprint())
+    finally:
+        shutil.rmtree(directory)
+
+
+def test_archive_cleared():
+
+    directory = tempfile.mkdtemp()
+    periods = create_periods()[:1] + [
+        {'period': 2,
+         'energy_offers': {'ST1': []},
+         'reserve_offers': {'ST1': ()},
+         'il_offers': {'IL': {'bands': [], 'prices': [], 'offers': []}}}]
+    try:
+        archive.write_archive(directory, periods)
+        offers = archive.OfferArchive(directory)
+        second = offers[2]
+        assert second['energy_offers']['ST1']['bands'] == []
+        assert len(second['reserve_offers']['ST1']['props']) == 0
+        assert second['il_offers']['IL']['bands'] == []
+        assert 'props' not in second['il_offers']['IL']
+
+        # The cleared offers are cleared, not restored to the base ISO
+        SO = create_system()
+        Other = create_system()
+        for label, period in zip(offers.labels, periods):
+            offers.apply(SO, label)
+            batch.apply_period(Other, period)
+        assert (SO.offer_book.fingerprint() ==
+                Other.offer_book.fingerprint())
+        assert len(SO.station_name_map['ST1'].energy.labels) == 0
+        assert len(SO.station_name_map['ST1'].reserve.labels) == 0
+    finally:
+        shutil.rmtree(directory)
+
+
+def test_archive_dates():
+
+    directory = tempfile.mkdtemp()
+    try:
+        start = np.datetime64('2012-01-01T00:00')
+        with archive.ArchiveWriter(directory) as writer:
+            for k in range(96):
+                writer.add({'period': start + np.timedelta64(30 * k, 'm'),
+                            'demand': {'ND1': float(k)}})
+            assert_raises(ValueError, writer.add, {'period': start})
+
+        offers = archive.OfferArchive(directory)
+        day = list(offers.between(np.datetime64('2012-01-02'),
+                                  np.datetime64('2012-01-03')))
+        assert len(day) == 48
+        assert day[0]['period'] == np.datetime64('2012-01-02T00:00')
+        assert day[0]['demand'] == {'ND1': 48.}
+        assert offers[np.datetime64('2012-01-01T12:00')]['demand'] == \
+            {'ND1': 24.}
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    pass
@@ -0,0 +1,119 @@
+""" Test the in process solver backends """
+
+from nose.tools import *
+from nose.plugins.skip import SkipTest
+
+import os
+import sys
+sys.path.append(os.path.expanduser('~/python/pyspd/pyspd/'))
+
+import numpy as np
+
+from api import *
+import backends
+
+
+def create_system():
+    SO = ISO("System Operator")
+    RZ = ReserveZone("RZ", SO)
+    ND = Node("ND", SO, RZ, demand=100)
+    CO = Company("CO")
+
+    ST1 = Station("ST1", ND, SO, CO, capacity=100, risk=False)
+    ST2 = Station("ST2", ND, SO, CO, capacity=100, risk=False)
+    ST1.add_energy_offer(band='1', price=10, offer=60)
+    ST2.add_energy_offer(band='1', price=20, offer=100)
+
+    SO.create_offers()
+    return SO
+
+
+def check_backend(name):
+    SO = create_system()
+    Solver = LPSolver(SO, backend=name)
+    Solver.full_setup_and_solve()
+
+    assert Solver.build == 'matrix'
+    assert Solver.status == 1
+    assert abs(SO.node_name_map["ND"].price - 20) < 1e-6
+    assert abs(SO.station_name_map["ST1"].energy_dispatch - 60) < 1e-6
+    assert abs(SO.station_name_map["ST2"].energy_dispatch - 40) < 1e-6
+    assert len(Solver.solution.duals) == Solver.model.shape[0]
+
+
+def test_highs_backend():
+    if backends.highspy is None:
+        raise SkipTest("highspy is not installed")
+    check_backend('highs')
+
+
+def test_highs_warm_start():
+    if backends.highspy is None:
+        raise SkipTest("highspy is not installed")
+    Solver = LPSolver(create_system(), backend='highs')
+    Solver.full_setup_and_solve()
+    model = Solver.model
+
+    SO = create_system()
+    SO.node_name_map["ND"].set_demand(150)
+    SO.initialise_empty()
+    SO.create_offers()
+    Solver.ISO = SO
+    Solver.full_setup_and_solve()
+
+    assert Solver.model is model
+    assert Solver.solution.warm
+    assert abs(SO.station_name_map["ST2"].energy_dispatch - 90) < 1e-6
+
+
+def test_scipy_backend():
+    import scipy
+    version = tuple(int(v) for v in scipy.__version__.split('.')[:2])
+    if backends.linprog is None or version < (1, 6):
+        raise SkipTest("scipy with the HiGHS methods is not installed")
+    check_backend('scipy')
+
+
+def check_infeasible(name):
+    # Demand above the capacity of the stations
+    SO = create_system()
+    SO.node_name_map["ND"].set_demand(300)
+    SO.create_offers()
+    Solver = LPSolver(SO, backend=name)
+    try:
+        Solver.full_setup_and_solve()
+    finally:
+        if os.path.exists("Infeasiable_LP_Debug.lp"):
+            os.remove("Infeasiable_LP_Debug.lp")
+
+    assert Solver.status != 1
+    assert Solver.solution.x.shape == (Solver.model.shape[1],)
+    assert Solver.solution.duals.shape == (Solver.model.shape[0],)
+    assert Solver.result.energy_dispatch.shape == (2,)
+    return Solver
+
+
+def test_highs_infeasible():
+    if backends.highspy is None:
+        raise SkipTest("highspy is not installed")
+    check_infeasible('highs')
+
+
+def test_scipy_infeasible():
+    import scipy
+    version = tuple(int(v) for v in scipy.__version__.split('.')[:2])
+    if backends.linprog is None or version < (1, 6):
+        raise SkipTest("scipy with the HiGHS methods is not installed")
+    Solver = check_infeasible('scipy')
+    assert np.isnan(Solver.solution.x).all()
+    assert np.isnan(Solver.result.prices).all()
+
+
+def test_get_backend():
+    assert isinstance(backends.get_backend('coin'), backends.CoinBackend)
+    backend = backends.CoinBackend()
+    assert backends.get_backend(backend) is backend
+
+
+if __name__ == '__main__':
+    pass
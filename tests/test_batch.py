@@ -0,0 +1,111 @@
+""" Test the BatchDispatch class """
+
+from nose.tools import *
+from nose.plugins.skip import SkipTest
+
+import os
+import sys
+sys.path.append(os.path.expanduser('~/python/pyspd/pyspd/'))
+
+from api import *
+from batch import apply_period
+import backends
+
+
+def create_system():
+    SO = ISO("System Operator")
+    RZ = ReserveZone("RZ", SO)
+    ND1 = Node("ND1", SO, RZ, demand=50)
+    ND2 = Node("ND2", SO, RZ, demand=50)
+    BR = Branch(ND1, ND2, SO, capacity=40)
+    CO = Company("CO")
+
+    ST1 = Station("ST1", ND1, SO, CO, capacity=200, risk=False)
+    ST2 = Station("ST2", ND2, SO, CO, capacity=200, risk=False)
+    ST1.add_energy_offer(band='1', price=10, offer=200)
+    ST2.add_energy_offer(band='1', price=20, offer=200)
+    return SO
+
+
+def create_periods():
+    return [{'period': 'TP1', 'demand': {'ND2': 30}},
+            {'period': 'TP2', 'demand': {'ND2': 100}},
+            {'period': 'TP3', 'demand': {'ND2': 100},
+             'energy_offers': {'ST2': ({'band': '1', 'price': 5,
+                                        'offer': 200},)}}]
+
+
+def check_results(results):
+    assert [r.period for r in results] == ['TP1', 'TP2', 'TP3']
+
+    # Uncongested, ST1 supplies everything
+    assert abs(results[0].energy_dispatch['ST1'] - 80) < 1e-6
+    assert abs(results[0].prices['ND2'] - 10) < 1e-6
+
+    # Congested, ST2 sets the price at ND2
+    assert abs(results[1].flows['ND1_ND2'] - 40) < 1e-6
+    assert abs(results[1].prices['ND1'] - 10) < 1e-6
+    assert abs(results[1].prices['ND2'] - 20) < 1e-6
+
+    # ST2 offers cheaper, flow reverses and is again congested
+    assert abs(results[2].energy_dispatch['ST2'] - 140) < 1e-6
+    assert abs(results[2].flows['ND1_ND2'] + 40) < 1e-6
+    assert abs(results[2].prices['ND1'] - 10) < 1e-6
+    assert abs(results[2].prices['ND2'] - 5) < 1e-6
+
+
+def test_batch_serial():
+    if backends.highspy is None:
+        raise SkipTest("highspy is not installed")
+    SO = create_system()
+    batch = BatchDispatch(SO, processes=1, backend='highs')
+    check_results(batch.run(create_periods()))
+
+    # The base ISO is left untouched
+    assert SO.node_name_map['ND2'].demand == 50
+    assert list(batch.worker_timings().values())[0]['periods'] == 3
+
+
+def test_batch_parallel():
+    if backends.highspy is None:
+        raise SkipTest("highspy is not installed")
+    batch = BatchDispatch(create_system(), processes=2, backend='highs')
+    check_results(batch.run(create_periods()))
+
+
+def test_apply_period_restores_base():
+
+    SO = create_system()
+    ST2 = SO.station_name_map['ST2']
+    apply_period(SO, create_periods()[2])
+    assert SO.node_name_map['ND2'].demand == 100
+    assert list(ST2.energy.prices) == [5]
+
+    # Units and nodes not named by the next period return to the base ISO
+    apply_period(SO, {'demand': {'ND1': 70}})
+    assert SO.node_name_map['ND1'].demand == 70
+    assert SO.node_name_map['ND2'].demand == 50
+    assert list(ST2.energy.prices) == [20]
+    apply_period(SO, {})
+    assert SO.node_name_map['ND1'].demand == 50
+    assert list(SO.offer_book.node_demand) == [50, 50]
+
+
+def test_batch_sparse_periods():
+    if backends.highspy is None:
+        raise SkipTest("highspy is not installed")
+    periods = [{'period': 'TP1', 'demand': {'ND2': 200}},
+               {'period': 'TP2'}, {'period': 'TP3'}]
+    base = BatchDispatch(create_system(), processes=1, backend='highs')
+    objective = base.run([{}])[0].objective
+
+    for processes in (1, 2):
+        results = BatchDispatch(create_system(), processes=processes,
+                                chunksize=3, backend='highs').run(periods)
+        assert results[0].objective > objective + 1e-6
+        assert abs(results[1].objective - objective) < 1e-6
+        assert abs(results[2].objective - objective) < 1e-6
+
+
+if __name__ == '__main__':
+    pass
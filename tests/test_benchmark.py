@@ -0,0 +1,62 @@
+""" Test the benchmark runner """
+
+from nose.tools import *
+from nose.plugins.skip import SkipTest
+
+import json
+import os
+import shutil
+import sys
+import tempfile
+sys.path.append(os.path.expanduser('~/python/pyspd/pyspd/'))
+
+from api import *
+import backends
+from benchmark import run_benchmarks, main
+
+
+def test_run_benchmarks():
+    if backends.highspy is None:
+        raise SkipTest("highspy is not installed")
+    directory = tempfile.mkdtemp()
+    try:
+        output = os.path.join(directory, 'bench.json')
+        results = run_benchmarks([{'nodes': 5, 'stations': 8},
+                                  {'nodes': 20, 'stations': 30}],
+                                 output=output, backend='highs')
+        with open(output) as f:
+            saved = json.load(f)
+    finally:
+        shutil.rmtree(directory)
+
+    assert saved == json.loads(json.dumps(results))
+    small, large = saved['cases']
+    assert small['nodes'] == 5 and large['nodes'] == 20
+    assert small['status'] == 1 and large['status'] == 1
+    assert large['constraints'] > small['constraints']
+    assert large['variables'] > small['variables']
+    for key in ('compile_time', 'setup_time', 'solution_time',
+                'dispatch_time', 'nonzeros', 'peak_memory'):
+        assert key in small
+
+
+def test_benchmark_main():
+    if backends.highspy is None:
+        raise SkipTest("highspy is not installed")
+    directory = tempfile.mkdtemp()
+    try:
+        output = os.path.join(directory, 'bench.json')
+        main(['--nodes', '4', '--backend', 'highs', '--build', 'pulp',
+              '--output', output])
+        with open(output) as f:
+            saved = json.load(f)
+    finally:
+        shutil.rmtree(directory)
+
+    # In process backends always use the matrix build
+    assert saved['cases'][0]['build'] == 'pulp'
+    assert saved['cases'][0]['stations'] == 8
+
+
+if __name__ == '__main__':
+    pass
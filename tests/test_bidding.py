@@ -0,0 +1,142 @@
+""" Test the strategic bidding search """
+
+from nose.tools import *
+from nose.plugins.skip import SkipTest
+
+import os
+import sys
+sys.path.append(os.path.expanduser('~/python/pyspd/pyspd/'))
+
+import numpy as np
+
+from api import *
+from instrument import MemorySink
+import backends
+import bidding
+
+
+def create_system():
+    SO = ISO("System Operator")
+    RZ = ReserveZone("RZ", SO)
+    ND1 = Node("ND1", SO, RZ, demand=100)
+    ND2 = Node("ND2", SO, RZ, demand=60)
+    Branch(ND1, ND2, SO, capacity=40)
+    CO1 = Company("CO1")
+    CO2 = Company("CO2")
+
+    ST1 = Station("ST1", ND1, SO, CO1, capacity=120, risk=False)
+    ST2 = Station("ST2", ND2, SO, CO2, capacity=100, risk=False)
+    ST3 = Station("ST3", ND2, SO, CO2, capacity=50, risk=False)
+    ST1.add_multiple_energy_offers(bands=['1', '2'], prices=[10, 30],
+                                   offers=[80, 40])
+    ST2.add_energy_offer(band='1', price=20, offer=100)
+    ST3.add_energy_offer(band='1', price=60, offer=50)
+    ST1.add_cost_function(lambda q: 5. * q)
+    CO2.add_contract(ND2, 30, contract_price=45)
+    SO.create_offers()
+    return SO, [CO1, CO2]
+
+
+def revenue(profile):
+    """ Company revenue of the participant objects of a new system, with
+        the markups applied to the offers
+    """
+    SO, companies = create_system()
+    for company, markup in zip(companies, profile):
+        for station in company.stations:
+            bands = list(station.energy.names)
+            prices = np.array(station.energy.prices) * markup
+            offers = list(station.energy.offers)
+            station.clear_energy_offers()
+            station.add_multiple_energy_offers(bands=bands, prices=prices,
+                                               offers=offers)
+    SO.create_offers()
+    LPSolver(SO, backend='highs').full_setup_and_solve()
+    for company in companies:
+        company.calculate_contract_costs()
+        company.calculate_company_revenue()
+    return [company.company_revenue for company in companies]
+
+
+def test_payoffs():
+    if backends.highspy is None:
+        raise SkipTest("highspy is not installed")
+
+    SO, companies = create_system()
+    game = bidding.BiddingGame(SO, companies, markups=[1, 1.5, 2, 3],
+                               processes=1)
+    assert list(game.band_owner) == [0, 0, 1, 1]
+    for profile in ([1, 1], [2, 1], [1.5, 3]):
+        assert np.allclose(game.payoffs(profile), revenue(profile))
+    assert game.solves == 3
+    game.payoffs([2, 1])
+    assert game.solves == 3 and game.cache.hits == 1
+
+
+def test_best_response():
+    if backends.highspy is None:
+        raise SkipTest("highspy is not installed")
+
+    SO, companies = create_system()
+    game = bidding.BiddingGame(SO, companies, markups=[1, 1.5, 2, 3],
+                               processes=2)
+    try:
+        markup, payoffs = game.best_response(0)
+        pool = game.sweep.pool
+        expected = [game.payoffs([m, 1])[0] for m in game.markups]
+        # The workers are kept between evaluations
+        assert game.sweep.pool is pool
+    finally:
+        game.close()
+    assert np.allclose(payoffs, expected)
+    assert markup == game.markups[np.argmax(expected)]
+    # Every candidate was solved once
+    assert game.solves == 4
+
+
+def test_best_response_order():
+    if backends.highspy is None:
+        raise SkipTest("highspy is not installed")
+
+    SO, companies = create_system()
+    game = bidding.BiddingGame(SO, companies, markups=[3, 1, 2, 1.5],
+                               processes=1)
+    assert list(game.markups) == [1, 1.5, 2, 3]
+    # The first candidate failed to solve, the next two tie
+    payoffs = np.array([[np.nan, 0], [5, 0], [5, 0], [2, 0]])
+    game._evaluate = lambda candidates: payoffs
+    markup, values = game.best_response(0)
+    assert markup == 1.5
+    payoffs[:, 0] = np.nan
+    assert_raises(ValueError, game.best_response, 0)
+
+
+def test_equilibrium():
+    if backends.highspy is None:
+        raise SkipTest("highspy is not installed")
+
+    SO, companies = create_system()
+    sink = SO.tracer.add_sink(MemorySink())
+    game = bidding.BiddingGame(SO, companies, markups=[1, 1.5, 2, 3],
+                               processes=1)
+    game.equilibrium(max_iterations=1)
+    assert not game.converged and len(game.history) == 1
+
+    profile = game.equilibrium()
+    assert game.converged
+    assert game.history[-1]['changed'] == []
+    assert np.array_equal(game.history[-1]['profile'], profile)
+    # No company gains by changing its markup alone
+    for c in range(len(companies)):
+        assert game.best_response(c, profile)[0] == profile[c]
+
+    record = game.history[-1]
+    assert record['cache_hits'] > 0 and record['time'] > 0
+    assert sum(h['solves'] for h in game.history) <= game.solves
+    span = sink.find('equilibrium')[-1]
+    assert span.counters['converged'] is True
+    assert span.counters['iterations'] == len(game.history)
+
+
+if __name__ == '__main__':
+    pass
@@ -0,0 +1,123 @@
+""" Test the memoised solve cache """
+
+from nose.tools import *
+from nose.plugins.skip import SkipTest
+
+import os
+import shutil
+import sys
+import tempfile
+sys.path.append(os.path.expanduser('~/python/pyspd/pyspd/'))
+
+import numpy as np
+
+from api import *
+from instrument import MemorySink
+import backends
+
+
+def create_system():
+    SO = ISO("System Operator")
+    RZ = ReserveZone("RZ", SO)
+    ND1 = Node("ND1", SO, RZ, demand=100)
+    ND2 = Node("ND2", SO, RZ, demand=50)
+    Branch(ND1, ND2, SO, capacity=100)
+    CO = Company("CO")
+    ST1 = Station("ST1", ND1, SO, CO, capacity=200)
+    ST2 = Station("ST2", ND2, SO, CO, capacity=100)
+    ST1.add_energy_offer(band='1', price=20, offer=200)
+    ST2.add_energy_offer(band='1', price=40, offer=100)
+    IL = InterruptibleLoad("IL", ND2, SO, CO)
+    IL.add_offer(band='1', price=100, offer=100)
+    SO.create_offers()
+    return SO
+
+
+def test_fingerprint():
+
+    book = create_system().offer_book
+    other = create_system().offer_book
+    assert book.fingerprint() == other.fingerprint()
+
+    other.node_demand[0] = 101
+    assert book.fingerprint() != other.fingerprint()
+    other.node_demand[0] = 100
+    other.node_names[0] = 'ND0'
+    assert book.fingerprint() != other.fingerprint()
+
+
+def test_solve_cache():
+
+    cache = SolveCache(size=2)
+    for key in ('a', 'b', 'a', 'c'):
+        if cache.get(key) is None:
+            cache.put(key, key.upper())
+    # b was the least recently used
+    assert 'b' not in cache and 'a' in cache
+    assert cache.stats() == {'hits': 1, 'misses': 3, 'evictions': 1,
+                             'disk_hits': 0, 'size': 2}
+
+    directory = tempfile.mkdtemp()
+    try:
+        cache = SolveCache(size=1, directory=directory)
+        cache.put('a', {'x': 1})
+        cache.put('b', {'x': 2})
+        assert len(cache) == 1 and 'a' in cache
+        assert cache.get('a') == {'x': 1}
+        assert SolveCache(directory=directory).get('b') == {'x': 2}
+        assert cache.disk_hits == 1
+    finally:
+        shutil.rmtree(directory)
+
+
+def test_cached_solve():
+    if backends.highspy is None:
+        raise SkipTest("highspy is not installed")
+
+    SO = create_system()
+    sink = SO.tracer.add_sink(MemorySink())
+    cache = SolveCache()
+    Solver = LPSolver(SO, backend='highs', cache=cache)
+    Solver.full_setup_and_solve()
+    assert Solver.path == 'lp'
+    result = Solver.result
+
+    SO.nodes[0].set_demand(120)
+    SO.recompile_changes()
+    Solver.full_setup_and_solve()
+    assert Solver.path == 'lp'
+    assert SO.nodes[0].price == Solver.result.prices[0]
+
+    # Back to the first period, taken from the cache
+    SO.nodes[0].set_demand(100)
+    SO.recompile_changes()
+    Solver.full_setup_and_solve()
+    assert Solver.path == 'cache' and Solver.result is result
+    assert Solver.result.path == 'lp'
+    assert Solver.objective == result.objective
+    assert cache.stats()['hits'] == 1 and cache.stats()['misses'] == 2
+    assert [s.counters['hit'] for s in sink.find('solve_cache')] == \
+        [False, False, True]
+    assert SO.stations[0].energy_dispatch == result.energy_dispatch[0]
+
+    # The options of the solver are part of the key
+    Other = LPSolver(SO, backend='highs', presolve=True, cache=cache)
+    Other.full_setup_and_solve()
+    assert Other.path == 'lp'
+    assert abs(Other.objective - result.objective) < 1e-6
+
+
+def test_backend_settings_key():
+
+    SO = create_system()
+    key = lambda backend: LPSolver(SO, backend=backend).cache_key()
+    assert key('scipy') == key(ScipyBackend(method='highs'))
+    assert key('scipy') != key(ScipyBackend(method='highs-ipm'))
+    if backends.highspy is not None:
+        assert key('highs') == key(HighsBackend(options={}))
+        assert key('highs') != key(HighsBackend(
+            options={'time_limit': 1.}))
+
+
+if __name__ == '__main__':
+    pass
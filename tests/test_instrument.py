@@ -0,0 +1,161 @@
+""" Test the tracing spans and sinks """
+
+from nose.tools import *
+from nose.plugins.skip import SkipTest
+
+import os
+import sys
+sys.path.append(os.path.expanduser('~/python/pyspd/pyspd/'))
+
+import json
+import logging
+import tempfile
+
+from api import *
+from instrument import Tracer, LogSink, MemorySink, JsonLinesSink
+from matrix import MatrixBuilder
+import backends
+
+
+def create_system():
+    SO = ISO("System Operator")
+    RZ = ReserveZone("RZ", SO)
+    ND1 = Node("ND1", SO, RZ, demand=50)
+    ND2 = Node("ND2", SO, RZ, demand=50)
+    Branch(ND1, ND2, SO, capacity=40)
+    CO = Company("CO")
+
+    ST1 = Station("ST1", ND1, SO, CO, capacity=200, spinning=True,
+                  risk=False)
+    ST2 = Station("ST2", ND2, SO, CO, capacity=200, risk=False)
+    ST1.add_energy_offer(band='1', price=10, offer=200)
+    ST1.add_reserve_offer(band='1', price=5, offer=50, prop=0.5)
+    ST2.add_energy_offer(band='1', price=20, offer=200)
+    return SO
+
+
+def test_tracer_spans():
+
+    sink = MemorySink()
+    tracer = Tracer([sink])
+
+    with tracer.span('outer', size=1) as outer:
+        with tracer.span('inner') as inner:
+            inner.set(rows=3)
+        outer.set(size=2)
+
+    assert [s.path for s in sink.spans] == ['outer/inner', 'outer']
+    assert sink.find('inner')[0].counters == {'rows': 3}
+    assert sink.find('outer')[0].counters == {'size': 2}
+    assert sink.spans[1].duration >= sink.spans[0].duration
+    assert set(sink.totals()) == set(['outer', 'outer/inner'])
+
+    # Without sinks nothing is recorded
+    tracer.remove_sink(sink)
+    with tracer.span('ignored') as span:
+        span.set(rows=1)
+    assert len(sink.spans) == 2
+
+
+def test_create_offers_and_setup_spans():
+
+    SO = create_system()
+    sink = SO.tracer.add_sink(MemorySink())
+    SO.create_offers()
+
+    assert sink.find('create_offers/get_energy_offers')[0].counters == \
+        {'stations': 2, 'bands': 2}
+    assert sink.find('create_offers/offer_book')[0].counters['bytes'] > 0
+
+    Solver = LPSolver(SO, build='matrix')
+    Solver.setup_lp()
+    families = [s for s in sink.spans if s.path.startswith('setup_lp/')
+                and s.name in MatrixBuilder.families]
+    assert [s.name for s in families] == list(MatrixBuilder.families)
+    assert sum(s.counters['rows'] for s in families) == Solver.model.shape[0]
+    assert sum(s.counters['nonzeros'] for s in families) == Solver.model.nnz
+
+    setup = sink.find('setup_lp')[0]
+    assert setup.counters['rows'] == Solver.model.shape[0]
+
+    # The pulp build times the same families
+    sink.clear()
+    Solver = LPSolver(SO, build='pulp')
+    Solver.setup_lp()
+    pulp_families = [s for s in sink.spans if s.path.startswith('setup_lp/')]
+    assert [s.name for s in pulp_families] == list(MatrixBuilder.families)
+    assert ([s.counters for s in pulp_families] ==
+            [s.counters for s in families])
+
+    # Recompiling counts the changed elements
+    sink.clear()
+    SO.nodes[0].set_demand(60)
+    SO.create_offers()
+    assert sink.find('recompile_changes')[0].counters['nodes'] == 1
+
+
+def test_solve_and_dispatch_spans():
+    if backends.highspy is None:
+        raise SkipTest("highspy is not installed")
+
+    SO = create_system()
+    SO.create_offers()
+    sink = MemorySink()
+    Solver = LPSolver(SO, backend='highs', tracer=Tracer([sink]))
+    Solver.full_setup_and_solve()
+
+    assert sink.find('solve_lp/run')
+    assert sink.find('solve_lp/load')[0].counters['rows'] == \
+        Solver.model.shape[0]
+    assert sink.find('solve_lp')[0].counters['status'] == 1
+    steps = [s.path for s in sink.spans
+             if s.path.startswith('return_dispatch/')]
+    push = 'return_dispatch/push_dispatch/'
+    assert steps == ['return_dispatch/gather', 'return_dispatch/log_duals',
+                     push + 'energy_prices', push + 'reserve_prices',
+                     push + 'energy_dispatch', push + 'reserve_dispatch',
+                     push + 'branch_flow', push + 'risk_dispatch',
+                     'return_dispatch/push_dispatch']
+
+
+def test_sinks():
+
+    handle, path = tempfile.mkstemp(suffix='.jsonl')
+    os.close(handle)
+    try:
+        sink = JsonLinesSink(path)
+        tracer = Tracer([sink])
+        with tracer.span('first', rows=2):
+            pass
+        with tracer.span('second'):
+            pass
+        sink.close()
+
+        with open(path) as f:
+            lines = [json.loads(line) for line in f]
+    finally:
+        os.remove(path)
+
+    assert [l['name'] for l in lines] == ['first', 'second']
+    assert lines[0]['counters'] == {'rows': 2}
+    assert lines[0]['duration'] >= 0
+
+    records = []
+    handler = logging.Handler()
+    handler.emit = records.append
+    logger = logging.getLogger('pyspd.test')
+    logger.addHandler(handler)
+    logger.setLevel(logging.INFO)
+    try:
+        with Tracer([LogSink(logger)]).span('logged', rows=4):
+            pass
+    finally:
+        logger.removeHandler(handler)
+
+    assert len(records) == 1
+    assert records[0].getMessage().startswith('logged')
+    assert 'rows=4' in records[0].getMessage()
+
+
+if __name__ == '__main__':
+    pass
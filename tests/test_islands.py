@@ -0,0 +1,110 @@
+""" Test the island by island dispatch of a split network """
+
+from nose.tools import *
+from nose.plugins.skip import SkipTest
+
+import os
+import sys
+sys.path.append(os.path.expanduser('~/python/pyspd/pyspd/'))
+
+import numpy as np
+
+from api import *
+from matrix import MatrixBuilder
+import backends
+import islands
+
+
+def create_system():
+    SO = ISO("System Operator")
+    RZ1 = ReserveZone("RZ1", SO)
+    RZ2 = ReserveZone("RZ2", SO)
+    RZ3 = ReserveZone("RZ3", SO)
+    ND1 = Node("ND1", SO, RZ1, demand=100)
+    ND2 = Node("ND2", SO, RZ1, demand=60)
+    ND3 = Node("ND3", SO, RZ2, demand=80)
+    ND4 = Node("ND4", SO, RZ3, demand=40)
+    # No branch reaches ND5, its reserve zone joins it to ND1 and ND2
+    ND5 = Node("ND5", SO, RZ1, demand=30)
+    Branch(ND1, ND2, SO, capacity=50)
+    Branch(ND3, ND4, SO, capacity=100, risk=True)
+    CO = Company("CO")
+
+    ST1 = Station("ST1", ND1, SO, CO, capacity=200, spinning=True)
+    ST2 = Station("ST2", ND2, SO, CO, capacity=100)
+    ST3 = Station("ST3", ND3, SO, CO, capacity=150, spinning=True)
+    ST4 = Station("ST4", ND4, SO, CO, capacity=100)
+    ST5 = Station("ST5", ND5, SO, CO, capacity=60, spinning=True)
+    ST1.add_energy_offer(band='1', price=20, offer=200)
+    ST2.add_energy_offer(band='1', price=60, offer=100)
+    ST3.add_energy_offer(band='1', price=30, offer=150)
+    ST4.add_energy_offer(band='1', price=40, offer=100)
+    ST5.add_energy_offer(band='1', price=50, offer=60)
+    for ST in (ST1, ST3, ST5):
+        ST.add_reserve_offer(band='1', price=5, offer=50, prop=0.5)
+    for RZ, node in ((RZ1, ND2), (RZ2, ND3), (RZ3, ND4)):
+        IL = InterruptibleLoad("IL" + RZ.name, node, SO, CO)
+        IL.add_offer(band='1', price=100, offer=200)
+    SO.create_offers()
+    return SO
+
+
+def test_find_islands():
+
+    SO = create_system()
+    count, label = islands.find_islands(SO.offer_book)
+    assert count == 2
+    assert list(label) == [0, 0, 1, 1, 0]
+
+
+def test_take():
+
+    SO = create_system()
+    book = SO.offer_book
+    sub = book.take([3, 2])
+    assert sub.node_names == ['ND3', 'ND4']
+    assert sub.zone_names == ['RZ2', 'RZ3']
+    assert sub.station_names == ['ST3', 'ST4']
+    assert sub.provider_names == ['ST3', 'ILRZ2', 'ILRZ3']
+    assert list(sub.provider_station) == [0, -1, -1]
+    assert list(sub.branch_from) == [0] and list(sub.branch_to) == [1]
+    assert list(sub.station_band_ptr) == [0, 1, 2]
+    assert list(sub.parent_index['stations']) == [2, 3]
+    # The parent book is untouched
+    assert len(book.node_names) == 5
+
+    # The island model is that of the network on its own
+    model = MatrixBuilder(islands._Island(sub)).build()
+    assert model.shape[0] < MatrixBuilder(SO).build().shape[0]
+
+
+def test_island_dispatch():
+    if backends.highspy is None:
+        raise SkipTest("highspy is not installed")
+
+    SO = create_system()
+    Full = LPSolver(SO, backend='highs', push=False)
+    Full.full_setup_and_solve()
+
+    for processes in (1, 2):
+        dispatch = IslandDispatch(SO, processes=processes)
+        result = dispatch.run(push=False)
+        assert dispatch.islands == 2
+        assert result.path == 'islands'
+        assert abs(Full.objective - result.objective) < 1e-6
+        for field in ('prices', 'reserve_prices', 'risk', 'energy_dispatch',
+                      'reserve_dispatch', 'flows'):
+            assert np.allclose(getattr(Full.result, field),
+                               getattr(result, field))
+
+        # Rows refer to the elements of the whole ISO
+        assert len(set(result.row_names)) == len(Full.result.row_names)
+        rows = lambda r: sorted(zip(r.row_family, r.row_element))
+        assert rows(result) == rows(Full.result)
+
+    dispatch.run()
+    assert SO.nodes[2].price == Full.result.prices[2]
+
+
+if __name__ == '__main__':
+    pass
@@ -88,10 +88,96 @@ def test_add_il():
     assert SO.intload == [IL]
     assert SO.intload_names == [IL.name]
     assert SO.reserve_name_map[IL.name] == IL
+
+    
     
+def create_system(demand=100, offers=({'band': '1', 'price': 5, 'offer': 100},),
+                  capacity=300):
+    SO = ISO("System Operator")
+    RZ = ReserveZone("RZ", SO)
+    ND1 = Node("ND1", SO, RZ, demand=demand)
+    ND2 = Node("ND2", SO, RZ, demand=50)
+    Branch(ND1, ND2, SO, capacity=capacity)
+    CO = Company("CO")
+    ST1 = Station("ST1", ND1, SO, CO, capacity=200, spinning=True)
+    ST2 = Station("ST2", ND2, SO, CO, capacity=150)
+    IL = InterruptibleLoad("IL", ND2, SO, CO)
     
+    ST1.add_multiple_energy_offers(offers)
+    ST1.add_reserve_offer(band='1', price=2, offer=50, prop=0.5)
+    ST2.add_energy_offer(band='1', price=10, offer=150)
+    IL.add_offer(band='1', price=1, offer=30)
+    return SO
+    
+    
+def compiled_state(SO):
+    """ The compiled dicts and offer book arrays of an ISO """
+    state = dict((k, v) for k, v in vars(SO).items() if isinstance(v, dict)
+                 and k not in ('node_name_map', 'reserve_zone_name_map',
+                               'station_name_map', 'reserve_name_map',
+                               'branch_name_map'))
+    state['lists'] = (SO.energy_bands, SO.reserve_bands,
+                      SO.transmission_bands)
+    book = dict((k, v.tolist() if hasattr(v, 'tolist') else v)
+                for k, v in vars(SO.offer_book).items())
+    return state, book
+    
+    
+def test_create_offers_idempotent():
+    SO = create_system()
+    SO.create_offers()
+    state = compiled_state(SO)
+    SO.create_offers()
+    
+    assert SO.energy_bands == ["ST1_1", "ST2_1"]
+    assert SO.all_nodes == ["ND1", "ND2"]
+    assert compiled_state(SO) == state
+    
+    
+def test_create_offers_changes():
+    offers = ({'band': '1', 'price': 7, 'offer': 60},
+              {'band': '2', 'price': 9, 'offer': 40})
+    SO = create_system()
+    SO.create_offers()
+    
+    SO.node_name_map["ND1"].set_demand(120)
+    ST1 = SO.station_name_map["ST1"]
+    ST1.clear_energy_offers()
+    ST1.add_multiple_energy_offers(offers)
+    SO.branch_name_map["ND1_ND2"].set_capacity(90)
+    
+    assert SO.changed_nodes == set([SO.node_name_map["ND1"]])
+    assert SO.changed_stations == set([ST1])
+    SO.create_offers()
+    assert SO.changed_stations == set()
+    
+    fresh = create_system(demand=120, offers=offers, capacity=90)
+    fresh.create_offers()
+    assert compiled_state(SO) == compiled_state(fresh)
+    
+    
+def test_create_offers_intload():
+    SO = create_system()
+    SO.create_offers()
+    
+    IL = SO.reserve_name_map["IL"]
+    IL.clear_all_offers()
+    SO.create_offers()
+    
+    assert SO.reserve_bands == ["ST1_Reserve_1"]
+    assert SO.offer_book.provider_band_ptr.tolist() == [0, 1, 1]
+    
+    
+def test_create_offers_new_element():
+    SO = create_system()
+    SO.create_offers()
+    ST3 = Station("ST3", SO.node_name_map["ND2"], SO, Company("CO2"))
+    ST3.add_energy_offer(band='1', price=1, offer=10)
+    SO.create_offers()
+    
+    assert SO.energy_totals == ["ST1", "ST2", "ST3"]
+    assert SO.offer_book.energy_band_station.tolist() == [0, 1, 2]
     
     
-   
 if __name__ == '__main__':
     pass
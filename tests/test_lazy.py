@@ -0,0 +1,129 @@
+""" Test the lazy generation of risk constraints """
+
+from nose.tools import *
+from nose.plugins.skip import SkipTest
+
+import os
+import sys
+sys.path.append(os.path.expanduser('~/python/pyspd/pyspd/'))
+
+import numpy as np
+
+from api import *
+from matrix import MatrixBuilder
+import backends
+import lazy
+from synthetic import create_grid
+
+
+def create_system():
+    SO = ISO("System Operator")
+    RZ1 = ReserveZone("RZ1", SO)
+    RZ2 = ReserveZone("RZ2", SO)
+    ND1 = Node("ND1", SO, RZ1, demand=150)
+    ND2 = Node("ND2", SO, RZ2, demand=50)
+    Branch(ND1, ND2, SO, capacity=200, risk=True)
+    CO = Company("CO")
+
+    # ST1 offers the most but is expensive, the cheaper stations set the risk
+    ST1 = Station("ST1", ND1, SO, CO, capacity=300)
+    ST2 = Station("ST2", ND1, SO, CO, capacity=100)
+    ST3 = Station("ST3", ND2, SO, CO, capacity=100)
+    ST1.add_energy_offer(band='1', price=90, offer=300)
+    ST2.add_energy_offer(band='1', price=10, offer=100)
+    ST3.add_energy_offer(band='1', price=20, offer=100)
+    for RZ, node in ((RZ1, ND1), (RZ2, ND2)):
+        IL = InterruptibleLoad("IL" + RZ.name, node, SO, CO)
+        IL.add_offer(band='1', price=100, offer=300)
+    SO.create_offers()
+    return SO
+
+
+def test_risk_candidates():
+
+    SO = create_system()
+    book = SO.offer_book
+    stations, branches = lazy.risk_candidates(book, 1)
+    assert [book.station_names[i] for i in stations] == ['ST1', 'ST3']
+    assert list(branches) == [0]
+
+    # Dispatch beyond the risk of the zone
+    energy = np.array([0., 100., 50.])
+    stations, branches = lazy.risk_violations(book, energy, np.array([20.]),
+                                              np.array([50., 50.]),
+                                              stations, [])
+    assert [book.station_names[i] for i in stations] == ['ST2']
+    assert len(branches) == 0
+
+
+def test_add_risk():
+
+    SO = create_system()
+    full = MatrixBuilder(SO).build()
+    builder = MatrixBuilder(SO, risk=([0], []))
+    model = builder.build()
+    assert full.shape[0] - model.shape[0] == 4
+
+    builder.add_risk(model, np.array([1, 2]), np.array([0]))
+    assert model.shape == full.shape
+    assert sorted(model.row_names) == sorted(full.row_names)
+    assert model.structure == MatrixBuilder(SO, risk=([0, 1, 2],
+                                                      [0]))._structure()
+    assert len(model.pop_changes()['added']) == 4
+
+
+def test_lazy_risk_solve():
+    if backends.highspy is None:
+        raise SkipTest("highspy is not installed")
+
+    SO = create_system()
+    Full = LPSolver(SO, backend='highs', push=False)
+    Full.full_setup_and_solve()
+    Lazy = LPSolver(SO, backend='highs', lazy_risk=1, push=False)
+    Lazy.full_setup_and_solve()
+
+    assert Lazy.lazy_iterations == 2
+    assert Lazy.model.shape[0] == Full.model.shape[0]
+    assert abs(Full.objective - Lazy.objective) < 1e-6
+    for field in ('prices', 'reserve_prices', 'risk', 'energy_dispatch',
+                  'reserve_dispatch', 'flows'):
+        assert np.allclose(getattr(Full.result, field),
+                           getattr(Lazy.result, field))
+
+    # The rows added are kept for the next period
+    model = Lazy.model
+    SO.nodes[0].set_demand(140)
+    SO.recompile_changes()
+    Lazy.full_setup_and_solve()
+    assert Lazy.model is model and Lazy.lazy_iterations == 1
+
+
+def test_lazy_risk_synthetic():
+    if backends.highspy is None:
+        raise SkipTest("highspy is not installed")
+
+    SO = create_grid(nodes=30, stations=60, reserve_zones=2, seed=5)
+    SO.create_offers()
+    Full = LPSolver(SO, backend='highs', push=False)
+    Full.full_setup_and_solve()
+    Lazy = LPSolver(SO, backend='highs', lazy_risk=2, push=False)
+    Lazy.full_setup_and_solve()
+
+    assert Lazy.model.shape[0] < Full.model.shape[0]
+    # The prices and meshed flows of the synthetic grid are degenerate, the
+    # dispatch is not
+    assert abs(Full.objective - Lazy.objective) < 1e-6
+    for field in ('risk', 'energy_dispatch', 'reserve_dispatch'):
+        assert np.allclose(getattr(Full.result, field),
+                           getattr(Lazy.result, field))
+
+    # No risk row of the full model is violated
+    res = Lazy.result
+    stations, branches = lazy.risk_violations(SO.offer_book,
+                                              res.energy_dispatch, res.flows,
+                                              res.risk, [], [])
+    assert not len(stations) and not len(branches)
+
+
+if __name__ == '__main__':
+    pass
@@ -0,0 +1,139 @@
+""" Test the MarketLoader class """
+
+from nose.tools import *
+from nose.plugins.skip import SkipTest
+
+import io
+import os
+import shutil
+import sys
+import tempfile
+sys.path.append(os.path.expanduser('~/python/pyspd/pyspd/'))
+
+from api import *
+import loader
+
+ENERGY = """trading_period,station,band,price,offer
+1,ST1,1,10,100
+1,ST2,1,20,100
+1,ST1,2,30,100
+2,ST1,1,15,150
+2,ST2,1,5,200
+3,ST2,1,25,200
+"""
+
+RESERVE = """trading_period,unit,band,price,offer,prop
+1,ST1,1,1,50,0.5
+1,IL,1,2,30,
+3,IL,1,4,20,
+"""
+
+DEMAND = """trading_period,node,demand
+1,ND1,80
+2,ND1,120
+2,ND2,10
+3,ND2,60
+"""
+
+
+def create_system():
+    SO = ISO("System Operator")
+    RZ = ReserveZone("RZ", SO)
+    ND1 = Node("ND1", SO, RZ, demand=50)
+    ND2 = Node("ND2", SO, RZ, demand=50)
+    Branch(ND1, ND2, SO, capacity=300)
+    CO = Company("CO")
+    Station("ST1", ND1, SO, CO, capacity=300, spinning=True)
+    Station("ST2", ND2, SO, CO, capacity=300)
+    InterruptibleLoad("IL", ND2, SO, CO)
+    return SO
+
+
+def write_files(directory):
+    paths = {}
+    for kind, text in (('energy', ENERGY), ('reserve', RESERVE),
+                       ('demand', DEMAND)):
+        paths[kind] = os.path.join(directory, kind + '.csv')
+        with open(paths[kind], 'w') as f:
+            f.write(text)
+    return paths
+
+
+def check_periods(periods):
+    assert [p['period'] for p in periods] == [1, 2, 3]
+
+    first = periods[0]
+    assert first['energy_offers']['ST1']['bands'].tolist() == ['1', '2']
+    assert first['energy_offers']['ST1']['prices'].tolist() == [10, 30]
+    assert first['reserve_offers']['ST1']['props'].tolist() == [0.5]
+    assert 'props' not in first['il_offers']['IL']
+    assert first['demand'] == {'ND1': 80}
+
+    assert 'reserve_offers' not in periods[1]
+    assert periods[1]['demand'] == {'ND1': 120, 'ND2': 10}
+    assert list(periods[2]['energy_offers']) == ['ST2']
+    assert periods[2]['il_offers']['IL']['offers'].tolist() == [20]
+
+
+def test_loader_csv():
+    if loader.pd is None:
+        raise SkipTest("pandas is not installed")
+    directory = tempfile.mkdtemp()
+    try:
+        paths = write_files(directory)
+        # Small chunks split periods across reads
+        periods = list(MarketLoader(create_system(), chunksize=2,
+                                    **paths).periods())
+    finally:
+        shutil.rmtree(directory)
+    check_periods(periods)
+
+
+def test_loader_parquet():
+    if loader.pd is None or loader.pq is None:
+        raise SkipTest("pandas and pyarrow are not installed")
+    directory = tempfile.mkdtemp()
+    try:
+        paths = write_files(directory)
+        for kind, path in paths.items():
+            frame = loader.pd.read_csv(path, dtype={'band': str})
+            paths[kind] = path.replace('.csv', '.parquet')
+            frame.to_parquet(paths[kind])
+        periods = list(MarketLoader(create_system(), chunksize=2,
+                                    **paths).periods())
+    finally:
+        shutil.rmtree(directory)
+    check_periods(periods)
+
+
+def test_loader_apply():
+    if loader.pd is None:
+        raise SkipTest("pandas is not installed")
+    SO = create_system()
+    frames = dict((kind, loader.pd.read_csv(io.StringIO(text),
+                                            dtype={'band': str}))
+                  for kind, text in (('energy', ENERGY), ('demand', DEMAND)))
+    labels = []
+    for period in MarketLoader(SO, **frames):
+        labels.append(period)
+        if period == 2:
+            assert SO.node_demand == {'ND1': 120, 'ND2': 10}
+            assert SO.energy_bands == ['ST1_1', 'ST2_1']
+            assert SO.energy_band_prices['ST2_1'] == 5
+    assert labels == [1, 2, 3]
+    # ST1 and ND1 are missing from period 3 and return to the base ISO
+    assert SO.energy_bands == ['ST2_1']
+    assert SO.node_demand == {'ND1': 50, 'ND2': 60}
+
+
+def test_loader_order():
+    if loader.pd is None:
+        raise SkipTest("pandas is not installed")
+    frame = loader.pd.DataFrame({'trading_period': [2, 1], 'node': ['ND1',
+                                 'ND1'], 'demand': [1., 2.]})
+    assert_raises(ValueError, list,
+                  MarketLoader(create_system(), demand=frame).periods())
+
+
+if __name__ == '__main__':
+    pass
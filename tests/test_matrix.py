@@ -0,0 +1,125 @@
+""" Test the MatrixBuilder and MatrixModel classes """
+
+from nose.tools import *
+
+import os
+import sys
+sys.path.append(os.path.expanduser('~/python/pyspd/pyspd/'))
+
+from api import *
+from matrix import MatrixBuilder
+
+
+def create_system():
+    SO = ISO("System Operator")
+    RZN = ReserveZone("North", SO)
+    RZS = ReserveZone("South", SO)
+    ND1 = Node("ND1", SO, RZN, demand=100)
+    ND2 = Node("ND2", SO, RZS, demand=50)
+    BR = Branch(ND1, ND2, SO, capacity=300, risk=True)
+    CO = Company("CO")
+
+    ST1 = Station("ST1", ND1, SO, CO, capacity=200, spinning=True)
+    ST2 = Station("ST2", ND2, SO, CO, capacity=150)
+    IL = InterruptibleLoad("IL", ND1, SO, CO, capacity=30)
+
+    ST1.add_multiple_energy_offers(({'band': '1', 'price': 5, 'offer': 100},
+                                    {'band': '2', 'price': 30, 'offer': 100}))
+    ST2.add_multiple_energy_offers(({'band': '1', 'price': 10, 'offer': 150},))
+    ST1.add_reserve_offer(band='1', price=2, offer=50, prop=0.5)
+    IL.add_offer(band='1', price=1, offer=30)
+
+    SO.create_offers()
+    return SO
+
+
+def constraint_set(prob):
+    """ Reduce a pulp problem to comparable constraint descriptions """
+    return {name: (c.sense, c.constant,
+                   {v.name: coef for v, coef in c.items() if coef != 0})
+            for name, c in prob.constraints.items()}
+
+
+def test_matrix_shape():
+    SO = create_system()
+    model = MatrixBuilder(SO).build()
+
+    # 3 energy, 2 reserve, 3 transmission bands, 2 + 2 + 1 totals,
+    # 2 nodes and 2 reserve zones
+    assert model.shape[1] == 17
+    assert model.col_elements["Energy_Total"] == ["ST1", "ST2"]
+    assert model.col_names[model.col_slices["Risk"]] == ["Risk_North",
+                                                         "Risk_South"]
+    assert model.shape[0] == len(model.row_names)
+    assert model.row_names[0] == "ND1_Energy_Price"
+    assert model.row_lower[0] == -100
+    assert model.cost[model.col_slices["Energy_Band"]].tolist() == [5, 30, 10]
+
+
+def test_matrix_matches_pulp():
+    SO = create_system()
+
+    pulp_solver = LPSolver(SO)
+    pulp_solver.setup_lp()
+
+    matrix_solver = LPSolver(SO, build='matrix')
+    matrix_solver.setup_lp()
+
+    assert list(pulp_solver.lp.constraints) == \
+        list(matrix_solver.lp.constraints)
+    assert constraint_set(pulp_solver.lp) == constraint_set(matrix_solver.lp)
+
+    pulp_obj = {v.name: c for v, c in pulp_solver.lp.objective.items() if c}
+    matrix_obj = {v.name: c for v, c in matrix_solver.lp.objective.items()}
+    assert pulp_obj == matrix_obj
+
+
+def test_matrix_update():
+    SO = create_system()
+    builder = MatrixBuilder(SO)
+    model = builder.build()
+    A = model.A
+
+    # Same structure, new offers and demand
+    SO2 = create_system()
+    SO2.node_name_map["ND1"].set_demand(120)
+    ST1 = SO2.station_name_map["ST1"]
+    ST1.clear_all_offers()
+    ST1.add_multiple_energy_offers(({'band': '1', 'price': 5, 'offer': 100},
+                                    {'band': '2', 'price': 40, 'offer': 100}))
+    ST1.add_reserve_offer(band='1', price=2, offer=50, prop=0.8)
+    SO2.create_offers()
+
+    assert MatrixBuilder(SO2).update(model)
+    assert model.A is A
+    assert model.row_lower[0] == -120
+    assert model.cost[1] == 40
+
+    changes = model.pop_changes()
+    assert changes['cost'].tolist() == [1]
+    assert changes['rows'].tolist() == [0]
+    assert len(changes['entries']) == 1
+    assert model.A.data[changes['entries'][0]] == -0.8
+
+    # Updated model is identical to a freshly built one
+    fresh = MatrixBuilder(SO2).build()
+    assert (fresh.A != model.A).nnz == 0
+    assert (fresh.row_lower == model.row_lower).all()
+    assert (fresh.cost == model.cost).all()
+    assert model.pop_changes()['rows'].tolist() == []
+
+
+def test_matrix_structure_change():
+    SO = create_system()
+    model = MatrixBuilder(SO).build()
+
+    SO2 = create_system()
+    SO2.station_name_map["ST2"].add_energy_offer(band='2', price=50, offer=10)
+    SO2.initialise_empty()
+    SO2.create_offers()
+
+    assert not MatrixBuilder(SO2).update(model)
+
+
+if __name__ == '__main__':
+    pass
@@ -0,0 +1,118 @@
+""" Test the merit order clearing """
+
+from nose.tools import *
+from nose.plugins.skip import SkipTest
+
+import os
+import sys
+sys.path.append(os.path.expanduser('~/python/pyspd/pyspd/'))
+
+import numpy as np
+
+from api import *
+from matrix import MatrixBuilder
+import backends
+import merit
+
+
+def create_system(capacity=100, risk=False, mesh=False):
+    SO = ISO("System Operator")
+    RZ = ReserveZone("RZ", SO)
+    ND1 = Node("ND1", SO, RZ, demand=30)
+    ND2 = Node("ND2", SO, RZ, demand=40)
+    ND3 = Node("ND3", SO, RZ, demand=20)
+    Branch(ND1, ND2, SO, capacity=capacity)
+    Branch(ND3, ND2, SO, capacity=capacity)
+    if mesh:
+        Branch(ND1, ND3, SO, capacity=capacity)
+    CO = Company("CO")
+
+    ST1 = Station("ST1", ND1, SO, CO, capacity=200, risk=risk)
+    ST2 = Station("ST2", ND2, SO, CO, capacity=200, spinning=True,
+                  risk=False)
+    ST3 = Station("ST3", ND3, SO, CO, capacity=200, risk=False)
+    ST1.add_multiple_energy_offers(bands=['1', '2'], prices=[10, 40],
+                                   offers=[50, 50])
+    ST2.add_multiple_energy_offers(bands=['1', '2'], prices=[20, 60],
+                                   offers=[30, 100])
+    ST2.add_reserve_offer(band='1', price=5, offer=50, prop=0.5)
+    ST3.add_energy_offer(band='1', price=50, offer=100)
+    IL = InterruptibleLoad("IL", ND2, SO, CO)
+    IL.add_offer(band='1', price=100, offer=100)
+    SO.create_offers()
+    return SO
+
+
+def clear(SO):
+    builder = MatrixBuilder(SO)
+    family, element = builder.row_index()
+    return merit.clear(SO.offer_book, family, element)
+
+
+def test_merit_order_clearing():
+
+    values = clear(create_system())
+
+    # 90 MW clears at 40 on the band of ST1 part dispatched
+    assert np.allclose(values['prices'], [40, 40, 40])
+    assert np.allclose(values['energy_dispatch'], [60, 30, 0])
+    assert np.allclose(values['flows'], [30, -20])
+    assert abs(values['objective'] - (500 + 400 + 600)) < 1e-9
+    assert not values['reserve_dispatch'].any()
+
+
+def test_merit_order_fallback():
+
+    # Congested, risk setting, meshed or a demand on a band boundary
+    assert clear(create_system(capacity=25)) is None
+    assert clear(create_system(risk=True)) is None
+    assert clear(create_system(mesh=True)) is None
+
+    SO = create_system()
+    SO.nodes[0].set_demand(20)
+    SO.create_offers()
+    assert clear(SO) is None
+
+
+def test_merit_order_solver():
+    if backends.highspy is None:
+        raise SkipTest("highspy is not installed")
+
+    for capacity in (100, 25):
+        SO = create_system(capacity=capacity)
+        Fast = LPSolver(SO, backend='highs', merit_order=True, push=False)
+        Fast.full_setup_and_solve()
+        LP = LPSolver(SO, backend='highs', push=False)
+        LP.full_setup_and_solve()
+
+        assert Fast.result.path == ('merit_order' if capacity == 100
+                                    else 'lp')
+        assert LP.result.path == 'lp'
+        assert abs(Fast.objective - LP.objective) < 1e-6
+        for field in ('prices', 'reserve_prices', 'risk', 'energy_dispatch',
+                      'reserve_dispatch', 'flows'):
+            assert np.allclose(getattr(Fast.result, field),
+                               getattr(LP.result, field))
+
+        # The prices, band limits and branch limits have unique duals
+        unique = Fast.result.family_mask('energy_price', 'energy_band',
+                                         'transmission_limit')
+        assert np.allclose(Fast.result.duals[unique],
+                           LP.result.duals[unique])
+
+    Fast.push_dispatch()
+    assert abs(SO.nodes[0].price - Fast.result.prices[0]) < 1e-9
+
+
+def test_merit_order_push():
+
+    SO = create_system()
+    Solver = LPSolver(SO, merit_order=True)
+    Solver.full_setup_and_solve()
+    assert Solver.path == 'merit_order'
+    assert [n.price for n in SO.nodes] == [40, 40, 40]
+    assert [s.energy_dispatch for s in SO.stations] == [60, 30, 0]
+
+
+if __name__ == '__main__':
+    pass
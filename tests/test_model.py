@@ -0,0 +1,71 @@
+""" Test the LPSolver class """
+
+from nose.tools import *
+from nose.plugins.skip import SkipTest
+
+import os
+import sys
+sys.path.append(os.path.expanduser('~/python/pyspd/pyspd/'))
+
+from api import *
+import backends
+import model
+
+
+def test_underscore_names():
+    if backends.highspy is None:
+        raise SkipTest("highspy is not installed")
+
+    SO = ISO("System Operator")
+    RZ = ReserveZone("Reserve_Zone", SO)
+    ND1 = Node("North_Island", SO, RZ, demand=80)
+    ND2 = Node("South_Island", SO, RZ, demand=20)
+    BR = Branch(ND1, ND2, SO, capacity=50)
+    CO = Company("CO")
+
+    ST1 = Station("Mighty_River", ND1, SO, CO, capacity=100, risk=False)
+    ST2 = Station("Lake_Benmore", ND2, SO, CO, capacity=100, risk=False)
+    ST1.add_energy_offer(band='1', price=30, offer=100)
+    ST2.add_energy_offer(band='1', price=10, offer=100)
+    SO.create_offers()
+
+    Solver = LPSolver(SO, backend='highs')
+    Solver.full_setup_and_solve()
+
+    assert abs(ST2.energy_dispatch - 70) < 1e-6
+    assert abs(ST1.energy_dispatch - 30) < 1e-6
+    assert abs(BR.flow + 50) < 1e-6
+    assert abs(ND1.price - 30) < 1e-6
+    assert abs(ND2.price - 10) < 1e-6
+    assert RZ.dispatch is not None
+
+
+def test_push_result():
+    if backends.highspy is None:
+        raise SkipTest("highspy is not installed")
+
+    SO = ISO("System Operator")
+    RZ = ReserveZone("RZ", SO)
+    ND1 = Node("ND1", SO, RZ, demand=80)
+    ND2 = Node("ND2", SO, RZ, demand=20)
+    BR = Branch(ND1, ND2, SO, capacity=50)
+    CO = Company("CO")
+    ST1 = Station("ST1", ND1, SO, CO, capacity=100, risk=False)
+    ST2 = Station("ST2", ND2, SO, CO, capacity=100, risk=False)
+    ST1.add_energy_offer(band='1', price=30, offer=100)
+    ST2.add_energy_offer(band='1', price=10, offer=100)
+    SO.create_offers()
+
+    Solver = LPSolver(SO, backend='highs', push=False)
+    Solver.full_setup_and_solve()
+    assert ND1.price == 0
+
+    # A result is passed to the participants without a solver
+    model.push_result(SO, Solver.result)
+    assert abs(ST2.energy_dispatch - 70) < 1e-6
+    assert abs(BR.flow + 50) < 1e-6
+    assert abs(ND1.price - 30) < 1e-6
+
+
+if __name__ == '__main__':
+    pass
@@ -0,0 +1,143 @@
+""" Test the ramp coupled dispatch of several trading periods """
+
+from nose.tools import *
+from nose.plugins.skip import SkipTest
+
+import os
+import sys
+sys.path.append(os.path.expanduser('~/python/pyspd/pyspd/'))
+
+import numpy as np
+
+from api import *
+from batch import apply_period
+import backends
+
+
+def create_system(ramp_rate=None):
+    SO = ISO("System Operator")
+    RZ = ReserveZone("RZ1", SO)
+    ND1 = Node("ND1", SO, RZ, demand=100)
+    ND2 = Node("ND2", SO, RZ, demand=50)
+    Branch(ND1, ND2, SO, capacity=100)
+    CO = Company("CO")
+
+    ST1 = Station("ST1", ND1, SO, CO, capacity=300, spinning=True,
+                  ramp_rate=ramp_rate)
+    ST2 = Station("ST2", ND2, SO, CO, capacity=300)
+    ST1.add_energy_offer(band='1', price=20, offer=300)
+    ST2.add_energy_offer(band='1', price=60, offer=300)
+    ST1.add_reserve_offer(band='1', price=5, offer=50, prop=0.5)
+    IL = InterruptibleLoad("IL1", ND2, SO, CO)
+    IL.add_offer(band='1', price=100, offer=200)
+    SO.create_offers()
+    return SO
+
+
+def create_periods():
+    periods = []
+    for k, (d1, d2) in enumerate(((100, 50), (200, 80), (60, 40))):
+        periods.append({'period': k, 'demand': {'ND1': d1, 'ND2': d2},
+                        'energy_offers': {'ST1': [{'band': '1',
+                                                   'price': 20 + k,
+                                                   'offer': 300}]}})
+    return periods
+
+
+def test_ramp_rate():
+
+    SO = create_system()
+    book = SO.offer_book
+    assert np.isinf(book.station_ramp).all()
+    SO.station_name_map['ST1'].set_ramp_rate(40)
+    SO.create_offers()
+    assert list(book.station_ramp[:1]) == [40]
+
+
+def test_uncoupled():
+    if backends.highspy is None:
+        raise SkipTest("highspy is not installed")
+
+    SO = create_system()
+    Solver = MultiPeriodSolver(SO, create_periods())
+    results = Solver.full_setup_and_solve()
+    assert Solver.status == 1
+    assert len(results) == 3 and results[0].path == 'multi_period'
+
+    objective = 0.
+    for period, result in zip(create_periods(), results):
+        System = create_system()
+        apply_period(System, period)
+        Single = LPSolver(System, build='matrix', backend='highs',
+                          push=False)
+        Single.full_setup_and_solve()
+        objective += Single.objective
+        assert abs(Single.objective - result.objective) < 1e-6
+        for field in ('prices', 'reserve_prices', 'energy_dispatch',
+                      'reserve_dispatch', 'flows'):
+            assert np.allclose(getattr(Single.result, field),
+                               getattr(result, field))
+    assert abs(Solver.objective - objective) < 1e-6
+    assert not Solver.ramp_duals.any()
+
+
+def test_ramp_coupled():
+    if backends.highspy is None:
+        raise SkipTest("highspy is not installed")
+
+    free = MultiPeriodSolver(create_system(), create_periods())
+    free.full_setup_and_solve()
+
+    SO = create_system(ramp_rate=40)
+    Solver = MultiPeriodSolver(SO, create_periods(), initial={'ST1': 100})
+    results = Solver.full_setup_and_solve()
+    assert Solver.status == 1
+    output = np.array([r.energy_dispatch[0] for r in results])
+    assert np.all(np.abs(np.diff(np.concatenate([[100], output])))
+                  <= 40 + 1e-6)
+    assert Solver.objective > free.objective + 1e-6
+    # Demand is still met each period
+    for period, result in zip(create_periods(), results):
+        assert abs(result.energy_dispatch.sum() -
+                   sum(period['demand'].values())) < 1e-6
+    assert Solver.ramp_duals[:, 0].any() and not Solver.ramp_duals[:, 1].any()
+    assert Solver.model.row_names[-1] == 'T2_ST1_Ramp_Rate'
+
+
+def test_infeasible_ramp():
+    if backends.highspy is None:
+        raise SkipTest("highspy is not installed")
+
+    # ST1 cannot ramp down from its initial output to the first demand
+    for backend in ('highs', 'scipy'):
+        Solver = MultiPeriodSolver(create_system(ramp_rate=40),
+                                   create_periods(), backend=backend,
+                                   initial={'ST1': 300})
+        results = Solver.full_setup_and_solve()
+        assert Solver.status != 1
+        assert len(results) == 3
+        for result in results:
+            assert np.isnan(result.prices).all()
+            assert np.isnan(result.energy_dispatch).all()
+            assert np.isnan(result.objective)
+        assert np.isnan(Solver.ramp_duals).all()
+
+
+def test_linear_assembly():
+
+    SO = create_system(ramp_rate=40)
+    single = MultiPeriodSolver(SO, create_periods()[:1], backend='scipy')
+    single.setup()
+    nrows, ncols = single.model.shape
+    periods = [dict(period, period=k) for k, period in
+               enumerate(create_periods() * 4)]
+    Solver = MultiPeriodSolver(SO, periods, backend='scipy')
+    Solver.setup()
+    T = len(periods)
+    assert Solver.model.shape == (T * nrows + T - 1, T * ncols)
+    assert Solver.model.nnz == T * single.model.nnz + 2 * (T - 1)
+    assert_raises(ValueError, MultiPeriodSolver, SO, periods, 'coin')
+
+
+if __name__ == '__main__':
+    pass
@@ -0,0 +1,100 @@
+""" Test the OfferBook class """
+
+from nose.tools import *
+
+import os
+import sys
+sys.path.append(os.path.expanduser('~/python/pyspd/pyspd/'))
+
+from api import *
+from matrix import MatrixBuilder
+
+
+def create_system():
+    SO = ISO("System Operator")
+    RZN = ReserveZone("North", SO)
+    RZS = ReserveZone("South", SO)
+    ND1 = Node("ND1", SO, RZN, demand=100)
+    ND2 = Node("ND2", SO, RZN, demand=20)
+    ND3 = Node("ND3", SO, RZS, demand=50)
+    Branch(ND1, ND2, SO, capacity=100)
+    Branch(ND3, ND1, SO, capacity=80, risk=True)
+    Branch(ND2, ND3, SO, capacity=60, risk=True)
+    CO = Company("CO")
+
+    ST1 = Station("ST1", ND1, SO, CO, capacity=200, spinning=True)
+    ST2 = Station("ST2", ND3, SO, CO, capacity=150, spinning=True)
+    ST3 = Station("ST3", ND2, SO, CO, capacity=50)
+    IL = InterruptibleLoad("IL", ND3, SO, CO, capacity=30)
+
+    ST1.add_multiple_energy_offers(({'band': '1', 'price': 5, 'offer': 100},
+                                    {'band': '2', 'price': 30, 'offer': 100}))
+    ST2.add_energy_offer(band='1', price=10, offer=150)
+    ST3.add_energy_offer(band='1', price=50, offer=50)
+    ST1.add_reserve_offer(band='1', price=2, offer=50, prop=0.5)
+    ST2.add_reserve_offer(band='1', price=1, offer=20, prop=0.2)
+    ST2.add_reserve_offer(band='2', price=4, offer=30, prop=0.4)
+    IL.add_offer(band='1', price=1, offer=30)
+
+    SO.create_offers()
+    return SO
+
+
+def test_offer_book():
+    SO = create_system()
+    book = SO.offer_book
+
+    assert book.energy_band_names == SO.energy_bands
+    assert book.energy_band_price.tolist() == [5, 30, 10, 50]
+    assert book.energy_band_quantity.tolist() == [100, 100, 150, 50]
+    assert book.energy_band_station.tolist() == [0, 0, 1, 2]
+    assert book.energy_band_node.tolist() == [0, 0, 2, 1]
+    assert book.energy_band_zone.tolist() == [0, 0, 1, 0]
+    assert book.station_band_ptr.tolist() == [0, 2, 3, 4]
+    assert book.station_node.tolist() == [0, 2, 1]
+    assert book.node_zone.tolist() == [0, 0, 1]
+    assert book.node_demand.tolist() == [100, 20, 50]
+
+
+def test_offer_book_reserve():
+    SO = create_system()
+    book = SO.offer_book
+
+    assert book.provider_names == SO.reserve_totals
+    assert book.provider_station.tolist() == [0, 1, -1]
+    assert book.provider_zone.tolist() == [0, 1, 1]
+    assert book.reserve_band_provider.tolist() == [0, 1, 1, 2]
+    assert book.reserve_band_proportion.tolist() == [0.5, 0.2, 0.4, 0]
+    assert book.provider_band_ptr.tolist() == [0, 1, 3, 4]
+
+
+def test_offer_book_network():
+    SO = create_system()
+    book = SO.offer_book
+
+    assert book.branch_names == SO.transmission_totals
+    assert book.branch_from.tolist() == [0, 2, 1]
+    assert book.branch_to.tolist() == [1, 0, 2]
+    assert book.branch_risk.tolist() == [False, True, True]
+    assert book.transmission_band_names == SO.transmission_bands
+    assert book.nbytes > 0
+
+
+def test_offer_book_matrix_matches_pulp():
+    SO = create_system()
+
+    pulp_solver = LPSolver(SO)
+    pulp_solver.setup_lp()
+    prob = MatrixBuilder(SO).build().to_pulp()[0]
+
+    assert list(pulp_solver.lp.constraints) == list(prob.constraints)
+    for name, c in pulp_solver.lp.constraints.items():
+        m = prob.constraints[name]
+        assert c.sense == m.sense
+        assert c.constant == m.constant
+        assert ({v.name: a for v, a in c.items() if a} ==
+                {v.name: a for v, a in m.items() if a})
+
+
+if __name__ == '__main__':
+    pass
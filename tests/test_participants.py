@@ -5,6 +5,7 @@ import sys
 sys.path.append(os.path.expanduser('~/python/pyspd/pyspd/'))
 
 from api import *
+import numpy as np
 
 def test_station_creation():
     """ Test the Station Class """
@@ -81,10 +82,44 @@ def test_station_reserve_offer():
     
     # Note, since we set a spinning reserve flag to False these items
     # should not even exist in the units name space.
-    assert 'rband_names' not in STFalse.__dict__
-    assert 'rband_offers' not in STFalse.__dict__
-    assert 'rband_prices' not in STFalse.__dict__
-    assert 'rband_proportions' not in STFalse.__dict__
+    assert not hasattr(STFalse, 'rband_names')
+    assert not hasattr(STFalse, 'rband_offers')
+    assert not hasattr(STFalse, 'rband_prices')
+    assert not hasattr(STFalse, 'rband_proportions')
+    
+    
+def test_station_bulk_offers():
+
+    SO = ISO("System Operator")
+    RZ = ReserveZone("RZ", SO)
+    ND = Node("ND", SO, RZ)
+    CO = Company("CO")
+    
+    ST = Station("ST", ND, SO, CO, spinning=True, capacity=400)
+    IL = InterruptibleLoad("IL", ND, SO, CO)
+    
+    ST.add_energy_offer(band='1', price=10, offer=50)
+    ST.add_multiple_energy_offers(bands=np.arange(2, 4),
+                                  prices=np.array([20., 30.]),
+                                  offers=np.array([60., 70.]))
+    ST.add_multiple_reserve_offers(bands=['1', '2'], prices=[1, 2],
+                                   offers=[10, 20], props=[0.1, 0.2])
+    IL.add_multiple_offers(bands=['1'], prices=[3], offers=[30])
+    
+    assert ST.band_names == ["ST_1", "ST_2", "ST_3"]
+    assert ST.band_prices == {"ST_1": 10, "ST_2": 20, "ST_3": 30}
+    assert ST.band_offers["ST_3"] == 70
+    assert ST.rband_proportions == {"ST_Reserve_1": 0.1, "ST_Reserve_2": 0.2}
+    assert IL.band_offers == {"IL_1": 30}
+    assert not hasattr(ST, '__dict__')
+    
+    names, prices, offers, props = ST.energy.columns()
+    assert prices.tolist() == [10, 20, 30]
+    assert props.tolist() == [0, 0, 0]
+    
+    ST.clear_all_offers()
+    assert ST.band_names == []
+    assert ST.rband_names == []
     
     
 def test_station_price_dispatch():
@@ -0,0 +1,161 @@
+""" Test the presolve of the offer book """
+
+from nose.tools import *
+from nose.plugins.skip import SkipTest
+
+import os
+import sys
+sys.path.append(os.path.expanduser('~/python/pyspd/pyspd/'))
+
+import numpy as np
+
+from api import *
+from matrix import MatrixBuilder
+from instrument import MemorySink
+import backends
+import presolve
+from synthetic import create_grid
+
+
+def create_system():
+    SO = ISO("System Operator")
+    RZ = ReserveZone("RZ", SO)
+    ND1 = Node("ND1", SO, RZ, demand=100)
+    ND2 = Node("ND2", SO, RZ, demand=80)
+    Branch(ND1, ND2, SO, capacity=60)
+    CO = Company("CO")
+
+    ST1 = Station("ST1", ND1, SO, CO, capacity=200, spinning=True)
+    ST2 = Station("ST2", ND2, SO, CO, capacity=150, risk=False)
+    # Two bands at 30 and an empty band
+    ST1.add_multiple_energy_offers(bands=['1', '2', '3', '4'],
+                                   prices=[30, 50, 30, 80],
+                                   offers=[40, 50, 20, 0])
+    ST1.add_multiple_reserve_offers(bands=['1', '2'], prices=[5, 5],
+                                    offers=[30, 0], props=[0.5, 0.5])
+    ST2.add_multiple_energy_offers(bands=['1', '2'], prices=[20, 60],
+                                   offers=[50, 100])
+    IL = InterruptibleLoad("IL", ND2, SO, CO)
+    IL.add_multiple_offers(bands=['1', '2', '3'], prices=[100, 100, 200],
+                           offers=[20, 30, 100])
+    SO.create_offers()
+    return SO
+
+
+def test_presolve_reduction():
+
+    SO = create_system()
+    book = SO.offer_book
+    pre = presolve.Presolve(book)
+    reduced = pre.reduced
+
+    # The two bands of ST1 at 30 merge, its empty band is dropped
+    assert len(reduced.energy_band_names) == 4
+    ST1 = [i for i, s in enumerate(reduced.energy_band_station) if s == 0]
+    assert np.allclose(reduced.energy_band_price[ST1], [30, 50])
+    assert np.allclose(reduced.energy_band_quantity[ST1], [60, 50])
+    assert pre.energy_map[book.energy_band_quantity == 0] == [-1]
+
+    # The empty spinning band is dropped, the IL bands at 100 merge
+    assert len(reduced.reserve_band_names) == 3
+    assert np.allclose(reduced.reserve_band_quantity, [30, 50, 100])
+    assert list(reduced.provider_band_ptr) == [0, 1, 3]
+
+    # Band rows are removed, along with the proportion row of the empty band
+    assert pre.report['rows_removed'] == 6 + 5 + 1
+    assert pre.report['columns_removed'] == 2 + 2
+    assert book.energy_band_names is not reduced.energy_band_names
+
+    # Dispatch of merged bands is split pro rata
+    dispatch = np.zeros(len(reduced.energy_band_names))
+    dispatch[ST1[0]] = 30
+    expanded = pre.expand_energy(dispatch)
+    assert np.allclose(expanded[:4], [20, 0, 10, 0])
+
+
+def test_presolve_model():
+
+    SO = create_system()
+    full = MatrixBuilder(SO).build()
+    reduced = MatrixBuilder(SO, presolve=True).build()
+    report = reduced.presolve.report
+
+    assert full.shape[0] - reduced.shape[0] == report['rows_removed']
+    assert full.shape[1] - reduced.shape[1] == report['columns_removed']
+    assert not any(n.endswith('_Band_Energy') for n in reduced.row_names)
+    bands = reduced.col_slices['Energy_Band']
+    assert np.allclose(reduced.col_upper[bands],
+                       reduced.presolve.reduced.energy_band_quantity)
+
+
+def test_presolve_solve():
+    if backends.highspy is None:
+        raise SkipTest("highspy is not installed")
+
+    SO = create_system()
+    sink = SO.tracer.add_sink(MemorySink())
+    Full = LPSolver(SO, backend='highs', push=False)
+    Full.full_setup_and_solve()
+    Pre = LPSolver(SO, backend='highs', presolve=True, push=False)
+    Pre.full_setup_and_solve()
+
+    assert abs(Full.objective - Pre.objective) < 1e-6
+    for field in ('prices', 'reserve_prices', 'risk', 'energy_dispatch',
+                  'reserve_dispatch', 'flows'):
+        assert np.allclose(getattr(Full.result, field),
+                           getattr(Pre.result, field))
+
+    # Band dispatch maps back to the original bands
+    energy, reserve = Pre.band_dispatch()
+    assert energy.shape == Full.band_dispatch()[0].shape
+    book = SO.offer_book
+    assert np.allclose(np.bincount(book.energy_band_station, weights=energy),
+                       Pre.result.energy_dispatch)
+    assert (energy <= book.energy_band_quantity + 1e-9).all()
+    assert (reserve <= book.reserve_band_quantity + 1e-9).all()
+
+    span = sink.find('presolve')[0]
+    assert span.path == 'setup_lp/presolve'
+    assert span.counters['rows_removed'] == 12
+
+    # Changed offers update the bounds of the reduced model in place
+    model = Pre.model
+    SO.stations[1].add_multiple_energy_offers(bands=['1', '2'],
+                                              prices=[20, 60],
+                                              offers=[10, 100])
+    SO.recompile_changes()
+    Full.full_setup_and_solve()
+    Pre.full_setup_and_solve()
+    assert Pre.model is model and Pre.solution.warm
+    assert abs(Full.objective - Pre.objective) < 1e-6
+    assert np.allclose(Full.result.energy_dispatch,
+                       Pre.result.energy_dispatch)
+
+
+def test_presolve_synthetic():
+    if backends.highspy is None:
+        raise SkipTest("highspy is not installed")
+
+    SO = create_grid(nodes=20, stations=30, bands=3, seed=3)
+    # Offer a band at the price of each station's first band, and an empty
+    # band
+    for ST in SO.stations:
+        price = ST.energy.prices[0]
+        ST.add_multiple_energy_offers(bands=['4', '5'], prices=[price, 200],
+                                      offers=[5, 0])
+    SO.create_offers()
+
+    Full = LPSolver(SO, backend='highs', push=False)
+    Full.full_setup_and_solve()
+    Pre = LPSolver(SO, backend='highs', presolve=True, push=False)
+    Pre.full_setup_and_solve()
+
+    report = Pre.model.presolve.report
+    assert report['energy_bands_kept'] == 3 * 30
+    assert Full.model.shape[0] - Pre.model.shape[0] == report['rows_removed']
+    assert abs(Full.objective - Pre.objective) < 1e-6
+    assert np.allclose(Full.result.prices, Pre.result.prices)
+
+
+if __name__ == '__main__':
+    pass
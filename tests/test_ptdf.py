@@ -0,0 +1,131 @@
+""" Test the PTDF network formulation """
+
+from nose.tools import *
+from nose.plugins.skip import SkipTest
+
+import os
+import sys
+sys.path.append(os.path.expanduser('~/python/pyspd/pyspd/'))
+
+import numpy as np
+import scipy.sparse as sp
+
+from api import *
+from matrix import MatrixBuilder
+import backends
+import ptdf
+from synthetic import create_grid
+
+
+def create_system(capacity=100, reactance=1.0):
+    SO = ISO("System Operator")
+    RZ = ReserveZone("RZ", SO)
+    ND1 = Node("ND1", SO, RZ, demand=0)
+    ND2 = Node("ND2", SO, RZ, demand=0)
+    ND3 = Node("ND3", SO, RZ, demand=150)
+    Branch(ND1, ND2, SO, capacity=capacity, reactance=reactance)
+    Branch(ND2, ND3, SO, capacity=capacity)
+    Branch(ND1, ND3, SO, capacity=capacity)
+    CO = Company("CO")
+
+    ST1 = Station("ST1", ND1, SO, CO, capacity=200, risk=False)
+    ST2 = Station("ST2", ND2, SO, CO, capacity=200, risk=False)
+    ST1.add_energy_offer(band='1', price=10, offer=200)
+    ST2.add_energy_offer(band='1', price=50, offer=200)
+    SO.create_offers()
+    return SO
+
+
+def test_ptdf_matrix():
+
+    SO = create_system()
+    matrix = ptdf.ptdf_matrix(SO.offer_book)
+
+    # An injection at ND2 withdrawn at ND1 splits 2/3 on the direct branch
+    assert list(matrix.slack) == [0]
+    assert np.allclose(matrix.matrix[:, 1], [-2. / 3, 1. / 3, -1. / 3])
+    assert np.allclose(matrix.matrix[:, 0], 0.)
+    assert ptdf.ptdf_matrix(SO.offer_book) is matrix
+
+    SO.branches[0].set_reactance(2.)
+    SO.recompile_changes()
+    assert ptdf.ptdf_matrix(SO.offer_book) is not matrix
+
+
+def reference(SO):
+    """ The transport model with the flows fixed by the PTDF """
+    model = MatrixBuilder(SO).build()
+    matrix = ptdf.ptdf_matrix(SO.offer_book).matrix
+    nb = matrix.shape[0]
+    A = np.zeros((nb, model.shape[1]))
+    A[:, model.col_slices['Transmission_Total']] = np.eye(nb)
+    A[:, model.col_slices['Nodal_Inject']] = -matrix
+    model.add_rows(sp.csr_matrix(A), np.zeros(nb), np.zeros(nb),
+                   ['Flow_%d' % t for t in range(nb)], np.zeros(nb),
+                   np.zeros(nb, dtype=int))
+    solution = backends.HighsBackend().solve(model)
+    solution.prices = -solution.duals[model.price_rows['energy']]
+    solution.reserve_prices = solution.duals[model.price_rows['reserve']]
+    solution.flows = solution.x[model.col_slices['Transmission_Total']]
+    return solution
+
+
+def test_ptdf_solve():
+    if backends.highspy is None:
+        raise SkipTest("highspy is not installed")
+
+    # Uncongested, ST1 supplies everything over both paths
+    SO = create_system()
+    Solver = LPSolver(SO, backend='highs', network='ptdf', push=False)
+    Solver.full_setup_and_solve()
+    assert Solver.lazy_iterations == 1
+    assert np.allclose(Solver.result.flows, [50, 50, 100])
+    assert np.allclose(Solver.result.prices, 10)
+    assert not Solver.result.family_mask('transmission_limit').any()
+
+    # ND1_ND3 is congested, its limit is added and the prices separate
+    SO = create_system(capacity=90)
+    Solver = LPSolver(SO, backend='highs', network='ptdf', push=False)
+    Solver.full_setup_and_solve()
+    solution = reference(SO)
+    assert Solver.lazy_iterations == 2
+    assert abs(Solver.objective - solution.objective) < 1e-6
+    assert np.allclose(Solver.result.prices, solution.prices)
+    assert np.allclose(Solver.result.flows, solution.flows)
+    assert np.allclose(Solver.result.prices, [10, 50, 90])
+
+    # The limits added are kept for the next period
+    model = Solver.model
+    SO.nodes[2].set_demand(140)
+    SO.recompile_changes()
+    Solver.full_setup_and_solve()
+    assert Solver.model is model and Solver.lazy_iterations == 1
+    assert np.allclose(Solver.result.prices, reference(SO).prices)
+
+
+def test_ptdf_synthetic():
+    if backends.highspy is None:
+        raise SkipTest("highspy is not installed")
+
+    # Seeds whose congestion leaves the DC dispatch feasible
+    for seed in (1, 3, 5, 6):
+        SO = create_grid(nodes=12, branch_density=0.2, stations=16,
+                         seed=seed)
+        for k, branch in enumerate(SO.branches):
+            branch.set_capacity(50)
+            branch.set_reactance(1 + k % 3)
+        SO.create_offers()
+
+        Solver = LPSolver(SO, backend='highs', network='ptdf', push=False)
+        Solver.full_setup_and_solve()
+        solution = reference(SO)
+        assert abs(Solver.objective - solution.objective) < 1e-6
+        # Reserve prices may sit at a kink of the objective, where either
+        # side is a valid dual
+        for field in ('prices', 'flows'):
+            assert np.allclose(getattr(Solver.result, field),
+                               getattr(solution, field))
+
+
+if __name__ == '__main__':
+    pass
@@ -0,0 +1,125 @@
+""" Test the DispatchResult arrays and export """
+
+from nose.tools import *
+from nose.plugins.skip import SkipTest
+
+import os
+import sys
+sys.path.append(os.path.expanduser('~/python/pyspd/pyspd/'))
+
+import shutil
+import tempfile
+
+import numpy as np
+
+from api import *
+import backends
+import result
+
+
+def create_system():
+    SO = ISO("System Operator")
+    RZ = ReserveZone("RZ", SO)
+    ND1 = Node("ND1", SO, RZ, demand=80)
+    ND2 = Node("ND2", SO, RZ, demand=20)
+    Branch(ND1, ND2, SO, capacity=50)
+    CO = Company("CO")
+
+    ST1 = Station("ST1", ND1, SO, CO, capacity=100, risk=False)
+    ST2 = Station("ST2", ND2, SO, CO, capacity=100, risk=False)
+    ST1.add_energy_offer(band='1', price=30, offer=100)
+    ST2.add_energy_offer(band='1', price=10, offer=100)
+    SO.create_offers()
+    return SO
+
+
+def solve(push):
+    if backends.highspy is None:
+        raise SkipTest("highspy is not installed")
+    SO = create_system()
+    Solver = LPSolver(SO, backend='highs', push=push)
+    Solver.full_setup_and_solve()
+    return SO, Solver
+
+
+def test_result_arrays():
+
+    SO, Solver = solve(push=False)
+    res = Solver.result
+
+    assert res.node_names == ['ND1', 'ND2']
+    assert np.allclose(res.prices, [30, 10])
+    assert np.allclose(res.energy_dispatch, [30, 70])
+    assert np.allclose(res.flows, [-50])
+    assert len(res.duals) == len(res.row_names) == Solver.model.shape[0]
+    assert res.status == 1
+
+    # Nothing is pushed to the participants until asked
+    assert SO.nodes[0].price == 0
+    Solver.push_dispatch()
+    assert abs(SO.nodes[0].price - 30) < 1e-6
+    assert abs(SO.stations[1].energy_dispatch - 70) < 1e-6
+
+
+def test_result_pulp_build():
+
+    SO = create_system()
+    Solver = LPSolver(SO, build='pulp')
+    try:
+        Solver.full_setup_and_solve()
+    except Exception:
+        raise SkipTest("CBC is not available")
+
+    res = Solver.result
+    assert np.allclose(res.prices, [n.price for n in SO.nodes])
+    assert np.allclose(res.flows, [b.flow for b in SO.branches])
+    assert len(res.duals) == len(Solver.lp.constraints)
+
+
+def test_result_duals():
+
+    SO, Solver = solve(push=False)
+    res = Solver.result
+
+    # Every row is indexed, named rows by the element in their name
+    assert len(res.row_family) == len(res.duals)
+    prices = res.family_mask('energy_price')
+    assert [e for f, e, d in res.elements(prices)] == ['ND1', 'ND2']
+    assert np.allclose(-res.duals[prices], res.prices)
+
+    # The branch is congested
+    congested = res.family_mask('transmission_limit') & res.binding()
+    assert [e for f, e, d in res.elements(congested)] == ['ND1_ND2']
+    assert abs(abs(res.family_duals('transmission_limit')[0]) - 20) < 1e-6
+    assert res.family_duals('energy_total').shape == (2,)
+
+    # Masks of the solver exclude the price rows
+    assert Solver.non_zero_duals.dtype == bool
+    assert not (Solver.non_zero_duals & prices).any()
+    assert Solver.non_zero_duals[congested].all()
+
+
+def test_result_export():
+    if result.pa is None:
+        raise SkipTest("pyarrow is not installed")
+
+    SO, Solver = solve(push=False)
+    tables = Solver.result.to_arrow(period=7)
+    nodes = tables['nodes']
+    assert nodes.column_names == ['trading_period', 'name', 'prices']
+    assert nodes.column('name').to_pylist() == ['ND1', 'ND2']
+    assert nodes.column('trading_period').to_pylist() == [7, 7]
+    assert np.allclose(tables['stations'].column('energy_dispatch')
+                       .to_numpy(), [30, 70])
+
+    directory = tempfile.mkdtemp()
+    try:
+        paths = Solver.result.to_parquet(directory)
+        flows = result.pq.read_table(paths['branches'])
+        assert np.allclose(flows.column('flows').to_numpy(), [-50])
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    pass
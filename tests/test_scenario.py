@@ -0,0 +1,136 @@
+""" Test the ScenarioSweep class """
+
+from nose.tools import *
+from nose.plugins.skip import SkipTest
+
+import os
+import sys
+sys.path.append(os.path.expanduser('~/python/pyspd/pyspd/'))
+
+import numpy as np
+
+from api import *
+import backends
+
+
+def create_system():
+    SO = ISO("System Operator")
+    RZ = ReserveZone("RZ", SO)
+    ND1 = Node("ND1", SO, RZ, demand=50)
+    ND2 = Node("ND2", SO, RZ, demand=50)
+    Branch(ND1, ND2, SO, capacity=40)
+    CO = Company("CO")
+
+    ST1 = Station("ST1", ND1, SO, CO, capacity=200, risk=False)
+    ST2 = Station("ST2", ND2, SO, CO, capacity=200, risk=False)
+    ST1.add_energy_offer(band='1', price=10, offer=200)
+    ST2.add_energy_offer(band='1', price=20, offer=200)
+    return SO
+
+
+def check_sweep(processes):
+    if backends.highspy is None:
+        raise SkipTest("highspy is not installed")
+    demand = np.array([[50, 30], [50, 100], [50, 100], [10, 10]])
+    multipliers = np.array([[1, 1], [1, 1], [1, 0.25], [2, 1]])
+
+    sweep = ScenarioSweep(create_system(), processes=processes)
+    result = sweep.run(demand=demand, price_multipliers=multipliers)
+
+    assert len(result) == 4
+    assert result.prices.shape == (4, 2)
+    assert result.station_names == ['ST1', 'ST2']
+    assert (result.status == 1).all()
+
+    # Each scenario matches a dispatch of the ISO with the same inputs
+    for k in range(4):
+        SO = create_system()
+        for node, value in zip(SO.nodes, demand[k]):
+            node.set_demand(value)
+        for station, scale in zip(SO.stations, multipliers[k]):
+            price = station.band_prices[station.band_names[0]] * scale
+            station.clear_energy_offers()
+            station.add_energy_offer(band='1', price=price, offer=200)
+        SO.create_offers()
+        Solver = LPSolver(SO, backend='highs')
+        Solver.full_setup_and_solve()
+
+        assert abs(result.objective[k] - Solver.objective) < 1e-6
+        assert np.allclose(result.prices[k], [n.price for n in SO.nodes])
+        assert np.allclose(result.flows[k], [b.flow for b in SO.branches])
+
+
+def test_sweep_serial():
+    check_sweep(1)
+
+
+def test_sweep_parallel():
+    check_sweep(2)
+
+
+def test_sweep_base():
+    if backends.highspy is None:
+        raise SkipTest("highspy is not installed")
+    sweep = ScenarioSweep(create_system(), processes=1)
+    result = sweep.run(price_multipliers=np.array([1., 3.]))
+
+    # Congested at the base demand, scaling all offer prices scales the
+    # nodal prices and leaves the dispatch unchanged
+    assert np.allclose(result.prices, [[10, 20], [30, 60]])
+    assert np.allclose(result.energy_dispatch[:, 0], 90)
+
+
+def test_sweep_persistent():
+    if backends.highspy is None:
+        raise SkipTest("highspy is not installed")
+    demand = np.array([[50, 100], [10, 10]])
+    multipliers = np.array([1., 3.])
+    expected = ScenarioSweep(create_system(), processes=1).run(demand=demand)
+    base = ScenarioSweep(create_system(), processes=1).run(
+        price_multipliers=multipliers)
+
+    for processes in (1, 2):
+        sweep = ScenarioSweep(create_system(), processes=processes)
+        sweep.start()
+        pool = sweep.pool
+        try:
+            first = sweep.run(demand=demand)
+            # The workers return to the base demand when it is omitted
+            second = sweep.run(price_multipliers=multipliers)
+            assert sweep.pool is pool
+        finally:
+            sweep.close()
+        assert sweep.pool is None
+        assert np.allclose(first.prices, expected.prices)
+        assert np.allclose(second.prices, base.prices)
+        assert np.allclose(second.objective, base.objective)
+
+
+def check_infeasible(backend):
+    # The second scenario exceeds the capacity of the stations
+    demand = np.array([[50, 30], [300, 300], [10, 10]])
+    result = ScenarioSweep(create_system(), processes=1,
+                           backend=backend).run(demand=demand)
+    assert result.status[0] == 1 and result.status[2] == 1
+    assert result.status[1] != 1
+    assert np.isnan(result.prices[1]).all()
+    assert np.isnan(result.energy_dispatch[1]).all()
+    assert np.isnan(result.objective[1])
+    assert np.allclose(result.energy_dispatch[2], [20, 0])
+
+
+def test_sweep_infeasible_highs():
+    if backends.highspy is None:
+        raise SkipTest("highspy is not installed")
+    check_infeasible('highs')
+
+
+def test_sweep_infeasible_scipy():
+    import scipy
+    version = tuple(int(v) for v in scipy.__version__.split('.')[:2])
+    if backends.linprog is None or version < (1, 6):
+        raise SkipTest("scipy with the HiGHS methods is not installed")
+    check_infeasible('scipy')
+
+if __name__ == '__main__':
+    pass
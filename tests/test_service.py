@@ -0,0 +1,204 @@
+""" Test the local dispatch service """
+
+from nose.tools import *
+from nose.plugins.skip import SkipTest
+
+import os
+import shutil
+import sys
+import tempfile
+sys.path.append(os.path.expanduser('~/python/pyspd/pyspd/'))
+
+import json
+
+from api import *
+import backends
+
+
+def create_payload(demand=100):
+    return {'period': 7,
+            'reserve_zones': ['RZ'],
+            'nodes': [{'name': 'ND1', 'zone': 'RZ', 'demand': demand},
+                      {'name': 'ND2', 'zone': 'RZ', 'demand': 50}],
+            'branches': [{'from': 'ND1', 'to': 'ND2', 'capacity': 30}],
+            'stations': [{'name': 'ST1', 'node': 'ND1', 'capacity': 200},
+                         {'name': 'ST2', 'node': 'ND2', 'capacity': 100}],
+            'interruptible_loads': [{'name': 'IL', 'node': 'ND2'}],
+            'energy_offers': {'ST1': {'bands': ['1'], 'prices': [20],
+                                      'offers': [200]},
+                              'ST2': [{'band': '1', 'price': 40,
+                                       'offer': 100}]},
+            'il_offers': {'IL': {'bands': ['1'], 'prices': [100],
+                                 'offers': [100]}}}
+
+
+def requirements():
+    if sys.version_info[0] < 3:
+        raise SkipTest("The service requires Python 3")
+    if backends.highspy is None:
+        raise SkipTest("highspy is not installed")
+    import asyncio
+    import service
+    return asyncio, service
+
+
+def wait_queued(asyncio, loop, Service):
+    """ Run the loop until a request is queued for a worker """
+    while not Service.stats['queued']:
+        loop.run_until_complete(asyncio.sleep(0.001))
+
+
+def test_dispatch_service():
+    asyncio, service = requirements()
+
+    SO = service.build_iso(create_payload())
+    Solver = LPSolver(SO, backend='highs', push=False)
+    Solver.full_setup_and_solve()
+
+    loop = asyncio.new_event_loop()
+    run = loop.run_until_complete
+    Service = service.DispatchService(port=0, workers=1, queue_size=0,
+                                      backend='highs')
+    run(Service.start())
+    address = Service.address
+    try:
+        status, headers, body = run(service.fetch(address, 'POST',
+                                                  '/dispatch',
+                                                  create_payload()))
+        assert status == 200
+        values = json.loads(body.decode())
+        assert values['period'] == 7
+        assert abs(values['objective'] - Solver.objective) < 1e-6
+        assert values['prices'] == {'ND1': Solver.result.prices[0],
+                                    'ND2': Solver.result.prices[1]}
+        assert values['energy_dispatch']['ST1'] == \
+            Solver.result.energy_dispatch[0]
+        assert set(values['timing']) == set(['queued', 'setup', 'solve',
+                                             'dispatch', 'total'])
+        assert float(headers['X-Dispatch-Time']) > 0
+
+        # With the one worker busy and no queue a second request is refused
+        run(Service._slots.acquire())
+        first = loop.create_task(service.fetch(address, 'POST', '/dispatch',
+                                               create_payload(110)))
+        wait_queued(asyncio, loop, Service)
+        status, headers, body = run(service.fetch(address, 'POST',
+                                                  '/dispatch',
+                                                  create_payload(120)))
+        assert status == 503 and headers['Retry-After'] == '1'
+        Service._slots.release()
+        status, headers, body = run(first)
+        assert status == 200
+        assert json.loads(body.decode())['timing']['queued'] > 0
+
+        status, headers, body = run(service.fetch(address, 'POST',
+                                                  '/dispatch',
+                                                  {'nodes': [{}]}))
+        assert status == 400
+        status, headers, body = run(service.fetch(address, 'GET',
+                                                  '/status'))
+        assert json.loads(body.decode()) == {
+            'queued': 0, 'running': 0, 'completed': 2, 'rejected': 1,
+            'failed': 1}
+    finally:
+        run(Service.close())
+        loop.close()
+    assert Service.server is None
+
+
+def test_timeout_back_pressure():
+    asyncio, service = requirements()
+    import concurrent.futures
+    import threading
+
+    loop = asyncio.new_event_loop()
+    run = loop.run_until_complete
+    Service = service.DispatchService(port=0, workers=1, queue_size=1,
+                                      backend='highs', timeout=0.05)
+    run(Service.start())
+    address = Service.address
+    # A worker thread whose solves wait until released
+    Service.pool.shutdown()
+    Service.pool = concurrent.futures.ThreadPoolExecutor(1)
+    release = threading.Event()
+    dispatch = service.dispatch_payload
+
+    def held(payload, backend):
+        release.wait()
+        return dispatch(payload, backend)
+
+    service.dispatch_payload = held
+    post = lambda: service.fetch(address, 'POST', '/dispatch',
+                                 create_payload())
+    try:
+        status, headers, body = run(post())
+        assert status == 504
+        assert Service.stats['running'] == 1
+
+        # A request timing out while queued is dropped
+        status, headers, body = run(post())
+        assert status == 504
+        while Service._admitted > 1:
+            run(asyncio.sleep(0.001))
+        assert Service.stats['queued'] == 0
+
+        # The timed out solve still holds the only worker, so the bound of
+        # one running and one queued is reached by one more request
+        queued = loop.create_task(post())
+        wait_queued(asyncio, loop, Service)
+        status, headers, body = run(post())
+        assert status == 503
+        assert run(queued)[0] == 504
+
+        release.set()
+        while Service._admitted:
+            run(asyncio.sleep(0.001))
+        status, headers, body = run(post())
+        assert status == 200
+        assert Service.stats['failed'] == 3
+        assert Service.stats['rejected'] == 1
+    finally:
+        release.set()
+        service.dispatch_payload = dispatch
+        run(Service.close())
+        loop.close()
+
+
+def test_unix_socket_arrow():
+    asyncio, service = requirements()
+    if service.pa is None:
+        raise SkipTest("pyarrow is not installed")
+    directory = tempfile.mkdtemp()
+    path = os.path.join(directory, 'pyspd.sock')
+
+    loop = asyncio.new_event_loop()
+    run = loop.run_until_complete
+    Service = service.DispatchService(path=path, workers=1, backend='highs')
+    run(Service.start())
+    try:
+        # The request accepted before closing is still answered
+        run(Service._slots.acquire())
+        reply = loop.create_task(service.fetch(
+            path, 'POST', '/dispatch?format=arrow&table=nodes',
+            create_payload()))
+        wait_queued(asyncio, loop, Service)
+        closing = loop.create_task(Service.close())
+        run(asyncio.sleep(0.01))
+        assert not closing.done()
+        Service._slots.release()
+        status, headers, body = run(reply)
+        run(closing)
+    finally:
+        run(Service.close())
+        loop.close()
+        shutil.rmtree(directory)
+
+    assert status == 200
+    table = service.pa.ipc.open_stream(body).read_all()
+    assert table.column('name').to_pylist() == ['ND1', 'ND2']
+    assert table.column('prices').to_pylist() == [80, 80]
+    assert table.column('trading_period').to_pylist() == [7, 7]
+
+
+if __name__ == '__main__':
+    pass
@@ -0,0 +1,110 @@
+""" Test saving and loading snapshots of the compiled dispatch """
+
+from nose.tools import *
+from nose.plugins.skip import SkipTest
+
+import os
+import shutil
+import sys
+import tempfile
+sys.path.append(os.path.expanduser('~/python/pyspd/pyspd/'))
+
+import numpy as np
+
+from api import *
+from matrix import MatrixBuilder
+import backends
+import snapshot
+from synthetic import create_grid
+
+
+def create_system():
+    SO = create_grid(nodes=10, stations=15, seed=2)
+    SO.create_offers()
+    return SO
+
+
+def test_book_snapshot():
+
+    SO = create_system()
+    book = SO.offer_book
+    directory = tempfile.mkdtemp()
+    try:
+        snapshot.save_book(book, directory)
+        loaded = snapshot.load_book(directory)
+        assert loaded.fingerprint() == book.fingerprint()
+        assert loaded.station_index == book.station_index
+        assert isinstance(loaded.energy_band_price, np.memmap)
+        assert not loaded.energy_band_price.flags.writeable
+    finally:
+        shutil.rmtree(directory)
+
+    # The model of the loaded book is that of the ISO
+    directory = tempfile.mkdtemp()
+    try:
+        snapshot.save_snapshot(directory, book)
+        snap = snapshot.Snapshot(directory)
+        assert snap.model is None and snap.result is None
+        model = MatrixBuilder(SO).build()
+        other = MatrixBuilder(snap).build()
+        assert (model.A != other.A).nnz == 0
+        assert np.array_equal(model.row_upper, other.row_upper)
+        assert model.structure == other.structure
+    finally:
+        shutil.rmtree(directory)
+
+
+def test_model_snapshot():
+    if backends.highspy is None:
+        raise SkipTest("highspy is not installed")
+
+    SO = create_system()
+    Solver = LPSolver(SO, backend='highs', push=False)
+    Solver.full_setup_and_solve()
+    directory = tempfile.mkdtemp()
+    try:
+        snapshot.save_snapshot(directory, SO.offer_book, Solver.model,
+                               Solver.result)
+        snap = snapshot.Snapshot(directory)
+        model = snap.model
+        assert model.shape == Solver.model.shape
+        assert model.row_names == Solver.model.row_names
+        assert model.col_slices == Solver.model.col_slices
+        # The matrix is read straight from the mapped arrays
+        assert not model.A.data.flags.writeable
+
+        solution = backends.get_backend('highs').solve(model)
+        assert abs(solution.objective - Solver.objective) < 1e-6
+
+        result = snap.result
+        assert result.objective == Solver.result.objective
+        assert result.station_names == Solver.result.station_names
+        for field in result.fields + ('row_family', 'row_element'):
+            assert np.array_equal(getattr(result, field),
+                                  getattr(Solver.result, field))
+
+        # Copy on write mapping allows the model to be updated in place
+        snap = snapshot.Snapshot(directory, mmap_mode='c')
+        SO.nodes[0].set_demand(SO.nodes[0].demand + 5)
+        SO.recompile_changes()
+        assert MatrixBuilder(SO).update(snap.model)
+        solution = backends.get_backend('highs').solve(snap.model)
+        Solver.full_setup_and_solve()
+        assert abs(solution.objective - Solver.objective) < 1e-6
+    finally:
+        shutil.rmtree(directory)
+
+
+def test_presolve_model_not_saved():
+
+    SO = create_system()
+    model = MatrixBuilder(SO, presolve=True).build()
+    directory = tempfile.mkdtemp()
+    try:
+        assert_raises(ValueError, snapshot.save_model, model, directory)
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    pass
@@ -0,0 +1,61 @@
+""" Test the synthetic grid generator """
+
+from nose.tools import *
+
+import os
+import sys
+sys.path.append(os.path.expanduser('~/python/pyspd/pyspd/'))
+
+from api import *
+from matrix import MatrixBuilder
+from synthetic import create_grid
+
+
+def test_grid_size():
+    SO = create_grid(nodes=20, branch_density=0.1, stations=30, bands=4,
+                     reserve_zones=3)
+    SO.create_offers()
+
+    assert len(SO.nodes) == 20
+    assert len(SO.stations) == 30
+    assert len(SO.reserve_zones) == 3
+    assert len(SO.intload) == 3
+    assert len(SO.energy_bands) == 120
+    # Spanning tree plus a tenth of the remaining pairs
+    assert len(SO.branches) == 19 + 17
+
+
+def test_grid_connected():
+    SO = create_grid(nodes=30, branch_density=0., seed=3)
+    linked = set(["N0"])
+    for _ in SO.nodes:
+        for branch in SO.branches:
+            ends = set([branch.sending_node.name, branch.receiving_node.name])
+            if ends & linked:
+                linked |= ends
+    assert len(linked) == 30
+
+
+def test_grid_seed():
+    first = create_grid(seed=5)
+    second = create_grid(seed=5)
+    first.create_offers()
+    second.create_offers()
+
+    assert first.transmission_totals == second.transmission_totals
+    assert first.energy_band_prices == second.energy_band_prices
+    assert first.node_demand == second.node_demand
+
+
+def test_grid_matrix_matches_pulp():
+    SO = create_grid(nodes=8, stations=10, reserve_zones=2, seed=1)
+    SO.create_offers()
+
+    Solver = LPSolver(SO)
+    Solver.setup_lp()
+    prob = MatrixBuilder(SO).build().to_pulp()[0]
+    assert list(Solver.lp.constraints) == list(prob.constraints)
+
+
+if __name__ == '__main__':
+    pass